@@ -5,7 +5,7 @@ Admin configuration for User Profile and Brand Profile
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, BrandProfile
+from .models import UserProfile, BrandProfile, AuthToken
 
 # Admin classes
 class UserProfileInline(admin.StackedInline):
@@ -43,8 +43,22 @@ class BrandProfileAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user_profile__user')
 
+# Admin for AuthToken (read-only: keys are only shown once, when issued)
+class AuthTokenAdmin(admin.ModelAdmin):
+    """Admin configuration for AuthToken"""
+    list_display = ['user', 'created_at', 'expires_at', 'last_used_at']
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['key_hash', 'user', 'created_at', 'expires_at', 'last_used_at']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
 # Register models with admin
 admin.site.unregister(User)                          # Unregister default User admin
 admin.site.register(User, CustomUserAdmin)           # Register with custom admin
 admin.site.register(UserProfile, UserProfileAdmin)   # Register UserProfile admin
-admin.site.register(BrandProfile, BrandProfileAdmin) # Register BrandProfile admin
\ No newline at end of file
+admin.site.register(BrandProfile, BrandProfileAdmin) # Register BrandProfile admin
+admin.site.register(AuthToken, AuthTokenAdmin)      # Register AuthToken admin
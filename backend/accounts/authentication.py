@@ -0,0 +1,214 @@
+"""
+Token authentication with a per-process cache of token -> user snapshot
+
+Verifying a token joins AuthToken + User. This keeps a bounded, TTL-based map
+from the token's key hash to its expiry and the user's concrete field values
+and rebuilds a fresh User instance from it, so cached requests run no query.
+
+Revocation: every place that deletes tokens goes through
+AuthService.revoke_tokens(), which calls invalidate_tokens() with the
+deleted key hashes. They are dropped from the local map and appended to the
+shared revocation log (AUTH_TOKEN_CACHE_EPOCH_FILE); every worker stats that
+file per request and, when it grew, reads only the new lines and drops those
+tokens, so a logout doesn't flush anybody else's. invalidate_tokens() without
+hashes (mass revocation) replaces the file instead: a new inode is a new
+epoch, and every worker drops its whole map. The log is also replaced that
+way once it exceeds MAX_LOG_SIZE. Tokens deleted any other way (admin,
+shell) expire after AUTH_TOKEN_CACHE_TTL.
+
+File: authentication.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core import metrics
+
+from .models import AuthToken
+
+
+class TokenCache:
+    """Bounded LRU map key hash -> (cache deadline, value)"""
+
+    # Revocation log size (one 65-byte line per revoked token) that triggers a new epoch
+    MAX_LOG_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, max_size, ttl, epoch_file):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.epoch_file = epoch_file
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch, self._offset = self._read_epoch()
+
+    def _read_epoch(self):
+        """(identity, size) of the revocation log"""
+        try:
+            stat = os.stat(self.epoch_file)
+        except OSError:
+            return None, 0
+        return (stat.st_dev, stat.st_ino), stat.st_size
+
+    def _check_epoch(self):
+        """Drop the tokens other workers revoked since we last looked (all of them on a new epoch)"""
+        if self._read_epoch() == (self._epoch, self._offset):
+            return
+        with self._lock:
+            epoch, size = self._read_epoch()
+            if epoch != self._epoch or size < self._offset:
+                self._entries.clear()
+                self._epoch, self._offset = epoch, size
+                return
+            for key_hash in self._read_revoked(size):
+                self._entries.pop(key_hash, None)
+
+    def _read_revoked(self, size):
+        """Key hashes appended since self._offset (complete lines only); advances the offset"""
+        try:
+            with open(self.epoch_file, 'rb') as handle:
+                handle.seek(self._offset)
+                data = handle.read(size - self._offset)
+        except OSError:
+            return []
+        data = data[:data.rfind(b'\n') + 1]
+        self._offset += len(data)
+        return data.decode().split()
+
+    def get(self, key):
+        self._check_epoch()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, values):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def revoke(self, key_hashes):
+        """Drop key_hashes here and append them to the log for the other workers"""
+        with self._lock:
+            for key_hash in key_hashes:
+                self._entries.pop(key_hash, None)
+
+        directory = os.path.dirname(self.epoch_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One O_APPEND write: lines from concurrent workers don't interleave
+        fd = os.open(self.epoch_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, ''.join(f'{key_hash}\n' for key_hash in key_hashes).encode())
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.MAX_LOG_SIZE:
+            self.bump_epoch()
+
+    def bump_epoch(self):
+        """Rewrite the epoch file (atomic rename => new inode for other workers)"""
+        directory = os.path.dirname(self.epoch_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.epoch_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as handle:
+            handle.write(str(time.time_ns()))
+        os.replace(tmp_path, self.epoch_file)
+        # Our own map was cleared explicitly; don't clear it again on next read
+        epoch = self._read_epoch()
+        with self._lock:
+            self._entries.clear()
+            self._epoch, self._offset = epoch
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60),
+    epoch_file=settings.AUTH_TOKEN_CACHE_EPOCH_FILE,
+)
+
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+
+def invalidate_tokens(key_hashes=None):
+    """
+    Drop cached tokens in every worker: the given key hashes, or all of them
+    (mass revocation). Done again on commit so a worker can't re-cache a token
+    between the DELETE and the end of the transaction.
+    """
+    if key_hashes is None:
+        revoke = token_cache.bump_epoch
+    else:
+        key_hashes = list(key_hashes)
+        if not key_hashes:
+            return
+        revoke = lambda: token_cache.revoke(key_hashes)
+    revoke()
+    transaction.on_commit(revoke)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    "Authorization: Token <key>" against accounts.AuthToken. request.auth is
+    the token's key hash (what the cache and revoke_tokens() are keyed by).
+    """
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        key_hash = AuthToken.hash_key(key)
+        cached = token_cache.get(key_hash)
+        metrics.record_cache('auth_token', cached is not None)
+        now = timezone.now()
+
+        if cached is None:
+            try:
+                token = AuthToken.objects.select_related('user').get(key_hash=key_hash)
+            except AuthToken.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+
+            if token.expires_at <= now:
+                raise exceptions.AuthenticationFailed('Token has expired.')
+
+            user = token.user
+            if not user.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+            # last_used_at is written at most once per interval (and only on
+            # cache misses), never on every request
+            touch_interval = timedelta(seconds=settings.AUTH_TOKEN_TOUCH_INTERVAL)
+            if token.last_used_at is None or now - token.last_used_at >= touch_interval:
+                AuthToken.objects.filter(pk=token.pk).update(last_used_at=now)
+
+            token_cache.set(key_hash, (token.expires_at, tuple(getattr(user, name) for name in USER_FIELDS)))
+            return (user, key_hash)
+
+        expires_at, values = cached
+        if expires_at <= now:
+            raise exceptions.AuthenticationFailed('Token has expired.')
+
+        # Fresh instance per request so changes made by a view never leak
+        user = User.from_db('default', USER_FIELDS, values)
+        return (user, key_hash)
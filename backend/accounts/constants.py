@@ -23,6 +23,10 @@ MAX_PHONE_LENGTH = 20
 DEFAULT_ECO_POINTS = 0
 DEFAULT_CARBON_SAVED = 0.0
 
+# API Tokens (only the SHA-256 of the key is stored)
+TOKEN_KEY_BYTES = 20      # 40 hex chars, same length as DRF tokens
+TOKEN_HASH_LENGTH = 64    # sha256 hexdigest
+
 # Validation Messages
 VALIDATION_USERNAME_REQUIRED = "Username is required"
 VALIDATION_EMAIL_REQUIRED = "Email is required"
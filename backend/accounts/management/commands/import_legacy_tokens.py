@@ -0,0 +1,63 @@
+"""
+Carry the tokens of the removed rest_framework.authtoken app over to
+AuthToken, so the switch doesn't log every client out
+
+Removing the app from INSTALLED_APPS leaves its authtoken_token table
+behind. Each key is stored as its SHA-256 (AuthToken.hash_key) with a
+fresh AUTH_TOKEN_TTL, the old table is then dropped. One transaction;
+nothing to do once the table is gone. build.sh runs it after migrating
+(AuthToken has to exist):
+
+    python manage.py migrate && python manage.py import_legacy_tokens
+
+File: import_legacy_tokens.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import AuthToken
+
+LEGACY_TOKEN_TABLE = 'authtoken_token'
+
+
+class Command(BaseCommand):
+    help = 'Copy the old DRF tokens into AuthToken (hashed) and drop their table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many tokens would be copied')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if LEGACY_TOKEN_TABLE not in connection.introspection.table_names():
+            self.stdout.write('No legacy token table: nothing to import')
+            return
+
+        table = connection.ops.quote_name(LEGACY_TOKEN_TABLE)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'SELECT {connection.ops.quote_name("key")}, user_id FROM {table}')
+            if options['dry_run']:
+                self.stdout.write(self.style.SUCCESS(f'Would import {len(cursor.fetchall())} legacy tokens'))
+                return
+
+            expires_at = timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+            imported = 0
+            while rows := cursor.fetchmany(options['batch_size']):
+                # A key already imported (earlier, interrupted run) is skipped
+                AuthToken.objects.bulk_create(
+                    [
+                        AuthToken(key_hash=AuthToken.hash_key(key), user_id=user_id, expires_at=expires_at)
+                        for key, user_id in rows
+                    ],
+                    ignore_conflicts=True,
+                )
+                imported += len(rows)
+            cursor.execute(f'DROP TABLE {table}')
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} legacy tokens'))
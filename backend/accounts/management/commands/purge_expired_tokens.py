@@ -0,0 +1,36 @@
+"""
+Delete expired API tokens (cron). Login already prunes the user's own
+expired tokens; this catches users that never log in again.
+
+File: purge_expired_tokens.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import AuthToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired API tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        total = 0
+
+        while True:
+            ids = list(
+                AuthToken.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted, _ = AuthToken.objects.filter(pk__in=ids).delete()
+            total += deleted
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} expired tokens'))
@@ -8,8 +8,14 @@ Last Updated: 2025-11-29
 """
 
 
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 from .constants import *
 
 
@@ -30,3 +36,46 @@ class BrandProfile(models.Model):
     
     def __str__(self):
         return self.brand_name
+
+
+class AuthToken(models.Model):
+    """
+    Expiring API token. The raw key is only returned when issued; the table
+    stores its SHA-256, so verification is one lookup on the unique index.
+    """
+    key_hash = models.CharField(max_length=TOKEN_HASH_LENGTH, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='auth_tokens')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Per-user cleanup of expired tokens at login
+            models.Index(fields=['user', 'expires_at']),
+        ]
+    
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    @classmethod
+    def issue(cls, user):
+        """Create a token; the raw key is available as .key on the returned instance only"""
+        key = secrets.token_hex(TOKEN_KEY_BYTES)
+        now = timezone.now()
+        token = cls.objects.create(
+            user=user,
+            key_hash=cls.hash_key(key),
+            expires_at=now + timedelta(seconds=settings.AUTH_TOKEN_TTL),
+            last_used_at=now,
+        )
+        token.key = key
+        return token
+    
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+    
+    def __str__(self):
+        return f"Token for {self.user_id} (expires {self.expires_at:%Y-%m-%d})"
@@ -8,11 +8,12 @@ Created: 2025-12-01
 
 from django.db import transaction
 from django.contrib.auth.models import User
-from rest_framework.authtoken.models import Token
-from .models import UserProfile, BrandProfile
+from django.utils import timezone
+from .models import UserProfile, BrandProfile, AuthToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from .authentication import invalidate_tokens
 from .constants import *
 
 
@@ -52,7 +53,7 @@ class AuthService:
         )
         
         # Create auth token
-        token, _ = Token.objects.get_or_create(user=user)
+        token = AuthToken.issue(user)
         
         return {
             'user': user,
@@ -72,7 +73,10 @@ class AuthService:
         if not user.is_active:
             raise BusinessException(ERROR_ACCOUNT_DEACTIVATED)
         
-        token, _ = Token.objects.get_or_create(user=user)
+        # One token per login (per device); expired ones are pruned here so
+        # the table doesn't grow with every login
+        AuthToken.objects.filter(user=user, expires_at__lte=timezone.now()).delete()
+        token = AuthToken.issue(user)
         user_profile = UserProfile.objects.get(user=user)
         
         return {
@@ -95,10 +99,25 @@ class AuthService:
             raise BusinessException(str(e))
         
         user.set_password(new_password)
-        user.save()
-        Token.objects.filter(user=user).delete()
+        # request.user may be a cached snapshot: only write the changed column
+        user.save(update_fields=['password'])
+        self.revoke_tokens(user)
         
         return True
+    
+    def revoke_tokens(self, user, key_hash=None):
+        """
+        Delete the user's tokens (or only the one with key_hash) and drop
+        them from every worker's auth cache
+        """
+        tokens = AuthToken.objects.filter(user=user)
+        if key_hash is not None:
+            tokens = tokens.filter(key_hash=key_hash)
+            key_hashes = [key_hash]
+        else:
+            key_hashes = list(tokens.values_list('key_hash', flat=True))
+        tokens.delete()
+        invalidate_tokens(key_hashes)
 
 
 class BrandService:
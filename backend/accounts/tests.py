@@ -1,3 +1,225 @@
-from django.test import TestCase
+"""
+Description: Query budget tests for authentication, profile and brand routes
 
-# Create your tests here.
+File: tests.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from core.query_budget import query_budget
+from core.testing import PASSWORD, QueryBudgetTestCase
+
+from .authentication import TokenCache, token_cache
+from .models import AuthToken
+
+
+class AccountRouteBudgetTests(QueryBudgetTestCase):
+    app_label = 'accounts'
+    route_budgets = {
+        'login': {'post': 4},
+        'logout': {'post': 2},
+        'change-password': {'post': 6},
+        'register': {'post': 7},
+        'register-brand': {'post': 12},
+        'brand-profile': {'get': 5},
+        'update-brand-story': {'put': 8},
+        'delete-brand-profile': {'delete': 11},
+        'userprofile-list': {'get': 3},
+        'userprofile-update-profile': {'patch': 7},
+        'userprofile-add-eco-points': {'post': 5},
+        'userprofile-delete-account': {'delete': 23},
+    }
+
+    def test_routes_have_budgets(self):
+        self.assertRoutesHaveBudgets()
+
+    ##### Authentication #####
+
+    def test_login(self):
+        self.call_route('post', 'login', data={'username': 'customer', 'password': PASSWORD}, status_code=200)
+
+    def test_logout(self):
+        self.call_route('post', 'logout', user=self.customer, status_code=200)
+
+    def test_change_password(self):
+        data = {'current_password': PASSWORD, 'new_password': 'An0ther-Secret!'}
+        self.call_route('post', 'change-password', data=data, user=self.customer, status_code=200)
+
+    def test_register(self):
+        data = {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': PASSWORD, 'password_confirm': PASSWORD,
+        }
+        self.call_route('post', 'register', data=data, status_code=201)
+
+    ##### Profile #####
+
+    def test_profile(self):
+        self.call_route('get', 'userprofile-list', user=self.customer, status_code=200)
+
+    def test_update_profile(self):
+        self.call_route(
+            'patch', 'userprofile-update-profile', data={'first_name': 'Ana', 'phone': '600000000'},
+            user=self.customer, status_code=200,
+        )
+
+    def test_add_eco_points(self):
+        self.call_route(
+            'post', 'userprofile-add-eco-points', data={'points': 10, 'carbon_saved': 0.5},
+            user=self.customer, status_code=200,
+        )
+
+    def test_delete_account(self):
+        self.call_route('delete', 'userprofile-delete-account', user=self.customer, status_code=204)
+
+    ##### Brand #####
+
+    def test_register_brand(self):
+        data = {
+            'username': 'brand2', 'email': 'brand2@example.com',
+            'password': PASSWORD, 'password_confirm': PASSWORD, 'brand_name': 'Blue Brand',
+        }
+        self.call_route('post', 'register-brand', data=data, status_code=201)
+
+    def test_brand_profile(self):
+        self.call_route('get', 'brand-profile', user=self.brand_manager, status_code=200)
+
+    def test_update_brand_story(self):
+        self.call_route(
+            'put', 'update-brand-story', data={'sustainability_story': 'Refill stations'},
+            user=self.brand_manager, status_code=200,
+        )
+
+    def test_delete_brand_profile(self):
+        self.call_route('delete', 'delete-brand-profile', user=self.brand_manager, status_code=204)
+
+
+class CachedTokenAuthenticationTests(QueryBudgetTestCase):
+    app_label = 'accounts'
+
+    def setUp(self):
+        token_cache.clear()
+
+    def test_cached_token_skips_auth_query(self):
+        self.login(self.customer)
+        url = reverse('userprofile-list')
+        with query_budget(10, enforce=True) as cold:
+            self.client.get(url)
+        with query_budget(10, enforce=True) as warm:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(warm.count, cold.count - 1)
+
+    def test_logout_revokes_only_this_token(self):
+        other = AuthToken.issue(self.customer)
+        token = AuthToken.issue(self.customer)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.client.get(reverse('userprofile-list')).status_code, 200)
+
+        self.assertEqual(self.client.post(reverse('logout')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('userprofile-list')).status_code, 401)
+        self.assertTrue(AuthToken.objects.filter(pk=other.pk).exists())
+
+    def test_epoch_change_clears_other_workers(self):
+        token = AuthToken.issue(self.customer)
+        token_cache.set(token.key_hash, ('stale',))
+        # Simulate another worker revoking tokens
+        token_cache._epoch = ('other-worker',)
+        self.assertIsNone(token_cache.get(token.key_hash))
+
+    def test_revocation_reaches_other_workers_per_token(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, 'epoch')
+            this_worker = TokenCache(10, 60, log)
+            this_worker.bump_epoch()
+            other_worker = TokenCache(10, 60, log)
+            for key_hash in ('a' * 64, 'b' * 64):
+                other_worker.set(key_hash, ('user',))
+
+            this_worker.revoke(['a' * 64])
+            self.assertIsNone(other_worker.get('a' * 64))
+            self.assertEqual(other_worker.get('b' * 64), ('user',))
+
+            # A mass revocation (new epoch) drops everything
+            this_worker.bump_epoch()
+            self.assertIsNone(other_worker.get('b' * 64))
+
+    def test_logout_keeps_other_cached_tokens(self):
+        other = AuthToken.issue(self.brand_manager)
+        url = reverse('userprofile-list')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {other.key}')
+        self.client.get(url)
+
+        self.login(self.customer)
+        self.assertEqual(self.client.post(reverse('logout')).status_code, 200)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {other.key}')
+        with query_budget(10, enforce=True) as warm:
+            self.client.get(url)
+        self.assertTrue(token_cache.get(other.key_hash))
+        self.assertFalse(any('accounts_authtoken' in sql for sql in warm.queries))
+
+    def test_tokens_are_hashed_and_expire(self):
+        token = AuthToken.issue(self.customer)
+        self.assertNotIn(token.key, AuthToken.objects.values_list('key_hash', flat=True))
+
+        AuthToken.objects.filter(pk=token.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.client.get(reverse('userprofile-list')).status_code, 401)
+
+    def test_last_used_written_once_per_interval(self):
+        token = AuthToken.issue(self.customer)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.get(reverse('userprofile-list'))
+        self.assertEqual(AuthToken.objects.get(pk=token.pk).last_used_at, token.last_used_at)
+
+        stale = timezone.now() - timedelta(hours=1)
+        AuthToken.objects.filter(pk=token.pk).update(last_used_at=stale)
+        token_cache.clear()
+        self.client.get(reverse('userprofile-list'))
+        self.assertGreater(AuthToken.objects.get(pk=token.pk).last_used_at, stale)
+
+    def test_login_prunes_expired_tokens(self):
+        expired = AuthToken.issue(self.customer)
+        AuthToken.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(days=1))
+        response = self.client.post(reverse('login'), {'username': 'customer', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AuthToken.objects.filter(pk=expired.pk).exists())
+
+    def test_purge_expired_tokens(self):
+        live = AuthToken.issue(self.customer)
+        expired = AuthToken.issue(self.customer)
+        AuthToken.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(days=1))
+        call_command('purge_expired_tokens', stdout=StringIO())
+        self.assertEqual(list(AuthToken.objects.values_list('pk', flat=True)), [live.pk])
+
+    def test_legacy_tokens_keep_working(self):
+        # The table rest_framework.authtoken leaves behind once removed
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE authtoken_token (key varchar(40) PRIMARY KEY, created datetime, user_id integer)')
+            cursor.execute(
+                "INSERT INTO authtoken_token VALUES ('legacy-key', '2025-01-01 00:00:00', %s)", [self.customer.pk]
+            )
+        out = StringIO()
+        call_command('import_legacy_tokens', stdout=out)
+        self.assertIn('Imported 1 legacy tokens', out.getvalue())
+        self.assertNotIn('authtoken_token', connection.introspection.table_names())
+
+        token = AuthToken.objects.get(user=self.customer)
+        self.assertEqual(token.key_hash, AuthToken.hash_key('legacy-key'))
+        self.client.credentials(HTTP_AUTHORIZATION='Token legacy-key')
+        self.assertEqual(self.client.get(reverse('userprofile-list')).status_code, 200)
+
+        # Already done
+        call_command('import_legacy_tokens', stdout=out)
+        self.assertIn('nothing to import', out.getvalue())
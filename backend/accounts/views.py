@@ -13,8 +13,8 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from django.db import transaction
-from rest_framework.authtoken.models import Token
 
+from cart.services import CartService
 from .models import UserProfile, BrandProfile
 from .serializers import *
 from .services import AuthService, BrandService, BusinessException
@@ -39,7 +39,13 @@ class LoginUserView(APIView):
                 serializer.validated_data['password']
             )
             
-            return Response({
+            # Guest cart (only guests that added to a cart have a session at all)
+            # merged inline, so the client doesn't need a /cart/merge/ round trip
+            cart_warnings = []
+            if request.session.session_key:
+                _, cart_warnings = CartService().merge_guest_cart(request, result['user'], create=False)
+            
+            response_data = {
                 'message': SUCCESS_LOGIN,
                 'data': {
                     'user_id': result['user'].id,
@@ -50,7 +56,11 @@ class LoginUserView(APIView):
                     'eco_points': result['profile'].eco_points,
                     'total_carbon_saved': result['profile'].total_carbon_saved
                 }
-            })
+            }
+            if cart_warnings:
+                response_data['warnings'] = cart_warnings
+            
+            return Response(response_data)
             
         except BusinessException as e:
             return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
@@ -61,7 +71,8 @@ class LogoutUserView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        Token.objects.filter(user=request.user).delete()
+        # Only this device's token (request.auth is its key hash)
+        AuthService().revoke_tokens(request.user, key_hash=request.auth)
         return Response({'message': SUCCESS_LOGOUT})
 
 
@@ -151,7 +162,7 @@ class UserProfileViewSet(viewsets.ViewSet):
     @transaction.atomic
     def update_profile(self, request):
         instance = self.get_object()
-        serializer = self.get_serializer(instance, data=request.data, partial=True)
+        serializer = self.get_serializer_class()(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         
         # Simple update logic in view (no service needed)
@@ -206,7 +217,7 @@ class UserProfileViewSet(viewsets.ViewSet):
         """✅ Custom action (simple delete logic in view)"""
         user = request.user
         
-        Token.objects.filter(user=user).delete()
+        AuthService().revoke_tokens(user)
         
         try:
             user_profile = UserProfile.objects.get(user=user)
@@ -5,4 +5,9 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
 
-python manage.py migrate
\ No newline at end of file
+# Duplicates would make the unique cart constraints fail to apply
+python manage.py merge_duplicate_carts --lines
+python manage.py migrate
+# Old DRF tokens become hashed AuthTokens (then their table is dropped)
+python manage.py import_legacy_tokens
+python manage.py generate_openapi_schema
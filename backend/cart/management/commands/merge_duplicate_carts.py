@@ -0,0 +1,95 @@
+"""
+Merge duplicate carts left by concurrent get_or_create calls, so the
+unique_cart_user / unique_guest_cart_session constraints can be applied
+
+Each user (and each guest session) keeps its oldest cart; the lines of the
+others are merged into it (CartService.merge_cart_items: quantities added
+up, clamped to MAX_CART_QUANTITY) and they are deleted. One transaction per
+group. With --lines, duplicate lines of one product in the same cart (left
+by the old get_or_create in add_to_cart, before unique_cart_product) are
+merged first the same way: the oldest line keeps the summed quantity.
+build.sh runs it before migrating:
+
+    python manage.py merge_duplicate_carts --lines --dry-run
+    python manage.py merge_duplicate_carts --lines && python manage.py migrate cart
+
+File: merge_duplicate_carts.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from cart.constants import MAX_CART_QUANTITY
+from cart.models import Cart, CartItem
+from cart.services import CartService
+
+
+class Command(BaseCommand):
+    help = 'Merge duplicate carts per user and per guest session'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the duplicates')
+        parser.add_argument('--lines', action='store_true', help='Also merge duplicate lines within a cart (first)')
+
+    def handle(self, *args, **options):
+        # First deploy: migrate hasn't created the tables yet, so there's nothing to merge
+        if CartItem._meta.db_table not in connection.introspection.table_names():
+            self.stdout.write('Cart tables do not exist yet: nothing to merge')
+            return
+
+        if options['lines']:
+            self.merge_lines(options)
+
+        groups = [
+            ('user', Cart.objects.filter(user__isnull=False)),
+            ('session_key', Cart.objects.filter(user=None, session_key__isnull=False)),
+        ]
+        service = CartService()
+        merged = 0
+
+        for key, carts in groups:
+            duplicated = list(
+                carts.values(key).annotate(carts=Count('pk')).filter(carts__gt=1).values_list(key, flat=True)
+            )
+            for value in duplicated:
+                with transaction.atomic():
+                    target, *sources = carts.select_for_update().filter(**{key: value}).order_by('created_at', 'pk')
+                    if options['dry_run']:
+                        self.stdout.write(f'{key}={value}: would merge {len(sources)} cart(s) into cart {target.pk}')
+                    else:
+                        for warning in service.merge_cart_items(target, sources):
+                            self.stdout.write(f'{key}={value}: {warning}')
+                    merged += len(sources)
+
+        verb = 'Would merge' if options['dry_run'] else 'Merged'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {merged} duplicate carts'))
+
+    def merge_lines(self, options):
+        """Fold the lines of one product in the same cart into the oldest one"""
+        duplicated = list(
+            CartItem.objects.values('cart_id', 'product_id').annotate(lines=Count('pk')).filter(lines__gt=1)
+            .values_list('cart_id', 'product_id')
+        )
+        merged = 0
+        for cart_id, product_id in duplicated:
+            with transaction.atomic():
+                keep, *extra = CartItem.objects.select_for_update().filter(
+                    cart_id=cart_id, product_id=product_id
+                ).order_by('added_at', 'pk')
+                merged += len(extra)
+                if options['dry_run']:
+                    self.stdout.write(f'cart={cart_id}: would merge {len(extra)} line(s) of product {product_id}')
+                    continue
+
+                quantity = keep.quantity + sum(line.quantity for line in extra)
+                if quantity > MAX_CART_QUANTITY:
+                    self.stdout.write(f'cart={cart_id}: product {product_id} clamped to {MAX_CART_QUANTITY}')
+                    quantity = MAX_CART_QUANTITY
+                CartItem.objects.filter(pk__in=[line.pk for line in extra]).delete()
+                CartItem.objects.filter(pk=keep.pk).update(quantity=quantity)
+
+        verb = 'Would merge' if options['dry_run'] else 'Merged'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {merged} duplicate cart lines'))
@@ -5,33 +5,59 @@ from django.db.models import Sum, F, FloatField, DecimalField
 from django.db.models.functions import Coalesce
 from decimal import Decimal
 
+def _cart_totals():
+    return {
+        'total_items': Coalesce(Sum('quantity'), 0),
+        'total_price': Coalesce(
+            Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Decimal('0.00')
+        ),
+        'total_carbon_footprint': Coalesce(
+            Sum(F('quantity') * F('product__carbon_footprint'), output_field=FloatField()),
+            0.0
+        ),
+    }
+
 class Cart(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)  # Para usuarios no logueados
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        # One cart per user and per guest session (duplicates: merge_duplicate_carts).
+        # Partial constraints are enforced by PostgreSQL and SQLite only: MySQL
+        # skips them (models.W036), so CartService's lookups tolerate duplicates
+        # there (the oldest cart wins) and merge_duplicate_carts cleans them up.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"], condition=models.Q(user__isnull=False), name="unique_cart_user",
+            ),
+            models.UniqueConstraint(
+                fields=["session_key"], condition=models.Q(user__isnull=True, session_key__isnull=False),
+                name="unique_guest_cart_session",
+            ),
+        ]
+        # Plain index for guest lookups on every backend (user is a FK: indexed already)
+        indexes = [
+            models.Index(fields=["session_key"], name="cart_session_key"),
+        ]
+    
     @property
     def total_items(self):
-        return self.items.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
+        return self.items.aggregate(total=_cart_totals()['total_items'])['total']
     
     @property
     def total_price(self):
-        return self.items.aggregate(
-            total=Coalesce(
-                Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
-                Decimal('0.00')
-            )
-        )['total']
+        return self.items.aggregate(total=_cart_totals()['total_price'])['total']
     
     @property
     def total_carbon_footprint(self):
-        return self.items.aggregate(
-            total=Coalesce(
-                Sum(F('quantity') * F('product__carbon_footprint'), output_field=FloatField()),
-                0.0
-            )
-        )['total']
+        return self.items.aggregate(total=_cart_totals()['total_carbon_footprint'])['total']
+    
+    def summary(self):
+        """total_items, total_price and total_carbon_footprint in one query"""
+        return self.items.aggregate(**_cart_totals())
     
     def __str__(self):
         if self.user:
@@ -45,8 +71,12 @@ class CartItem(models.Model):
     added_at = models.DateTimeField(auto_now_add=True) # Fecha en que se añadió el ítem al carrito
     
     class Meta:
+        # One line per product: adding again increments it (CartService.add_to_cart).
+        # The constraint's index also serves lookups by cart.
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "product"], name="unique_cart_product"),
+        ]
         indexes = [
-            models.Index(fields=["cart"]),
             models.Index(fields=["product"]),
         ]
 
@@ -15,6 +15,7 @@ from .models import Cart, CartItem
 from products.models import Product
 from .constants import *
 from django.db import transaction
+from core.sparse import SparseFieldsMixin, sparse_fields
 
 
 ##### Cart Item Serializers #####
@@ -55,10 +56,7 @@ class AddToCartSerializer(serializers.Serializer):
     product_id = serializers.IntegerField(required=True)
     quantity = serializers.IntegerField(required=True, min_value=1)
     
-    def validate_product_id(self, value):
-        if not Product.objects.filter(id=value).exists():
-            raise serializers.ValidationError("Product does not exist")
-        return value
+    # product_id existence is checked by CartService.add_to_cart's upsert (no extra query)
     
     def validate_quantity(self, value):
         if value > MAX_CART_QUANTITY:
@@ -66,6 +64,11 @@ class AddToCartSerializer(serializers.Serializer):
         return value
 
 
+class BulkAddToCartSerializer(serializers.Serializer):
+    """Validation ONLY for adding many items at once (POST /cart/items/bulk/)"""
+    items = AddToCartSerializer(many=True, allow_empty=False, max_length=MAX_CART_ITEMS)
+
+
 class UpdateCartItemSerializer(serializers.Serializer):
     """Validation ONLY for updating cart item quantity"""
     quantity = serializers.IntegerField(required=True, min_value=-MAX_CART_QUANTITY, max_value=MAX_CART_QUANTITY)
@@ -78,8 +81,8 @@ class UpdateCartItemSerializer(serializers.Serializer):
 
 ##### Cart Serializers #####
 
-class CartSerializer(serializers.ModelSerializer):
-    """Formatting ONLY for cart output"""
+class CartSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Formatting ONLY for cart output (totals are one aggregate query each)"""
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.IntegerField(read_only=True)
     total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -92,6 +95,24 @@ class CartSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+def empty_cart_data(user=None, request=None):
+    """CartSerializer-shaped output for a user/guest that has no cart row yet"""
+    data = {
+        'id': None,
+        'user': user.id if user is not None and user.is_authenticated else None,
+        'total_items': 0,
+        'total_price': '0.00',
+        'total_carbon_footprint': 0.0,
+        'created_at': None,
+        'updated_at': None,
+        'items': [],
+    }
+    fields = sparse_fields(request, CartSerializer.Meta.fields)
+    if fields is not None:
+        return {name: data[name] for name in fields}
+    return data
+
+
 class CheckoutSerializer(serializers.Serializer):
     """Validation ONLY for checkout"""
     shipping_address = serializers.JSONField(required=True)
@@ -6,10 +6,14 @@ Author: [Tu Nombre]
 Created: 2025-12-01
 """
 
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.utils import timezone
 from django.contrib.auth.models import User
-from rest_framework.authtoken.models import Token
 from .models import Cart, CartItem
+from .session_cart import SessionCart
+from core.sessions import guest_id
 from products.models import Product
 from orders.models import Order, OrderItem, Payment
 import uuid
@@ -22,39 +26,204 @@ class BusinessException(Exception):
     pass
 
 
+def _upsert_cart_item_sql():
+    """
+    INSERT a line or add to the existing one (unique_cart_product), in one
+    statement. Every limit is part of the statement: no row comes back when
+    the product is missing, stock or MAX_CART_QUANTITY would be exceeded,
+    or a new line would exceed MAX_CART_ITEMS.
+    """
+    qn = connection.ops.quote_name
+    item, product = CartItem._meta, Product._meta
+    names = {
+        'item': qn(item.db_table),
+        'product': qn(product.db_table),
+        'id': qn(item.pk.column),
+        'product_pk': qn(product.pk.column),
+        'stock': qn(product.get_field('stock').column),
+        'cart_id': qn(item.get_field('cart').column),
+        'product_id': qn(item.get_field('product').column),
+        'quantity': qn(item.get_field('quantity').column),
+        'added_at': qn(item.get_field('added_at').column),
+    }
+    return '''
+        INSERT INTO {item} ({cart_id}, {product_id}, {quantity}, {added_at})
+        SELECT %(cart)s, p.{product_pk}, %(quantity)s, %(now)s
+        FROM {product} p
+        WHERE p.{product_pk} = %(product)s
+          AND p.{stock} >= %(quantity)s
+          AND (
+            (SELECT COUNT(*) FROM {item} i WHERE i.{cart_id} = %(cart)s) < %(max_items)s
+            OR EXISTS (SELECT 1 FROM {item} i WHERE i.{cart_id} = %(cart)s AND i.{product_id} = %(product)s)
+          )
+        ON CONFLICT ({cart_id}, {product_id}) DO UPDATE
+        SET {quantity} = {item}.{quantity} + excluded.{quantity}
+        WHERE {item}.{quantity} + excluded.{quantity} <= %(max_quantity)s
+          AND {item}.{quantity} + excluded.{quantity} <= (
+            SELECT p.{stock} FROM {product} p WHERE p.{product_pk} = excluded.{product_id}
+          )
+        RETURNING {id}
+    '''.format(**names)
+
+
+def _oldest_cart(**lookup):
+    """
+    Where the partial unique constraints on Cart aren't enforced (MySQL), a
+    user or guest may have several carts: they all resolve to the oldest
+    """
+    return Cart.objects.filter(**lookup).order_by('pk').first()
+
+
+def _touch_cart(cart):
+    """
+    Record activity on cart. Writes that only change a line's quantity leave
+    CartItem.added_at alone and don't save the cart, and purge_stale_carts
+    judges staleness by Cart.updated_at (and added_at): bump it explicitly.
+    """
+    cart.updated_at = timezone.now()
+    Cart.objects.filter(pk=cart.pk).update(updated_at=cart.updated_at)
+
+
+def _line_error(product, current_quantity, new_quantity, line_count):
+    """add_to_cart's rules for one line: the error message, or None if it's accepted"""
+    if product is None:
+        return "Product not found"
+    if current_quantity is None and line_count >= MAX_CART_ITEMS:
+        return f"Cannot have more than {MAX_CART_ITEMS} different items in cart"
+    if new_quantity > MAX_CART_QUANTITY:
+        return f"Cannot have more than {MAX_CART_QUANTITY} of the same product"
+    if product.stock < new_quantity:
+        return f"Not enough stock. Available: {product.stock}"
+    return None
+
+
 class CartService:
     """
     Service ONLY for complex cart operations
+    
+    Guest carts are Cart rows keyed by session_key, or, with
+    CART_GUEST_BACKEND = 'session', a SessionCart (see cart.session_cart)
+    that only becomes rows, keyed by the session's guest_id, at
+    merge/checkout. Callers don't need to care.
     """
     
+    def get_session_cart(self, request):
+        """The SessionCart of an anonymous request when guest carts live in the session, else None (no query)"""
+        if settings.CART_GUEST_BACKEND != 'session' or request.user.is_authenticated:
+            return None
+        return SessionCart(request.session)
+    
+    def _materialize(self, guest, guest_key):
+        """
+        Cart/CartItem rows for a SessionCart (merge and checkout only). A new
+        cart can't have conflicting lines: one plain bulk_create. Lines for
+        an existing cart go through add_to_cart's per-backend path.
+        """
+        guest.load_products()
+        try:
+            cart, created = Cart.objects.get_or_create(session_key=guest_key, user=None)
+        except Cart.MultipleObjectsReturned:
+            cart, created = _oldest_cart(session_key=guest_key, user=None), False
+        if created:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=quantity) for product_id, quantity in guest.lines.items()]
+            )
+        else:
+            for product_id, quantity in guest.lines.items():
+                self._add_line(cart, product_id, quantity)
+        return cart
+    
     def _get_or_create_cart(self, request):
-        """Helper method to get or create cart based on user/session"""
+        """
+        Helper method to get or create cart based on user/session.
+        Only used by operations that write to the cart: this is the only
+        place where a guest session is created.
+        """
         if request.user.is_authenticated:
             # User is logged in
-            cart, created = Cart.objects.get_or_create(user=request.user)
+            lookup = {'user': request.user}
         else:
             # Guest user with session
             if not request.session.session_key:
                 request.session.create()
             
-            session_key = request.session.session_key
-            cart, created = Cart.objects.get_or_create(
-                session_key=session_key, 
-                user=None
-            )
+            lookup = {'session_key': request.session.session_key, 'user': None}
+        try:
+            cart, created = Cart.objects.get_or_create(**lookup)
+        except Cart.MultipleObjectsReturned:
+            cart = _oldest_cart(**lookup)
         return cart
     
+    def _get_existing_cart(self, request):
+        """Read-only lookup: returns None instead of creating a cart or a session"""
+        if request.user.is_authenticated:
+            lookup = {'user': request.user}
+        else:
+            session_key = request.session.session_key
+            if not session_key:
+                return None
+            lookup = {'session_key': session_key, 'user': None}
+        
+        # get(), not first(): a point lookup on the unique (partial) index,
+        # with no ORDER BY id that could make the planner walk the pk instead
+        try:
+            return Cart.objects.get(**lookup)
+        except Cart.DoesNotExist:
+            return None
+        except Cart.MultipleObjectsReturned:
+            return _oldest_cart(**lookup)
+    
     
     def add_to_cart(self, request, product_id, quantity):
         """
         Complex operation: Add item to cart with business rules
         ASSUMES data already validated by serializer
+        
+        PostgreSQL/SQLite: one upsert statement (limits included), then the
+        line with its product. Other backends lock the product row instead.
         """
-        cart = self._get_or_create_cart(request)
-
+        guest = self.get_session_cart(request)
+        if guest is not None:
+            result = self._apply_session_lines(guest, {product_id: quantity})[0]
+            if result['status'] == 'rejected':
+                raise BusinessException(result['error'])
+            return guest.get_item(product_id)
+        
+        return self._add_line(self._get_or_create_cart(request), product_id, quantity)
+    
+    def _add_line(self, cart, product_id, quantity):
+        """Add quantity of product_id to a Cart row: upsert where supported, else locked"""
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_rows_from_bulk_insert:
+            with connection.cursor() as cursor:
+                cursor.execute(_upsert_cart_item_sql(), {
+                    'cart': cart.pk, 'product': product_id, 'quantity': quantity, 'now': timezone.now(),
+                    'max_items': MAX_CART_ITEMS, 'max_quantity': MAX_CART_QUANTITY,
+                })
+                row = cursor.fetchone()
+            if row is None:
+                self._raise_add_rejected(cart, product_id, quantity)
+            _touch_cart(cart)
+            cart_item = CartItem.objects.select_related('product').get(pk=row[0])
+            cart_item.cart = cart
+            return cart_item
+        
+        return self._add_to_cart_locked(cart, product_id, quantity)
+    
+    def _raise_add_rejected(self, cart, product_id, quantity):
+        """The upsert changed nothing: find out which rule stopped it (failure path only)"""
+        product = Product.objects.filter(id=product_id).only('stock').first()
+        current = line_count = None
+        if product is not None:
+            current = CartItem.objects.filter(cart=cart, product_id=product_id).values_list('quantity', flat=True).first()
+            line_count = cart.items.count() if current is None else 0
+        raise BusinessException(_line_error(product, current, (current or 0) + quantity, line_count))
+    
+    @transaction.atomic
+    def _add_to_cart_locked(self, cart, product_id, quantity):
+        """Same rules as the upsert, serialized on the product row"""
         # 1. Obtener el producto antes de usarlo
         try:
-            product = Product.objects.get(id=product_id)
+            product = Product.objects.select_for_update().get(id=product_id)
         except Product.DoesNotExist:
             raise BusinessException("Product not found")
 
@@ -86,19 +255,118 @@ class CartService:
         # 6. Guardar cambios
         cart_item.quantity = new_quantity
         cart_item.save()
+        _touch_cart(cart)
 
         return cart_item
     
+    def bulk_add_to_cart(self, request, lines):
+        """
+        Add many {product_id, quantity} lines at once, with add_to_cart's
+        rules applied to each. One Product query validates every line; the
+        accepted ones are written with bulk_create/bulk_update in one
+        transaction. Rejected lines don't stop the others.
+        
+        Returns (cart, results): one result per distinct product_id, in
+        request order (repeated product_ids are added up).
+        """
+        requested = {}
+        for line in lines:
+            requested[line['product_id']] = requested.get(line['product_id'], 0) + line['quantity']
+        
+        guest = self.get_session_cart(request)
+        if guest is not None:
+            return guest, self._apply_session_lines(guest, requested)
+        
+        cart = self._get_or_create_cart(request)
+        try:
+            with transaction.atomic():
+                results = self._apply_bulk_lines(cart, requested)
+        except IntegrityError:
+            # Another request created one of these lines meanwhile (unique_cart_product)
+            raise BusinessException("Cart was modified concurrently, please retry")
+        return cart, results
+    
+    def _apply_bulk_lines(self, cart, requested):
+        products = Product.objects.only('id', 'stock').in_bulk(list(requested))
+        existing = {
+            item.product_id: item
+            for item in CartItem.objects.select_for_update().filter(cart=cart, product_id__in=list(requested))
+        }
+        line_count = cart.items.count()
+        
+        results, to_create, to_update = [], [], []
+        for product_id, quantity in requested.items():
+            result = {'product_id': product_id}
+            results.append(result)
+            product = products.get(product_id)
+            item = existing.get(product_id)
+            new_quantity = (item.quantity if item else 0) + quantity
+            
+            error = _line_error(product, item.quantity if item else None, new_quantity, line_count)
+            if error:
+                result.update(status='rejected', error=error)
+                continue
+            
+            if item is None:
+                item = CartItem(cart=cart, product_id=product_id, quantity=new_quantity)
+                to_create.append(item)
+                line_count += 1
+                result['status'] = 'created'
+            else:
+                item.quantity = new_quantity
+                to_update.append(item)
+                result['status'] = 'updated'
+            result['quantity'] = new_quantity
+            result['item'] = item
+        
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create or to_update:
+            _touch_cart(cart)
+        
+        for result in results:
+            item = result.pop('item', None)
+            if item is not None:
+                result['item_id'] = item.pk
+        return results
+    
+    def _apply_session_lines(self, guest, requested):
+        """_apply_bulk_lines for a SessionCart: one Product query, no writes but the session"""
+        products = guest.load_products(requested)
+        results = []
+        for product_id, quantity in requested.items():
+            current = guest.lines.get(product_id)
+            new_quantity = (current or 0) + quantity
+            error = _line_error(products.get(product_id), current, new_quantity, len(guest.lines))
+            if error:
+                results.append({'product_id': product_id, 'status': 'rejected', 'error': error})
+                continue
+            guest.lines[product_id] = new_quantity
+            results.append({
+                'product_id': product_id, 'status': 'updated' if current else 'created',
+                'quantity': new_quantity, 'item_id': product_id,
+            })
+        guest.save()
+        return results
+    
     
     def update_cart_item(self, request, item_id, quantity_delta):
         """
         Complex operation: Update cart item quantity with business rules
         """
-        try:
-            cart = self._get_or_create_cart(request)
-            cart_item = CartItem.objects.get(id=item_id, cart=cart)
-        except CartItem.DoesNotExist:
-            raise BusinessException("Cart item not found")
+        guest = self.get_session_cart(request)
+        if guest is not None:
+            cart_item = guest.get_item(item_id)
+            if cart_item is None:
+                raise BusinessException("Cart item not found")
+        else:
+            cart = self._get_existing_cart(request)
+            try:
+                cart_item = CartItem.objects.get(id=item_id, cart=cart)
+            except CartItem.DoesNotExist:
+                raise BusinessException("Cart item not found")
         
         # calculate new quantity
         old_quantity = cart_item.quantity
@@ -117,7 +385,12 @@ class CartService:
             raise BusinessException(f"Not enough stock. Available: {cart_item.product.stock}")
             
         cart_item.quantity = new_quantity
-        cart_item.save()
+        if guest is not None:
+            guest.lines[cart_item.product_id] = new_quantity
+            guest.save()
+        else:
+            cart_item.save()
+            _touch_cart(cart)
         
         return cart_item
     
@@ -126,8 +399,16 @@ class CartService:
         """
         Complex operation: Remove item from cart
         """
+        guest = self.get_session_cart(request)
+        if guest is not None:
+            if guest.get_item(item_id) is None:
+                raise BusinessException("Cart item not found")
+            del guest.lines[int(item_id)]
+            guest.save()
+            return True
+        
+        cart = self._get_existing_cart(request)
         try:
-            cart = self._get_or_create_cart(request)
             cart_item = CartItem.objects.get(id=item_id, cart=cart)
         except CartItem.DoesNotExist:
             raise BusinessException("Cart item not found")
@@ -140,60 +421,145 @@ class CartService:
         """
         Complex operation: Clear all items from cart
         """
-        cart = self._get_or_create_cart(request)
-        cart.items.all().delete()
+        guest = self.get_session_cart(request)
+        if guest is not None:
+            guest.clear()
+            return True
+        
+        cart = self._get_existing_cart(request)
+        if cart is not None:
+            cart.items.all().delete()
         return True
     
     def get_cart(self, request):
         """
-        Get cart with all items
+        Get cart with all items (None if the user/guest has no cart yet;
+        a session guest always gets its SessionCart, possibly empty)
+        """
+        guest = self.get_session_cart(request)
+        if guest is not None:
+            return guest
+        return self._get_existing_cart(request)
+    
+    def prefetch_items(self, cart):
+        """Load items and their products in one query (for CartSerializer)"""
+        if cart is None:
+            return None
+        if isinstance(cart, SessionCart):
+            cart.load_products()
+            return cart
+        prefetch_related_objects(
+            [cart], Prefetch('items', queryset=CartItem.objects.select_related('product'))
+        )
+        return cart
+    
+    def merge_guest_cart(self, request, user, session_key=None, create=True):
+        """
+        merge_carts() for this request's guest cart, wherever CART_GUEST_BACKEND
+        keeps it: session lines are written as a guest Cart (keyed by the
+        session's guest_id, not session_key) first.
         """
-        return self._get_or_create_cart(request)
+        guest = SessionCart(request.session) if settings.CART_GUEST_BACKEND == 'session' else None
+        if guest is None or not guest.lines:
+            return self.merge_carts(user, session_key or request.session.session_key, create)
+        
+        guest_key = guest_id(request.session)
+        with transaction.atomic():
+            self._materialize(guest, guest_key)
+            cart, warnings = self.merge_carts(user, guest_key, create)
+        guest.clear()
+        return cart, warnings
     
     @transaction.atomic
-    def merge_carts(self, user, session_key):
+    def merge_carts(self, user, session_key, create=True):
         """
         Complex operation: Merge guest cart with user cart after login
+        
+        Set-based, so the query count doesn't depend on cart sizes: one query
+        for both carts, one for both carts' items, then one bulk_update, one
+        bulk_create and the guest cart delete. A user without a cart simply
+        takes over the guest cart (one UPDATE).
+        
+        Returns (user cart, warnings). Without a guest cart the user cart is
+        created if missing, unless create=False (then it may be None).
         """
-        warnings = []
-
-        try:
-            # Get guest cart (anonymous)
-            guest_cart = Cart.objects.get(session_key=session_key, user=None)
-            
-            # Get or create user cart
-            user_cart, created = Cart.objects.get_or_create(user=user)
+        carts = list(
+            Cart.objects.select_for_update()
+            .filter(Q(user=user) | Q(session_key=session_key, user=None))
+        )
+        guest_cart = next((cart for cart in carts if cart.user_id is None), None)
+        user_cart = next((cart for cart in carts if cart.user_id == user.pk), None)
+        
+        if guest_cart is None:
+            # There was no guest cart → nothing to merge
+            if user_cart is None and create:
+                user_cart = Cart.objects.create(user=user)
+            return user_cart, []
+        
+        if user_cart is None:
+            guest_cart.user = user
+            guest_cart.session_key = None
+            guest_cart.save(update_fields=['user', 'session_key', 'updated_at'])
+            return guest_cart, []
+        
+        warnings = self.merge_cart_items(user_cart, [guest_cart])
+        
+        return user_cart, warnings
+    
+    def merge_cart_items(self, target, sources):
+        """
+        Move the lines of the source carts into target (quantities added up,
+        clamped to MAX_CART_QUANTITY) and delete the sources: one query for
+        all the lines, one bulk_update, one bulk_create, then the deletes.
+        Returns the clamp warnings. Call it inside a transaction.
+        """
+        items = (
+            CartItem.objects.select_for_update(of=('self',))
+            .filter(cart__in=[target, *sources])
+            .select_related('product')
+            .only('id', 'cart_id', 'product_id', 'quantity', 'product__name')
+            .order_by('pk')
+        )
+        target_items, source_items = {}, []
+        for item in items:
+            if item.cart_id == target.pk:
+                target_items[item.product_id] = item
+            else:
+                source_items.append(item)
+        
+        warnings, to_update, to_create = [], {}, {}
+        for source_item in source_items:
+            line = target_items.get(source_item.product_id)
+            new_quantity = (line.quantity if line else 0) + source_item.quantity
             
-            # Merge items
-            for guest_item in guest_cart.items.all():
-                user_item, item_created = CartItem.objects.get_or_create(
-                    cart=user_cart,
-                    product=guest_item.product,
-                    defaults={'quantity': 0}
+            # Check limits
+            if new_quantity > MAX_CART_QUANTITY:
+                warnings.append(
+                    f"The product '{source_item.product.name}' reached the maximum amount "
+                    f"({MAX_CART_QUANTITY}). It was adjusted automatically."
                 )
-                
-                new_quantity = user_item.quantity + guest_item.quantity
-                
-                # Check limits
-                if new_quantity > MAX_CART_QUANTITY:
-                    warnings.append(
-                        f"The product '{guest_item.product.name}' reached the maximum amount "
-                        f"({MAX_CART_QUANTITY}). It was adjusted automatically."
-                    )
-                    new_quantity = MAX_CART_QUANTITY
-
-                user_item.quantity = new_quantity
-                user_item.save()
+                new_quantity = MAX_CART_QUANTITY
             
-            # Delete guest cart
-            guest_cart.delete()
-            
-            return user_cart, warnings 
-            
-        except Cart.DoesNotExist:
-            # There was no guest cart → return empty
-            cart, created = Cart.objects.get_or_create(user=user)
-            return cart, []
+            if line is None:
+                line = CartItem(cart=target, product_id=source_item.product_id, quantity=new_quantity)
+                target_items[source_item.product_id] = to_create[source_item.product_id] = line
+            else:
+                line.quantity = new_quantity
+                if line.pk is not None:
+                    to_update[line.pk] = line
+        
+        if to_update:
+            CartItem.objects.bulk_update(list(to_update.values()), ['quantity'])
+        if to_create:
+            CartItem.objects.bulk_create(list(to_create.values()))
+        if to_update or to_create:
+            _touch_cart(target)
+        
+        # Delete the merged carts (their items go with them)
+        for source in sources:
+            source.delete()
+        
+        return warnings
     
     @transaction.atomic
     def checkout(self, request, shipping_address):
@@ -201,10 +567,14 @@ class CartService:
         Complex operation: Convert cart to order with all business rules
         ASSUMES data already validated by serializer
         """
-        cart = self._get_or_create_cart(request)
+        guest = self.get_session_cart(request)
+        if guest is not None:
+            cart = self._materialize(guest, guest_id(request.session)) if guest.lines else None
+        else:
+            cart = self._get_existing_cart(request)
         
         # Validate cart is not empty
-        if cart.total_items == 0:
+        if cart is None or cart.total_items == 0:
             raise BusinessException("Cannot checkout with empty cart")
         
         # Check all products have enough stock
@@ -242,6 +612,10 @@ class CartService:
                 cart_item.product.save()
         
         # Clear the cart
-        cart.items.all().delete()
+        if guest is not None:
+            cart.delete()
+            guest.clear()
+        else:
+            cart.items.all().delete()
         
         return order
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Guest carts kept in the session instead of Cart/CartItem rows
+
+With CART_GUEST_BACKEND = 'session', CartService keeps an anonymous
+visitor's lines in request.session (with SESSION_ENGINE set to
+signed_cookies that's the cookie itself: no database write at all), and
+only writes rows when the cart is merged at login or checked out.
+
+SessionCart / SessionCartItem quack like Cart / CartItem for the
+serializers and views. A guest line's id is its product id. Rows written
+from a session cart are keyed by core.sessions.guest_id, which is set as
+soon as the cart has lines.
+
+File: session_cart.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from decimal import Decimal
+
+from core.sessions import guest_id
+from products.models import Product
+
+SESSION_CART_KEY = 'cart'
+
+
+class SessionCartItem:
+    """CartItem look-alike for one guest line"""
+
+    added_at = None
+
+    def __init__(self, cart, product, quantity):
+        self.cart = cart
+        self.product = product
+        self.id = self.pk = self.product_id = product.pk
+        self.quantity = quantity
+
+    @property
+    def total_price(self):
+        return self.product.price * self.quantity
+
+    @property
+    def total_carbon(self):
+        return self.product.carbon_footprint * self.quantity
+
+
+class SessionCart:
+    """
+    Cart look-alike over request.session[SESSION_CART_KEY] = {product id: quantity}.
+    Products are loaded once, in one query, the first time they're needed.
+    """
+
+    id = pk = None
+    user = user_id = None
+    created_at = updated_at = None
+
+    def __init__(self, session):
+        self.session = session
+        # JSON session serializer: keys are strings
+        self.lines = {int(product_id): quantity for product_id, quantity in session.get(SESSION_CART_KEY, {}).items()}
+        self._products = None
+
+    def load_products(self, extra_ids=()):
+        """{id: Product} for the lines (plus extra_ids); lines whose product is gone are dropped"""
+        ids = set(self.lines) | set(extra_ids)
+        if self._products is None or not ids <= set(self._products):
+            self._products = Product.objects.in_bulk(list(ids))
+            for product_id in [product_id for product_id in self.lines if product_id not in self._products]:
+                del self.lines[product_id]
+        return self._products
+
+    def get_item(self, item_id):
+        try:
+            product_id = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        if product_id not in self.lines:
+            return None
+        return SessionCartItem(self, self.load_products()[product_id], self.lines[product_id])
+
+    @property
+    def items(self):
+        products = self.load_products()
+        return [SessionCartItem(self, products[product_id], quantity) for product_id, quantity in self.lines.items()]
+
+    @property
+    def total_items(self):
+        return sum(self.lines.values())
+
+    @property
+    def total_price(self):
+        return sum((item.total_price for item in self.items), Decimal('0.00'))
+
+    @property
+    def total_carbon_footprint(self):
+        return float(sum(item.total_carbon for item in self.items))
+
+    def summary(self):
+        """Same keys as Cart.summary(), computed in memory"""
+        return {
+            'total_items': self.total_items,
+            'total_price': self.total_price,
+            'total_carbon_footprint': self.total_carbon_footprint,
+        }
+
+    def save(self):
+        if self.lines:
+            self.session[SESSION_CART_KEY] = {str(product_id): quantity for product_id, quantity in self.lines.items()}
+            guest_id(self.session)
+        else:
+            self.session.pop(SESSION_CART_KEY, None)
+
+    def clear(self):
+        self.lines = {}
+        self.save()
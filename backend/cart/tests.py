@@ -1,3 +1,438 @@
-from django.test import TestCase
+"""
+Description: Query budget tests for cart routes
 
-# Create your tests here.
+File: tests.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from cart.models import Cart, CartItem
+from cart.services import CartService
+from cart.session_cart import SessionCart
+from core.models import IdempotencyKey
+from core.testing import PASSWORD, EcoShopFixtures, QueryBudgetTestCase, SHIPPING_ADDRESS
+from orders.models import Order
+
+
+class CartRouteBudgetTests(QueryBudgetTestCase):
+    app_label = 'cart'
+    route_budgets = {
+        'cart-list': {'get': 6},
+        'cart-add-item': {'post': 15},
+        'cart-clear': {'delete': 3},
+        'cart-items-detail': {'get': 4, 'patch': 12, 'put': 12, 'delete': 10},
+        'cart-items-bulk': {'post': 17},
+        'cart-checkout': {'post': 27},
+        'cart-merge': {'post': 14},
+    }
+
+    def test_routes_have_budgets(self):
+        self.assertRoutesHaveBudgets()
+
+    def test_cart_list(self):
+        response = self.call_route('get', 'cart-list', user=self.customer, status_code=200)
+        self.assertEqual(len(response.data['items']), len(self.cart_items))
+
+    def test_cart_list_sparse_fields(self):
+        # Totals are aggregate queries: leaving them out skips them
+        # (token insert + token lookup + cart + items)
+        with self.assertNumQueries(4):
+            response = self.call_route('get', 'cart-list', query={'fields': 'id,items'}, user=self.customer, status_code=200)
+        self.assertEqual(list(response.data), ['id', 'items'])
+        self.assertEqual(len(response.data['items']), len(self.cart_items))
+
+        response = self.call_route('get', 'cart-list', query={'omit': 'items'}, status_code=200)
+        self.assertNotIn('items', response.data)
+        self.assertEqual(response.data['total_items'], 0)
+
+    def test_guest_cart_list(self):
+        response = self.call_route('get', 'cart-list', status_code=200)
+        self.assertEqual(response.data['items'], [])
+        # Reading an empty cart must not write a session row
+        self.assertFalse(Session.objects.exists())
+
+    def test_add_item(self):
+        self.call_route(
+            'post', 'cart-add-item', data={'product_id': self.products[5].id, 'quantity': 2},
+            user=self.customer, status_code=200,
+        )
+
+    def test_add_existing_item_increments_line(self):
+        line = self.cart_items[0]
+        response = self.call_route(
+            'post', 'cart-add-item', data={'product_id': line.product_id, 'quantity': 3},
+            user=self.customer, status_code=200,
+        )
+        self.assertEqual(response.data['data']['cart_item']['quantity'], 5)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart, product=line.product).count(), 1)
+        self.assertEqual(response.data['data']['cart_summary']['total_items'], 11)
+
+    def test_add_item_rejections_change_nothing(self):
+        self.products[6].stock = 3
+        self.products[6].save(update_fields=['stock'])
+        line = self.cart_items[0]
+        cases = [
+            ({'product_id': 999999, 'quantity': 1}, 'Product not found'),
+            ({'product_id': line.product_id, 'quantity': 99}, 'Cannot have more than 100 of the same product'),
+            ({'product_id': self.products[6].id, 'quantity': 4}, 'Not enough stock. Available: 3'),
+        ]
+        self.client.force_authenticate(self.customer)
+        for data, error in cases:
+            response = self.client.post(reverse('cart-add-item'), data, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], error)
+        self.assertEqual(CartItem.objects.get(pk=line.pk).quantity, 2)
+        self.assertEqual(self.cart.items.count(), len(self.cart_items))
+
+    def test_add_item_respects_distinct_item_limit(self):
+        self.client.force_authenticate(self.customer)
+        with mock.patch('cart.services.MAX_CART_ITEMS', len(self.cart_items)):
+            response = self.client.post(
+                reverse('cart-add-item'), {'product_id': self.products[5].id, 'quantity': 1}, format='json'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                response.data['error'], f'Cannot have more than {len(self.cart_items)} different items in cart'
+            )
+            # A product already in the cart still adds up
+            response = self.client.post(
+                reverse('cart-add-item'), {'product_id': self.cart_items[0].product_id, 'quantity': 1}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart.items.count(), len(self.cart_items))
+
+    def test_guest_add_item(self):
+        self.call_route(
+            'post', 'cart-add-item', data={'product_id': self.product.id, 'quantity': 1}, status_code=200
+        )
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_bulk_add(self):
+        existing = self.cart_items[0]
+        self.products[6].stock = 1
+        self.products[6].save(update_fields=['stock'])
+        items = [
+            {'product_id': existing.product_id, 'quantity': 3},
+            {'product_id': self.products[5].id, 'quantity': 1},
+            {'product_id': self.products[5].id, 'quantity': 2},
+            {'product_id': self.products[6].id, 'quantity': 2},
+            {'product_id': 999999, 'quantity': 1},
+        ]
+        response = self.call_route('post', 'cart-items-bulk', data={'items': items}, user=self.customer, status_code=200)
+
+        results = response.data['data']['results']
+        self.assertEqual([(r['product_id'], r['status']) for r in results], [
+            (existing.product_id, 'updated'),
+            (self.products[5].id, 'created'),
+            (self.products[6].id, 'rejected'),
+            (999999, 'rejected'),
+        ])
+        self.assertEqual(results[0]['quantity'], 5)
+        self.assertEqual(results[1]['quantity'], 3)
+        self.assertEqual(results[2]['error'], 'Not enough stock. Available: 1')
+        self.assertEqual(results[3]['error'], 'Product not found')
+        self.assertEqual(CartItem.objects.get(pk=results[1]['item_id']).quantity, 3)
+        self.assertEqual(response.data['data']['cart_summary']['total_items'], 2 * len(self.cart_items) + 3 + 3)
+
+    def test_bulk_add_guest_all_rejected(self):
+        response = self.call_route(
+            'post', 'cart-items-bulk', data={'items': [{'product_id': 999999, 'quantity': 1}]}, status_code=400
+        )
+        self.assertEqual(response.data['data']['results'][0]['status'], 'rejected')
+        self.call_route('post', 'cart-items-bulk', data={'items': []}, status_code=400)
+
+    def test_clear(self):
+        self.call_route('delete', 'cart-clear', user=self.customer, status_code=200)
+
+    def test_item_retrieve(self):
+        self.call_route(
+            'get', 'cart-items-detail', kwargs={'pk': self.cart_items[0].pk}, user=self.customer, status_code=200
+        )
+
+    def test_item_update(self):
+        for method in ('patch', 'put'):
+            self.call_route(
+                method, 'cart-items-detail', kwargs={'pk': self.cart_items[0].pk},
+                data={'quantity': 1}, user=self.customer, status_code=200,
+            )
+
+    def test_item_destroy(self):
+        self.call_route(
+            'delete', 'cart-items-detail', kwargs={'pk': self.cart_items[0].pk}, user=self.customer, status_code=200
+        )
+
+    def test_checkout(self):
+        self.call_route(
+            'post', 'cart-checkout', data={'shipping_address': SHIPPING_ADDRESS}, user=self.customer, status_code=201
+        )
+
+    def test_checkout_idempotency_key(self):
+        self.login(self.customer)
+        url = reverse('cart-checkout')
+        data = {'shipping_address': SHIPPING_ADDRESS}
+        first = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.status_code, 201)
+
+        # A retry is one indexed read (the token is cached by now) and creates nothing
+        orders = Order.objects.count()
+        with self.assertNumQueries(1):
+            retry = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), orders)
+
+        other = dict(data, shipping_address=dict(SHIPPING_ADDRESS, city='Elsewhere'))
+        self.assertEqual(self.client.post(url, other, format='json', HTTP_IDEMPOTENCY_KEY='checkout-1').status_code, 422)
+        # A new key is a new checkout (of what is now an empty cart)
+        self.assertEqual(self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='checkout-2').status_code, 400)
+
+    def test_merge(self):
+        # Guest cart first, then the same browser session logs in
+        self.client.post(reverse('cart-add-item'), {'product_id': self.products[6].id, 'quantity': 1}, format='json')
+        self.call_route('post', 'cart-merge', user=self.customer, status_code=200)
+
+    def guest_cart(self, products, quantity):
+        cart = Cart.objects.create(session_key='guest-session')
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=product, quantity=quantity) for product in products)
+        return cart
+
+    def test_merge_is_set_based(self):
+        # Overlapping lines add up (clamped), new lines are copied; same query count at any size
+        for size in (len(self.cart_items) + 1, len(self.products)):
+            with self.subTest(size=size):
+                self.cart.items.exclude(pk__in=[item.pk for item in self.cart_items]).delete()
+                self.cart.items.update(quantity=2)
+                guest = self.guest_cart(self.products[:size], 99)
+                # savepoint, carts, items, bulk_update, bulk_create, touch cart, delete items + cart, release
+                with self.assertNumQueries(9):
+                    cart, warnings = CartService().merge_carts(self.customer, 'guest-session')
+
+                self.assertEqual(cart, self.cart)
+                self.assertFalse(Cart.objects.filter(pk=guest.pk).exists())
+                self.assertEqual(len(warnings), min(size, len(self.cart_items)))
+                quantities = dict(cart.items.values_list('product_id', 'quantity'))
+                self.assertEqual(len(quantities), max(size, len(self.cart_items)))
+                self.assertEqual(quantities[self.products[0].id], 100)
+                self.assertEqual(quantities[self.products[size - 1].id], 99)
+
+    def test_merge_without_user_cart_takes_over_guest_cart(self):
+        self.cart.delete()
+        guest = self.guest_cart(self.products[:2], 1)
+        cart, warnings = CartService().merge_carts(self.customer, 'guest-session')
+        self.assertEqual((cart.pk, cart.user, cart.session_key, warnings), (guest.pk, self.customer, None, []))
+
+    def test_merge_cart_items_from_several_carts(self):
+        first = self.guest_cart(self.products[:2], 60)
+        second = Cart.objects.create(session_key='other-session')
+        CartItem.objects.bulk_create([
+            CartItem(cart=second, product=self.products[0], quantity=60),
+            CartItem(cart=second, product=self.products[6], quantity=1),
+            CartItem(cart=second, product=self.products[7], quantity=1),
+        ])
+        CartItem.objects.create(cart=first, product=self.products[6], quantity=2)
+
+        warnings = CartService().merge_cart_items(self.cart, [first, second])
+        self.assertEqual(len(warnings), 1)
+        quantities = dict(self.cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities[self.products[0].id], 100)
+        self.assertEqual(quantities[self.products[1].id], 62)
+        self.assertEqual(quantities[self.products[6].id], 3)
+        self.assertEqual(quantities[self.products[7].id], 1)
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [self.cart.pk])
+
+    def test_duplicate_guest_cart_is_rejected(self):
+        self.guest_cart([], 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(session_key='guest-session')
+        out = StringIO()
+        call_command('merge_duplicate_carts', stdout=out)
+        self.assertIn('Merged 0 duplicate carts', out.getvalue())
+
+    @skipUnless(connection.vendor == 'sqlite', 'rebuilds the table with SQLite DDL')
+    def test_duplicate_lines_are_merged_before_the_constraint(self):
+        # Rebuild cart_cartitem without unique_cart_product, as it was before the
+        # migration (SQLite DDL is transactional: rolled back with the test)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'cart_cartitem'")
+            create = cursor.fetchone()[0]
+            cursor.execute('ALTER TABLE cart_cartitem RENAME TO cart_cartitem_constrained')
+            cursor.execute(create.replace(', CONSTRAINT "unique_cart_product" UNIQUE ("cart_id", "product_id")', ''))
+            cursor.execute('INSERT INTO cart_cartitem SELECT * FROM cart_cartitem_constrained')
+        first, second = self.cart_items[:2]
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=first.product, quantity=3),
+            CartItem(cart=self.cart, product=second.product, quantity=99),
+        ])
+
+        out = StringIO()
+        call_command('merge_duplicate_carts', '--lines', stdout=out)
+        self.assertIn('Merged 2 duplicate cart lines', out.getvalue())
+        lines = dict(self.cart.items.values_list('pk', 'quantity'))
+        self.assertEqual(len(lines), len(self.cart_items))
+        self.assertEqual((lines[first.pk], lines[second.pk]), (first.quantity + 3, 100))
+
+    def test_duplicate_carts_resolve_to_the_oldest(self):
+        # What lookups see on MySQL, where the partial constraints aren't enforced
+        request = SimpleNamespace(user=self.customer)
+        with mock.patch.object(Cart.objects, 'get', side_effect=Cart.MultipleObjectsReturned):
+            self.assertEqual(CartService()._get_existing_cart(request), self.cart)
+        with mock.patch.object(Cart.objects, 'get_or_create', side_effect=Cart.MultipleObjectsReturned):
+            self.assertEqual(CartService()._get_or_create_cart(request), self.cart)
+
+    def test_purge_stale_carts(self):
+        old = timezone.now() - timedelta(days=40)
+        stale = self.guest_cart(self.products[:2], 1)
+        revived = Cart.objects.create(session_key='revived')
+        CartItem.objects.create(cart=revived, product=self.product, quantity=1)
+        fresh = Cart.objects.create(session_key='fresh')
+        Cart.objects.filter(pk__in=[stale.pk, revived.pk, self.cart.pk]).update(updated_at=old)
+        CartItem.objects.filter(cart=stale).update(added_at=old)
+
+        live = SessionStore()
+        live.create()
+        expired = SessionStore()
+        expired.set_expiry(-60)
+        expired.create()
+
+        out = StringIO()
+        call_command('purge_stale_carts', '--batch-size', '1', '--sleep', '0', stdout=out)
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {self.cart.pk, revived.pk, fresh.pk})
+        self.assertFalse(CartItem.objects.filter(cart_id=stale.pk).exists())
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), [live.session_key])
+        self.assertIn('3 rows (1 cart.Cart, 2 cart.CartItem)', out.getvalue())
+
+    def test_quantity_updates_keep_cart_fresh(self):
+        # Adding to an existing line writes no new row: the cart's updated_at must still move
+        old = timezone.now() - timedelta(days=40)
+        guest = self.guest_cart([self.products[0]], 1)
+        service = CartService()
+        for write in (
+            lambda: service._add_line(guest, self.products[0].id, 1),
+            lambda: service._add_to_cart_locked(guest, self.products[0].id, 1),
+            lambda: service._apply_bulk_lines(guest, {self.products[0].id: 1}),
+        ):
+            Cart.objects.filter(pk=guest.pk).update(updated_at=old)
+            CartItem.objects.filter(cart=guest).update(added_at=old)
+            write()
+            call_command('purge_stale_carts', '--sleep', '0', '--skip-sessions', stdout=StringIO())
+            self.assertTrue(Cart.objects.filter(pk=guest.pk).exists())
+        self.assertEqual(guest.items.get().quantity, 4)
+
+    def test_login_merges_guest_cart(self):
+        self.client.post(reverse('cart-add-item'), {'product_id': self.products[6].id, 'quantity': 1}, format='json')
+        response = self.client.post(reverse('login'), {'username': 'customer', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('warnings', response.data)
+        self.assertFalse(Cart.objects.filter(user=None).exists())
+        self.assertTrue(self.cart.items.filter(product=self.products[6], quantity=1).exists())
+
+
+@override_settings(
+    CART_GUEST_BACKEND='session', SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'
+)
+class SessionGuestCartTests(EcoShopFixtures, APITestCase):
+    """Guest carts kept in a signed cookie: no rows until merge/checkout"""
+
+    def add(self, product, quantity):
+        return self.client.post(
+            reverse('cart-add-item'), {'product_id': product.id, 'quantity': quantity}, format='json'
+        )
+
+    def assertNoGuestRows(self):
+        self.assertFalse(Cart.objects.filter(user=None).exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_browsing_guest_writes_nothing(self):
+        self.assertEqual(self.add(self.products[4], 2).status_code, 200)
+        response = self.add(self.products[4], 1)
+        self.assertEqual(response.data['data']['cart_item']['id'], self.products[4].id)
+        self.assertEqual(response.data['data']['cart_item']['quantity'], 3)
+        self.assertEqual(self.add(self.products[5], 101).status_code, 400)
+        bulk = self.client.post(reverse('cart-items-bulk'), {'items': [
+            {'product_id': self.products[5].id, 'quantity': 1},
+            {'product_id': 999999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual([r['status'] for r in bulk.data['data']['results']], ['created', 'rejected'])
+
+        item_url = reverse('cart-items-detail', kwargs={'pk': self.products[4].id})
+        self.assertEqual(self.client.patch(item_url, {'quantity': -1}, format='json').data['data']['cart_item']['quantity'], 2)
+        self.assertEqual(self.client.get(item_url).data['quantity'], 2)
+        self.assertEqual(self.client.delete(reverse('cart-items-detail', kwargs={'pk': self.products[5].id})).status_code, 200)
+
+        cart = self.client.get(reverse('cart-list')).data
+        self.assertEqual([(item['product']['id'], item['quantity']) for item in cart['items']], [(self.products[4].id, 2)])
+        self.assertEqual(cart['total_items'], 2)
+        self.assertEqual(cart['total_price'], str(self.products[4].price * 2))
+        self.assertNoGuestRows()
+
+    def test_login_merges_session_cart(self):
+        self.add(self.cart_items[0].product, 1)
+        self.add(self.products[6], 2)
+        response = self.client.post(reverse('login'), {'username': 'customer', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+        quantities = dict(self.cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities[self.cart_items[0].product_id], 3)
+        self.assertEqual(quantities[self.products[6].id], 2)
+        self.assertNoGuestRows()
+
+        # The lines left the session with the merge
+        self.client.credentials()
+        self.assertEqual(self.client.get(reverse('cart-list')).data['items'], [])
+
+    def test_rows_are_keyed_by_guest_id(self):
+        self.add(self.products[4], 1)
+        guest_key = self.client.session['guest_id']
+        self.add(self.products[5], 1)
+        self.assertEqual(self.client.session['guest_id'], guest_key)
+
+        # Not session_key: with signed cookies that's the whole (changing) cookie
+        with mock.patch.object(CartService, '_materialize', autospec=True, side_effect=CartService._materialize) as materialize:
+            self.client.post(reverse('login'), {'username': 'customer', 'password': PASSWORD}, format='json')
+        self.assertEqual(materialize.call_args.args[2], guest_key)
+        self.assertEqual(len(guest_key), 32)
+
+    def test_guest_idempotency_key_survives_session_changes(self):
+        self.add(self.products[4], 1)
+        self.client.delete(reverse('cart-items-detail', kwargs={'pk': self.products[4].id}))
+        url, data = reverse('cart-checkout'), {'shipping_address': SHIPPING_ADDRESS}
+        first = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='guest-checkout')
+        self.assertEqual(first.status_code, 400)
+
+        # The cookie (session_key) changes with the cart; the owner doesn't
+        self.add(self.products[5], 1)
+        retry = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='guest-checkout')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(IdempotencyKey.objects.get().owner, f"guest:{self.client.session['guest_id']}")
+
+    def test_materialize_into_existing_cart(self):
+        guest_cart = Cart.objects.create(session_key='guest-1')
+        CartItem.objects.create(cart=guest_cart, product=self.products[4], quantity=1)
+        guest = SessionCart({'cart': {str(self.products[4].id): 2, str(self.products[5].id): 1}})
+
+        # Existing lines are added to with add_to_cart's rules, not overwritten
+        self.assertEqual(CartService()._materialize(guest, 'guest-1'), guest_cart)
+        self.assertEqual(
+            dict(guest_cart.items.values_list('product_id', 'quantity')),
+            {self.products[4].id: 3, self.products[5].id: 1},
+        )
+
+    def test_empty_guest_checkout(self):
+        response = self.client.post(reverse('cart-checkout'), {'shipping_address': SHIPPING_ADDRESS}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Cannot checkout with empty cart')
+        self.assertNoGuestRows()
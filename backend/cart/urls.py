@@ -23,6 +23,7 @@ urlpatterns = [
     # Custom endpoints for ViewSet actions
     # Note: These are already included by the router, but we list them here for clarity
     # POST   /api/cart/add_item/
+    # POST   /api/cart/items/bulk/
     # PUT    /api/cart/update_item/
     # DELETE /api/cart/remove_item/
     # DELETE /api/cart/clear/
@@ -13,10 +13,15 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from django.db import transaction
+from django.http import Http404
 
+from core import metrics
+from core.idempotency import idempotency_key_parameter, idempotent
+from core.query_budget import query_budget
 from .models import Cart, CartItem
 from .serializers import *
 from .services import CartService, BusinessException
+from .session_cart import SessionCart
 from .constants import *
 
 
@@ -35,11 +40,18 @@ class CartViewSet(viewsets.ViewSet):
     def _get_cart_service(self):
         return CartService()
 
+    @query_budget(8)
     def list(self, request):
         """✅ Get current cart with all items"""
         cart_service = self._get_cart_service()
         cart = cart_service.get_cart(request)
-        serializer = CartSerializer(cart)
+        if cart is None:
+            # Nothing added yet: don't create a cart (or a guest session) just to read it
+            return Response(empty_cart_data(request.user, request))
+        # ?fields= / ?omit= prune the serializer; skipped fields cost no query
+        serializer = CartSerializer(cart, context={'request': request})
+        if 'items' in serializer.fields:
+            cart_service.prefetch_items(cart)
         return Response(serializer.data)
     
     @swagger_auto_schema(request_body=AddToCartSerializer)
@@ -57,16 +69,11 @@ class CartViewSet(viewsets.ViewSet):
                 serializer.validated_data['quantity']
             )
             
-            cart = cart_item.cart
             return Response({
                 'message': 'Item added to cart successfully',
                 'data': {
                     'cart_item': CartItemSerializer(cart_item).data,
-                    'cart_summary': {
-                        'total_items': cart.total_items,
-                        'total_price': cart.total_price,
-                        'total_carbon_footprint': cart.total_carbon_footprint
-                    }
+                    'cart_summary': cart_item.cart.summary()
                 }
             })
             
@@ -101,16 +108,51 @@ class CartItemViewSet(viewsets.GenericViewSet,
     permission_classes = [AllowAny]
 
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return CartItem.objects.none()
         service = CartService()
         cart = service.get_cart(self.request)
+        if not isinstance(cart, Cart):
+            # No cart yet, or a SessionCart (no rows: see retrieve)
+            return CartItem.objects.none()
         return CartItem.objects.filter(cart=cart)
     
+    def retrieve(self, request, *args, **kwargs):
+        guest = CartService().get_session_cart(request)
+        if guest is None:
+            return super().retrieve(request, *args, **kwargs)
+        cart_item = guest.get_item(kwargs["pk"])
+        if cart_item is None:
+            raise Http404
+        return Response(CartItemSerializer(cart_item).data)
+    
     def get_serializer_class(self):
         # Swagger & DRF correctly handle request bodies depending on action
         if self.action in ["update", "partial_update"]:
             return UpdateCartItemSerializer
+        if self.action == "bulk":
+            return BulkAddToCartSerializer
         return CartItemSerializer
     
+    @swagger_auto_schema(request_body=BulkAddToCartSerializer)
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """✅ Add many items in one request (cart restore, reorder); per-line results"""
+        serializer = BulkAddToCartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            service = CartService()
+            cart, results = service.bulk_add_to_cart(request, serializer.validated_data["items"])
+        except BusinessException as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {"results": results, "cart_summary": cart.summary()}
+        if all(result["status"] == "rejected" for result in results):
+            return Response({"error": "No items could be added to the cart", "data": data},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Items added to cart successfully", "data": data})
+    
     @transaction.atomic
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop("partial", False)
@@ -166,7 +208,8 @@ class CheckoutView(APIView):
     """✅ APIView for complex checkout logic"""
     permission_classes = [AllowAny]
     
-    @swagger_auto_schema(request_body=CheckoutSerializer)
+    @swagger_auto_schema(request_body=CheckoutSerializer, manual_parameters=[idempotency_key_parameter()])
+    @idempotent('checkout')
     def post(self, request):
         serializer = CheckoutSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -177,6 +220,8 @@ class CheckoutView(APIView):
                 request,
                 serializer.validated_data['shipping_address']
             )
+            metrics.inc('checkout_total', result='success')
+            metrics.inc('checkout_amount_total', float(order.total_amount))
             
             return Response({
                 'message': 'Order created successfully',
@@ -190,6 +235,7 @@ class CheckoutView(APIView):
             }, status=status.HTTP_201_CREATED)
             
         except BusinessException as e:
+            metrics.inc('checkout_total', result='rejected')
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -201,7 +247,8 @@ class MergeCartView(APIView):
     
     @swagger_auto_schema(operation_description="Merge guest cart with user cart after login")
     def post(self, request):
-        old_key = request.session.get("old_session_key")
+        # Key captured at login; the guest session itself survives token login
+        old_key = request.session.get("old_session_key") or request.session.session_key
         
         if not old_key:
             return Response({'error': 'No anonymous cart to merge'}, 
@@ -209,13 +256,13 @@ class MergeCartView(APIView):
         
         try:
             cart_service = CartService()
-            cart, warnings = cart_service.merge_carts(request.user, old_key)
+            cart, warnings = cart_service.merge_guest_cart(request, request.user, old_key)
             # Clean up old session key
             request.session.pop("old_session_key", None)
 
             response_data = {
                 'message': 'Cart merged successfully',
-                'data': CartSerializer(cart).data
+                'data': CartSerializer(cart_service.prefetch_items(cart)).data
             }
             if warnings:
                 response_data['warnings'] = warnings
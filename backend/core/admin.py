@@ -0,0 +1,34 @@
+"""
+Django Admin Configuration for Core
+Background tasks: failed ones can be inspected and queued again
+
+File: admin.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """Read-only view of the task table"""
+
+    list_display = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = [field.name for field in Task._meta.fields]
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Queue again (attempts reset)')
+    def requeue(self, request, queryset):
+        count = queryset.filter(status=Task.STATUS_FAILED).update(
+            status=Task.STATUS_QUEUED, attempts=0, run_at=timezone.now(), last_error='',
+        )
+        self.message_user(request, f'{count} task(s) queued again')
@@ -0,0 +1,197 @@
+"""
+Two-tier application cache with namespaced, versioned keys
+
+Tier 1 is a per-process LRU (bounded by CACHE_LOCAL_MAX_ENTRIES, entries live
+at most CACHE_LOCAL_TTL seconds). Tier 2 is Django's default cache, shared by
+every worker: file-based by default, Redis when CACHE_URL is set.
+
+Keys are '<namespace>:<version>:<key>'. Namespace.invalidate() bumps the
+namespace version in the shared tier, so every key goes stale at once without
+deleting anything; other workers see the new version within CACHE_LOCAL_TTL.
+
+Stampede protection: shared entries carry a soft expiry (ttl) and live for
+ttl + CACHE_STALE_GRACE. Past the soft expiry a single caller (cache.add lock,
+so one across all workers) recomputes while everyone else keeps serving the
+stale value. On a cold miss, threads of the same process wait on a per-key
+lock and other workers poll the shared tier for up to CACHE_LOCK_WAIT seconds
+before computing themselves.
+
+File: cache.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+
+from . import metrics
+
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe bounded LRU with per-entry deadlines"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalLRU(getattr(settings, 'CACHE_LOCAL_MAX_ENTRIES', 1024))
+
+# Striped locks for in-process single-flight (bounded, unlike a lock per key)
+_key_locks = [threading.Lock() for _ in range(64)]
+
+
+def _key_lock(key):
+    return _key_locks[zlib.crc32(key.encode()) % len(_key_locks)]
+
+
+class Namespace:
+    """A group of keys that is invalidated together (e.g. 'categories')"""
+
+    def __init__(self, name, ttl=None):
+        self.name = name
+        self.ttl = ttl or settings.CACHE_DEFAULT_TTL
+        self.version_key = f'{name}:__version__'
+
+    ##### Versioning #####
+
+    def version(self):
+        version = local_cache.get(self.version_key)
+        if version is _MISSING:
+            version = shared_cache.get(self.version_key)
+            if version is None:
+                shared_cache.add(self.version_key, 1, timeout=None)
+                version = shared_cache.get(self.version_key, 1)
+            local_cache.set(self.version_key, version, settings.CACHE_LOCAL_TTL)
+        return version
+
+    def invalidate(self):
+        """Make every key of this namespace stale, in every worker"""
+        try:
+            version = shared_cache.incr(self.version_key)
+        except ValueError:
+            version = self.version() + 1
+            shared_cache.set(self.version_key, version, timeout=None)
+        local_cache.set(self.version_key, version, settings.CACHE_LOCAL_TTL)
+
+    def make_key(self, key):
+        return f'{self.name}:{self.version()}:{key}'
+
+    ##### Reads #####
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Return the cached value for key, calling compute() (once) when needed"""
+        ttl = ttl or self.ttl
+        full_key = self.make_key(key)
+
+        value = local_cache.get(full_key)
+        if value is not _MISSING:
+            metrics.record_cache(self.name, True)
+            return value
+
+        entry = shared_cache.get(full_key)
+        if entry is not None:
+            value, fresh_until = entry
+            if fresh_until > time.time() or not self._acquire(full_key):
+                # Fresh, or another caller is already refreshing it
+                self._store_local(full_key, value, ttl)
+                metrics.record_cache(self.name, True)
+                return value
+            metrics.record_cache(self.name, False)
+            try:
+                return self._compute(full_key, compute, ttl)
+            finally:
+                self._release(full_key)
+
+        metrics.record_cache(self.name, False)
+        with _key_lock(full_key):
+            # Another thread of this process may have filled it meanwhile
+            value = local_cache.get(full_key)
+            if value is not _MISSING:
+                return value
+
+            if self._acquire(full_key):
+                try:
+                    return self._compute(full_key, compute, ttl)
+                finally:
+                    self._release(full_key)
+
+            # Another worker is computing it: wait (bounded), then give up
+            deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = shared_cache.get(full_key)
+                if entry is not None:
+                    self._store_local(full_key, entry[0], ttl)
+                    return entry[0]
+            return self._compute(full_key, compute, ttl)
+
+    def delete(self, key):
+        full_key = self.make_key(key)
+        shared_cache.delete(full_key)
+        local_cache.delete(full_key)
+
+    ##### Internals #####
+
+    def _compute(self, full_key, compute, ttl):
+        value = compute()
+        shared_cache.set(full_key, (value, time.time() + ttl), timeout=ttl + settings.CACHE_STALE_GRACE)
+        self._store_local(full_key, value, ttl)
+        return value
+
+    def _store_local(self, full_key, value, ttl):
+        local_cache.set(full_key, value, min(ttl, settings.CACHE_LOCAL_TTL))
+
+    def _acquire(self, full_key):
+        return shared_cache.add(f'{full_key}:lock', 1, timeout=settings.CACHE_LOCK_TIMEOUT)
+
+    def _release(self, full_key):
+        shared_cache.delete(f'{full_key}:lock')
+
+
+def request_key(request):
+    """Cache key for a GET: host (absolute image URLs), path and sorted query"""
+    query = sorted((name, value) for name, values in request.GET.lists() for value in values)
+    return f'{request.get_host()}{request.path}?{urlencode(query)}'
+
+
+def clear_all():
+    """Drop both tiers (tests, deploys)"""
+    local_cache.clear()
+    shared_cache.clear()
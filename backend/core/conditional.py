@@ -0,0 +1,71 @@
+"""
+HTTP conditional requests for read-mostly endpoints
+
+@conditional(validators) wraps a DRF view method. validators(view, request,
+*args, **kwargs) returns (etag, last_modified) from something cheap (a cache
+namespace version, an updated_at column), never from the rendered body, so
+a matching If-None-Match / If-Modified-Since is answered with a 304 before
+the view queries or serializes anything.
+
+Anonymous responses are 'public' for HTTP_CACHE_MAX_AGE seconds (CDNs and
+browsers); authenticated ones are 'private' and always revalidated.
+
+File: conditional.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Opaque strong ETag from the values the representation depends on"""
+    return quote_etag(hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:32])
+
+
+def set_validators(response, request, etag, last_modified):
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE_MAX_AGE)
+    return response
+
+
+def conditional(validators):
+    """
+    validators returns (etag key, last_modified datetime or None), or None
+    when there's nothing to validate (e.g. the view is about to 404). The
+    etag key is combined with the negotiated format (JSON vs browsable API).
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return method(view, request, *args, **kwargs)
+
+            result = validators(view, request, *args, **kwargs)
+            if result is None:
+                return method(view, request, *args, **kwargs)
+
+            key, modified = result
+            etag = make_etag(key, request.accepted_renderer.format)
+            last_modified = int(modified.timestamp()) if modified is not None else None
+
+            # 304 (If-None-Match / If-Modified-Since) or 412 (If-Match / If-Unmodified-Since)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                set_validators(response, request, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,137 @@
+"""
+Idempotency-Key support for non-repeatable POSTs
+
+@idempotent(scope) wraps a DRF view method. When the client sends an
+Idempotency-Key header, the first request runs normally and its response
+is stored, in the same transaction as the work it did, under (owner, scope,
+key). A retry with the same key is answered from that row, one indexed
+read, with an Idempotent-Replayed header; reusing a key for a different
+request (method, path or body) is a 422. Concurrent duplicates wait on the
+unique index and then replay the first one's response.
+
+Requests without the header behave as before. 5xx responses and exceptions
+aren't stored (the transaction rolls back), so those can be retried. Keys
+expire after IDEMPOTENCY_KEY_TTL seconds (purge_idempotency_keys).
+
+File: idempotency.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+from .models import IdempotencyKey
+from .renderers import FastJSONRenderer
+from .sessions import guest_id
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def _owner(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    if request.session.session_key:
+        # Not session_key: with signed cookies it's long and changes with the session
+        return f'guest:{guest_id(request.session)}'
+    return None
+
+
+def _request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _replay(record, request_hash):
+    if record is None:
+        # The concurrent request holding the key rolled back: nothing to replay yet
+        return Response(
+            {'error': f'A request with this {IDEMPOTENCY_HEADER} is being processed, retry'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    if record.request_hash != request_hash:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record.response_body, status=record.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotency_key_parameter():
+    """Swagger header parameter for views decorated with @idempotent"""
+    from drf_yasg import openapi
+
+    return openapi.Parameter(
+        IDEMPOTENCY_HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+        description='Unique per operation: retries with the same key return the first response',
+    )
+
+
+def _lookup(owner, scope, key):
+    try:
+        return IdempotencyKey.objects.get(owner=owner, scope=scope, key=key)
+    except IdempotencyKey.DoesNotExist:
+        return None
+
+
+def idempotent(scope):
+    """Put it above @transaction.atomic (if any) so the stored result commits with the work"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            owner = _owner(request) if key else None
+            if owner is None:
+                return method(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_HEADER} is longer than {MAX_KEY_LENGTH} characters'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            request_hash = _request_hash(request)
+            record = _lookup(owner, scope, key)
+            if record is not None:
+                if record.created_at >= timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL):
+                    metrics.inc('idempotent_replays_total', scope=scope)
+                    return _replay(record, request_hash)
+                record.delete()  # expired: the key is free again
+
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        # Claims the key: a concurrent duplicate blocks here until we commit
+                        record = IdempotencyKey.objects.create(
+                            owner=owner, scope=scope, key=key, request_hash=request_hash, status_code=0,
+                        )
+                except IntegrityError:
+                    record = None
+                if record is None:
+                    metrics.inc('idempotent_replays_total', scope=scope)
+                    return _replay(_lookup(owner, scope, key), request_hash)
+
+                response = method(view, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True)
+                    return response
+
+                # Stored as the JSON the client got (Decimals, dates... already encoded)
+                record.status_code = response.status_code
+                record.response_body = json.loads(FastJSONRenderer().render(response.data) or b'null')
+                record.save(update_fields=['status_code', 'response_body'])
+                return response
+        return wrapper
+    return decorator
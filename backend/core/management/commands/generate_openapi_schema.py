@@ -0,0 +1,24 @@
+"""
+Write the OpenAPI schema to API_SCHEMA_FILE (build step), so web workers
+serve it without running drf_yasg's generator.
+
+File: generate_openapi_schema.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.schema import write_schema_file
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema into API_SCHEMA_FILE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.API_SCHEMA_FILE)
+
+    def handle(self, *args, **options):
+        version = write_schema_file(options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']} (version {version})"))
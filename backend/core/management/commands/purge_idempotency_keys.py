@@ -0,0 +1,39 @@
+"""
+Delete idempotency keys older than IDEMPOTENCY_KEY_TTL (cron). Expired
+keys are already ignored by core.idempotency; this keeps the table small.
+
+File: purge_idempotency_keys.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        total = 0
+
+        while True:
+            ids = list(
+                IdempotencyKey.objects.filter(created_at__lt=cutoff).values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted, _ = IdempotencyKey.objects.filter(pk__in=ids).delete()
+            total += deleted
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} expired idempotency keys'))
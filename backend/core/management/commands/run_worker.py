@@ -0,0 +1,88 @@
+"""
+Background task worker (core.tasks): runs queued @background calls, then
+polls every --interval seconds while there's nothing due
+
+    python manage.py run_worker                      # run forever, one thread
+    python manage.py run_worker --concurrency 4      # four tasks at a time
+    python manage.py run_worker --once               # drain and exit (cron)
+
+With --concurrency 1 tasks run in the command's own thread. Otherwise each
+thread claims its own tasks (and has its own database connection); any
+number of workers can run side by side. SIGTERM/Ctrl-C lets the tasks
+in progress finish before exiting.
+
+File: run_worker.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.module_loading import autodiscover_modules
+
+from core import metrics
+from core.tasks import run_pending, worker_id
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Tasks run at the same time (threads)')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due')
+
+    def handle(self, *args, **options):
+        # Registers every app's @background functions (<app>/tasks.py)
+        autodiscover_modules('tasks')
+
+        self.stop = threading.Event()
+        self.totals = {}
+        self.totals_lock = threading.Lock()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop.set())
+
+        threads = [
+            threading.Thread(target=self.work_in_thread, args=(options,), name=f'worker-{number}')
+            for number in range(options['concurrency'])
+        ] if options['concurrency'] > 1 else []
+        for thread in threads:
+            thread.start()
+        try:
+            if threads:
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(timeout=0.5)
+            else:
+                self.work(options)
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            metrics.registry.flush()
+
+        summary = ', '.join(f'{count} {result}' for result, count in sorted(self.totals.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Tasks: {summary}'))
+
+    def work(self, options):
+        worker = worker_id()
+        while not self.stop.is_set():
+            results = run_pending(worker, stop=self.stop)
+            with self.totals_lock:
+                for result, count in results.items():
+                    self.totals[result] = self.totals.get(result, 0) + count
+            metrics.registry.maybe_flush()
+
+            if options['once']:
+                break
+            self.stop.wait(options['interval'])
+
+    def work_in_thread(self, options):
+        try:
+            self.work(options)
+        finally:
+            connection.close()
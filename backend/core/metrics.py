@@ -0,0 +1,280 @@
+"""
+Per-process metrics aggregator with Prometheus text exposition
+
+Counters and histograms are recorded into thread-local shards, so the hot
+path never takes a lock. Each worker periodically dumps its merged shards to
+METRICS_DIR (one JSON file per process, atomic rename) and /metrics merges
+every worker's file, which makes it work under multi-worker gunicorn.
+
+File: metrics.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+# Histogram definitions: name -> (help, upper bounds)
+HISTOGRAMS = {
+    'http_request_duration_seconds': (
+        'Request latency per view/action',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    ),
+    'http_request_db_queries': (
+        'DB queries per request per view/action',
+        (0, 1, 2, 5, 10, 20, 50, 100),
+    ),
+}
+
+COUNTERS = {
+    'http_requests_total': 'Requests per view/action, method and status',
+    'http_request_db_seconds_total': 'Time spent in DB queries per view/action',
+    'cache_requests_total': 'Cache lookups per cache and result (hit/miss)',
+    'checkout_total': 'Checkouts per result',
+    'checkout_amount_total': 'Sum of successfully checked out order amounts',
+    'payments_total': 'Payment status updates per status',
+    'payment_events_total': 'Payment webhook events processed per result',
+    'points_awarded_total': 'Eco points awarded per action type',
+    'eco_transactions_total': 'Eco transactions created per action type',
+    'idempotent_replays_total': 'Retries answered from a stored Idempotency-Key result per scope',
+    'tasks_total': 'Background tasks run per task and result',
+    'purge_rows_total': 'Rows deleted by purge jobs per model',
+    'purge_seconds_total': 'Seconds spent deleting per purge job (pauses excluded)',
+}
+
+
+class _Shard:
+    """Metrics recorded by one thread (only that thread writes to it)"""
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}    # (name, labels) -> float
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._next_flush = 0.0
+        self._started = int(time.time())
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    ##### Recording (hot path) #####
+
+    def inc(self, name, value=1, **labels):
+        counters = self._shard().counters
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        histograms = self._shard().histograms
+        key = (name, tuple(sorted(labels.items())))
+        bounds = HISTOGRAMS[name][1]
+        row = histograms.get(key)
+        if row is None:
+            row = histograms[key] = [0] * (len(bounds) + 2)
+        for index, bound in enumerate(bounds):
+            if value <= bound:
+                row[index] += 1
+                break
+        else:
+            row[len(bounds)] += 1
+        row[-1] += value
+
+    ##### Aggregation #####
+
+    @staticmethod
+    def _items(mapping):
+        # Another thread may insert while we copy; retry instead of locking writers
+        while True:
+            try:
+                return list(mapping.items())
+            except RuntimeError:
+                continue
+
+    def snapshot(self):
+        """Merge all thread shards of this process into plain dicts"""
+        counters, histograms = {}, {}
+        for shard in list(self._shards):
+            for key, value in self._items(shard.counters):
+                counters[key] = counters.get(key, 0) + value
+            for key, row in self._items(shard.histograms):
+                merged = histograms.setdefault(key, [0] * len(row))
+                for index, value in enumerate(list(row)):
+                    merged[index] += value
+        return counters, histograms
+
+    ##### Multi-process exchange #####
+
+    @property
+    def _path(self):
+        return os.path.join(settings.METRICS_DIR, f'metrics-{os.getpid()}-{self._started}.json')
+
+    def flush(self):
+        """Write this process' snapshot to METRICS_DIR (atomic rename)"""
+        if not getattr(settings, 'METRICS_DIR', None):
+            return
+        counters, histograms = self.snapshot()
+        payload = {
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, row] for (name, labels), row in histograms.items()],
+        }
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        tmp_path = f'{self._path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(payload, fh)
+        os.replace(tmp_path, self._path)
+
+    def maybe_flush(self):
+        """Called after each request; flushes at most every METRICS_FLUSH_INTERVAL seconds"""
+        now = time.monotonic()
+        if now < self._next_flush or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_flush = now + getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+            self.flush()
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """Merged metrics of every worker (or only this process without METRICS_DIR)"""
+        metrics_dir = getattr(settings, 'METRICS_DIR', None)
+        if not metrics_dir:
+            return self.snapshot()
+
+        self.flush()
+        counters, histograms = {}, {}
+        retention = getattr(settings, 'METRICS_RETENTION', 86400)
+        for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+            try:
+                # Files of workers that stopped long ago are dropped
+                if time.time() - os.path.getmtime(path) > retention:
+                    os.remove(path)
+                    continue
+                with open(path) as fh:
+                    payload = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in payload['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, row in payload['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [0] * len(row))
+                for index, value in enumerate(row):
+                    merged[index] += value
+        return counters, histograms
+
+
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+
+
+def record_cache(cache_name, hit):
+    """Hook for cache layers: count a lookup as hit or miss"""
+    registry.inc('cache_requests_total', cache=cache_name, result='hit' if hit else 'miss')
+
+
+def view_label(view_func, request):
+    """'ProductViewSet.list', 'CheckoutView.post', 'delete_account.delete'..."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None)
+    action = actions.get(method, method) if actions else method
+    return f'{cls.__name__}.{action}'
+
+
+##### Prometheus text format #####
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(counters, histograms):
+    lines = []
+
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        lines.append(f'# HELP {name} {COUNTERS.get(name, name)}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(by_name[name]):
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    # Hit ratio per cache, derived from cache_requests_total
+    ratios = {}
+    for labels, value in by_name.get('cache_requests_total', []):
+        label_dict = dict(labels)
+        hits, total = ratios.get(label_dict.get('cache'), (0, 0))
+        ratios[label_dict.get('cache')] = (hits + (value if label_dict.get('result') == 'hit' else 0), total + value)
+    if ratios:
+        lines.append('# HELP cache_hit_ratio Cache hits / lookups since worker start')
+        lines.append('# TYPE cache_hit_ratio gauge')
+        for cache_name, (hits, total) in sorted(ratios.items()):
+            lines.append(f'cache_hit_ratio{_format_labels([("cache", cache_name)])} {hits / total if total else 0.0}')
+
+    by_name = {}
+    for (name, labels), row in histograms.items():
+        by_name.setdefault(name, []).append((labels, row))
+    for name in sorted(by_name):
+        help_text, bounds = HISTOGRAMS[name]
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, row in sorted(by_name[name]):
+            cumulative = 0
+            for bound, count in zip(list(bounds) + ['+Inf'], row[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(row[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, protected by METRICS_TOKEN. Without a token
+    it's only served with DEBUG (business counters aren't public)
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    body = render(*registry.collect())
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,18 +1,202 @@
-class StoreOldSessionMiddleware:
+import gzip
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+
+from . import metrics, perf
+from .query_budget import DuplicateQueryTracker
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+perf_logger = logging.getLogger('core.perf')
+queries_logger = logging.getLogger('core.queries')
+
+
+class PerformanceMiddleware:
+    """
+    Per-request instrumentation: wall time, DB queries/time, serializer time
+    and response size. Exposed as a Server-Timing header (PERF_SERVER_TIMING)
+    and a structured log line on the 'core.perf' logger, at INFO for requests
+    slower than PERF_SLOW_REQUEST_MS and at DEBUG otherwise; latencies are
+    aggregated per URL name and recorded per view/action in core.metrics for
+    /metrics.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.enabled = getattr(settings, 'PERF_INSTRUMENTATION_ENABLED', True)
+        self.server_timing = getattr(settings, 'PERF_SERVER_TIMING', settings.DEBUG)
+        self.slow_request = getattr(settings, 'PERF_SLOW_REQUEST_MS', 500) / 1000
+        self.summary_every = getattr(settings, 'PERF_SUMMARY_EVERY', 1000)
+        self.metrics_enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.requests_seen = 0
+        if self.enabled:
+            perf.instrument_serializers()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = metrics.view_label(view_func, request)
+        return None
 
     def __call__(self, request):
-        user = getattr(request, "user", None)
+        if not self.enabled:
+            return self.get_response(request)
+
+        request_metrics, token = perf.start_request()
+        try:
+            with connection.execute_wrapper(perf.db_execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            perf.end_request(token)
+
+        total = request_metrics.elapsed
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match and match.view_name else 'unresolved'
+        size = None if response.streaming else len(response.content)
 
-        # Crear session_key si no existe (anónimo)
-        if not request.session.session_key:
-            request.session.save()
+        perf.latency_registry.record(url_name, total)
 
-        # Guardar old_session_key solo si es anónimo y no existe
-        if user and not user.is_authenticated:
-            if "old_session_key" not in request.session:
-                request.session["old_session_key"] = request.session.session_key
+        if self.metrics_enabled:
+            view = getattr(request, '_metrics_view', 'unresolved')
+            metrics.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+            metrics.inc('http_request_db_seconds_total', request_metrics.db_time, view=view)
+            metrics.observe('http_request_duration_seconds', total, view=view)
+            metrics.observe('http_request_db_queries', request_metrics.db_queries, view=view)
+            metrics.registry.maybe_flush()
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'total;dur={total * 1000:.1f}, '
+                f'db;dur={request_metrics.db_time * 1000:.1f};desc="{request_metrics.db_queries} queries", '
+                f'serialize;dur={request_metrics.serializer_time * 1000:.1f}'
+            )
+
+        level = logging.INFO if total >= self.slow_request else logging.DEBUG
+        if perf_logger.isEnabledFor(level):
+            fields = {
+                'method': request.method,
+                'path': request.path,
+                'url_name': url_name,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                'db_queries': request_metrics.db_queries,
+                'db_ms': round(request_metrics.db_time * 1000, 2),
+                'serializer_ms': round(request_metrics.serializer_time * 1000, 2),
+                'bytes': size,
+            }
+            perf_logger.log(level, ' '.join(f'{key}={value}' for key, value in fields.items()), extra={'perf': fields})
+
+        self.requests_seen += 1
+        if self.summary_every and self.requests_seen % self.summary_every == 0:
+            perf_logger.info('latency summary %s', perf.latency_registry.summary())
+
+        return response
+
+
+class DuplicateQueryMiddleware:
+    """
+    DEBUG only: logs SQL statements repeated within one request (the N+1
+    signature) together with the stack trace of the code that repeats them.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_DUPLICATE_THRESHOLD', 3)
 
+    def __call__(self, request):
+        tracker = DuplicateQueryTracker()
+        with connection.execute_wrapper(tracker):
+            response = self.get_response(request)
+
+        for sql, count, stack in tracker.duplicates(self.threshold):
+            queries_logger.warning(
+                '%s %s: query ran %d times\n  %s\n%s', request.method, request.path, count, sql, stack
+            )
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses API JSON responses (brotli when the client accepts it and the
+    module is installed, else gzip) once they exceed API_COMPRESSION_MIN_SIZE
+    bytes. Static files are left to WhiteNoise, which serves them precompressed.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_COMPRESSION_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024)
+        self.content_types = tuple(getattr(settings, 'API_COMPRESSION_CONTENT_TYPES', ('application/json',)))
+        self.brotli_quality = getattr(settings, 'API_COMPRESSION_BROTLI_QUALITY', 4)
+        self.gzip_level = getattr(settings, 'API_COMPRESSION_GZIP_LEVEL', 6)
+
+    def __call__(self, request):
         response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith(self.content_types)
+        ):
+            return response
+
+        # The representation depends on Accept-Encoding even when it's not compressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_size:
+            return response
+
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding, self.brotli_quality, self.gzip_level)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # Same content in a different encoding: a strong validator must change
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
         return response
+
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header (q-values honoured, br preferred on ties)"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+
+    wildcard = weights.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in ('br', 'gzip') if brotli is not None else ('gzip',):
+        quality = weights.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding, brotli_quality=4, gzip_level=6):
+    # Low brotli qualities compress JSON better than gzip -6 at a similar CPU cost
+    if encoding == 'br':
+        return brotli.compress(content, mode=brotli.MODE_TEXT, quality=brotli_quality)
+    return gzip.compress(content, compresslevel=gzip_level, mtime=0)
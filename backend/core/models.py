@@ -0,0 +1,76 @@
+"""
+Description: Cross-app models (idempotency keys, background tasks)
+
+File: models.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from django.db import models
+from django.utils import timezone
+
+
+class IdempotencyKey(models.Model):
+    """
+    Result of a non-repeatable request (checkout, payment creation), stored
+    under the client's Idempotency-Key so a retry gets the same response
+    instead of running the operation again (see core.idempotency)
+    """
+    owner = models.CharField(max_length=64)   # 'user:<id>' or 'guest:<core.sessions.guest_id>'
+    scope = models.CharField(max_length=32)   # 'checkout', 'payment', ...
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Retries are one lookup on this index
+            models.UniqueConstraint(fields=['owner', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            # purge_idempotency_keys
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.key} ({self.owner})'
+
+
+class Task(models.Model):
+    """
+    A call to a @background function waiting for (or being run by) a
+    run_worker process (see core.tasks). Rows are deleted once the call
+    succeeds; the ones that ran out of attempts stay as 'failed'.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)   # registered name, 'products.tasks.delete_image_file'
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)      # not before (retries are pushed back)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)  # lease: past it, another worker may take over
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # What workers poll: only the tasks that can be claimed
+            models.Index(fields=['run_at'], condition=models.Q(status='queued'), name='task_queued'),
+            models.Index(fields=['locked_until'], condition=models.Q(status='running'), name='task_running'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,153 @@
+"""
+Per-request performance instrumentation helpers
+
+Collects wall time, DB query count/time and serializer time for the current
+request and keeps in-process latency percentiles per URL name.
+
+File: perf.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+# Current request metrics (None outside of an instrumented request)
+_current = ContextVar('perf_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters for a single request"""
+    __slots__ = ('start', 'db_queries', 'db_time', 'serializer_time', '_serializer_depth')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def start_request():
+    """Bind a fresh RequestMetrics to the current context"""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook: count and time every query"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+##### Serializer timing #####
+
+_serializers_instrumented = False
+
+
+def instrument_serializers():
+    """
+    Wrap BaseSerializer.data once per process so the outermost .data call
+    of each serializer is timed (nested serializers are not double counted)
+    """
+    global _serializers_instrumented
+    if _serializers_instrumented:
+        return
+
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data.fget
+
+    def timed_data(self):
+        metrics = _current.get()
+        if metrics is None or metrics._serializer_depth:
+            return original(self)
+
+        metrics._serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            metrics._serializer_depth -= 1
+            metrics.serializer_time += time.perf_counter() - start
+
+    BaseSerializer.data = property(timed_data)
+    _serializers_instrumented = True
+
+
+##### In-process latency aggregation #####
+
+class LatencyStats:
+    """Bounded sample of request latencies (seconds) for one URL name"""
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.samples = deque(maxlen=sample_size)
+
+    def add(self, seconds):
+        self.count += 1
+        self.samples.append(seconds)
+
+    def percentiles(self, points=(50, 95, 99)):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {f'p{p}': 0.0 for p in points}
+        last = len(ordered) - 1
+        return {f'p{p}': ordered[min(last, int(round(p / 100 * last)))] for p in points}
+
+
+class LatencyRegistry:
+    """Latency stats per URL name for this process"""
+
+    def __init__(self, sample_size):
+        self.sample_size = sample_size
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, url_name, seconds):
+        stats = self._stats.get(url_name)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(url_name, LatencyStats(self.sample_size))
+        stats.add(seconds)
+
+    def summary(self):
+        """{url_name: {'count', 'p50_ms', 'p95_ms', 'p99_ms'}} sorted by p95 desc"""
+        rows = {}
+        for url_name, stats in list(self._stats.items()):
+            rows[url_name] = {'count': stats.count}
+            for key, value in stats.percentiles().items():
+                rows[url_name][f'{key}_ms'] = round(value * 1000, 2)
+        return dict(sorted(rows.items(), key=lambda item: item[1]['p95_ms'], reverse=True))
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+latency_registry = LatencyRegistry(getattr(settings, 'PERF_SAMPLE_SIZE', 1000))
@@ -0,0 +1,145 @@
+"""
+Query budgets and duplicate-SQL detection
+
+query_budget declares the maximum number of queries a view or block may run
+(enforced in DEBUG and in the test suite). DuplicateQueryTracker groups the
+statements of a request by normalized SQL so N+1 patterns can be reported.
+
+File: query_budget.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+import copy
+import re
+import traceback
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import connections
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block runs more queries than its declared budget"""
+
+    def __init__(self, label, max_queries, queries):
+        self.label = label
+        self.max_queries = max_queries
+        self.queries = queries
+        listing = '\n'.join(f'  {index}. {sql}' for index, sql in enumerate(queries, 1))
+        super().__init__(
+            f'{label or "block"} ran {len(queries)} queries (budget {max_queries}):\n{listing}'
+        )
+
+
+class query_budget(ContextDecorator):
+    """
+    Declare the max number of queries for a view or block:
+
+        @query_budget(4)
+        def list(self, request): ...
+
+        with query_budget(2, label='cart summary'):
+            ...
+
+    Only enforced when settings.QUERY_BUDGET_ENFORCE is true (DEBUG and the
+    test suite) or when enforce=True is passed; otherwise it is a no-op.
+    """
+
+    def __init__(self, max_queries, label=None, using='default', enforce=None):
+        self.max_queries = max_queries
+        self.label = label
+        self.using = using
+        self.enforce = enforce
+        self.queries = []
+        self._wrapper = None
+
+    def __call__(self, func):
+        if self.label is None:
+            self.label = func.__qualname__
+        return super().__call__(func)
+
+    def _recreate_cm(self):
+        # Fresh state per call: the decorated view may run concurrently
+        return copy.copy(self)
+
+    def _record(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        enforce = self.enforce
+        if enforce is None:
+            enforce = getattr(settings, 'QUERY_BUDGET_ENFORCE', False)
+        if enforce:
+            self.queries = []
+            self._wrapper = connections[self.using].execute_wrapper(self._record)
+            self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._wrapper is None:
+            return False
+        self._wrapper.__exit__(exc_type, exc_value, tb)
+        self._wrapper = None
+        if exc_type is None and len(self.queries) > self.max_queries:
+            raise QueryBudgetExceeded(self.label, self.max_queries, self.queries)
+        return False
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+
+##### Duplicate SQL detection #####
+
+_IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Same statement shape -> same key (IN lists and literals collapsed)"""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _NUMBER.sub('N', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _project_stack():
+    """Stack frames from our own code only (no Django/DRF/site-packages)"""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.endswith('query_budget.py')
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+class DuplicateQueryTracker:
+    """
+    connection.execute_wrapper hook counting statements by normalized SQL.
+    The stack is captured on the first repetition, which is the line
+    responsible for an N+1.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        key = normalize_sql(sql)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if count == 2:
+            self.stacks[key] = _project_stack()
+        return execute(sql, params, many, context)
+
+    def duplicates(self, threshold):
+        """[(sql, count, stack)] for statements run at least `threshold` times"""
+        return sorted(
+            ((sql, count, self.stacks.get(sql, '')) for sql, count in self.counts.items() if count >= threshold),
+            key=lambda item: item[1],
+            reverse=True,
+        )
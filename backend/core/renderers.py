@@ -0,0 +1,75 @@
+"""
+JSON renderer/parser backed by orjson, with DRF's stdlib json as fallback
+
+Output is byte-for-byte what rest_framework.renderers.JSONRenderer produces
+with the default settings (compact, UTF-8, U+2028/U+2029 escaped, Decimal
+as float, aware UTC datetimes ending in 'Z'); types orjson doesn't know go
+through DRF's JSONEncoder.default. When orjson isn't installed, or the
+browsable API asks for indentation, the stdlib implementation is used.
+
+File: renderers.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import io
+
+from rest_framework import renderers
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib json module
+    orjson = None
+
+
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+# Decimal, timedelta, QuerySet, lazy strings, ... exactly as DRF encodes them
+_default = JSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """Drop-in JSONRenderer; orjson does the encoding when it can"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if orjson is None or self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # e.g. ints beyond 64 bits: let the stdlib handle (or report) it
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Valid JavaScript as well as JSON, like DRF's renderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """
+    Drop-in JSONParser; invalid or non UTF-8 bodies get DRF's own handling
+    and errors. Integers beyond 64 bits may come back as floats (no field
+    of this API accepts them either way).
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8').lower().replace('_', '-')
+        if orjson is None or encoding not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Big ints, BOMs, ... or a real syntax error: same message as before
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,153 @@
+"""
+OpenAPI schema generated once per deploy and served from memory
+
+drf_yasg walks every view and serializer to build the schema, which costs
+hundreds of ms of CPU. `python manage.py generate_openapi_schema` (run by
+build.sh) writes it to API_SCHEMA_FILE; a worker reads that file, or
+generates the schema itself if it's missing (always, with DEBUG, so code
+changes show up), the first time docs are requested and keeps the bytes in
+memory afterwards.
+
+/swagger.json is served with an ETag derived from the content, and with a
+year-long immutable Cache-Control when requested as /swagger.json?v=<hash>,
+which is the URL the Swagger UI and ReDoc pages point at.
+
+drf_yasg is only imported here, inside functions, so workers that never
+serve docs don't load its generators, renderers and codecs.
+
+File: schema.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+SCHEMA_TITLE = 'EcoShop API'
+SCHEMA_VERSION = 'v1'
+SCHEMA_DESCRIPTION = 'API for EcoShop project'
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def schema_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(title=SCHEMA_TITLE, default_version=SCHEMA_VERSION, description=SCHEMA_DESCRIPTION)
+
+
+def generate_schema():
+    """The public OpenAPI document as compact JSON bytes (slow: walks every view)"""
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    # No request: no host in the document, so it's valid on any domain
+    schema = OpenAPISchemaGenerator(schema_info()).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+class SchemaDocument:
+    """The schema bytes and their version hash, loaded once per process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def get(self):
+        """(body, version)"""
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    body = self._read_file()
+                    if body is None:
+                        body = generate_schema()
+                    self._loaded = (body, hashlib.sha256(body).hexdigest()[:16])
+        return self._loaded
+
+    def reset(self):
+        with self._lock:
+            self._loaded = None
+
+    @staticmethod
+    def _read_file():
+        path = getattr(settings, 'API_SCHEMA_FILE', '')
+        if settings.DEBUG or not path or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+
+schema_document = SchemaDocument()
+
+
+def write_schema_file(path):
+    """Generate the schema into path (atomically); returns its version"""
+    body = generate_schema()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        handle.write(body)
+    os.replace(tmp_path, path)
+    return hashlib.sha256(body).hexdigest()[:16]
+
+
+##### Views #####
+
+def schema_json_view(request):
+    """The OpenAPI document; immutable when the URL carries its version"""
+    body, version = schema_document.get()
+    etag = quote_etag(version)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    if request.GET.get('v') == version:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def schema_url():
+    """/swagger.json?v=<hash>: cacheable forever, changes with the schema"""
+    return f"{reverse('schema-json')}?v={schema_document.get()[1]}"
+
+
+def _docs_page(request, renderer):
+    """Swagger UI / ReDoc HTML (the same for everyone; the schema is fetched separately)"""
+    from drf_yasg import openapi
+
+    # The templates only read the title/version: no need for the real document
+    swagger = openapi.Swagger(info=schema_info(), _prefix='/', paths=openapi.Paths(paths={}))
+    html = renderer.render(swagger, 'text/html', {'request': request})
+    response = HttpResponse(html, content_type='text/html; charset=utf-8')
+    patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE_MAX_AGE)
+    return response
+
+
+def swagger_ui_view(request):
+    from drf_yasg.renderers import SwaggerUIRenderer
+
+    class Renderer(SwaggerUIRenderer):
+        def get_swagger_ui_settings(self):
+            return {**super().get_swagger_ui_settings(), 'url': schema_url(), 'fetchSchemaWithQuery': False}
+
+    return _docs_page(request, Renderer())
+
+
+def redoc_view(request):
+    from drf_yasg.renderers import ReDocRenderer
+
+    class Renderer(ReDocRenderer):
+        def get_redoc_settings(self):
+            return {**super().get_redoc_settings(), 'url': schema_url(), 'fetchSchemaWithQuery': False}
+
+    return _docs_page(request, Renderer())
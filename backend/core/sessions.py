@@ -0,0 +1,26 @@
+"""
+Stable identity of an anonymous visitor
+
+session_key can't identify a guest for rows we keep (materialized session
+carts, Idempotency-Key owners): with SESSION_ENGINE=signed_cookies it's the
+whole signed cookie, longer than the columns that store it and different
+after every write to the session. guest_id() is a random id stored in the
+session once and kept from then on (also across login, which keeps the
+session data).
+
+File: sessions.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import uuid
+
+GUEST_ID_KEY = 'guest_id'
+
+
+def guest_id(session):
+    """The session's guest id (32 hex chars), created on first use"""
+    value = session.get(GUEST_ID_KEY)
+    if value is None:
+        value = session[GUEST_ID_KEY] = uuid.uuid4().hex
+    return value
@@ -14,6 +14,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 import dj_database_url
 from dotenv import load_dotenv
 load_dotenv()
@@ -21,6 +23,7 @@ load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 DEBUG = os.getenv('DEBUG', 'True') == 'True'
+TESTING = sys.argv[1:2] == ['test']
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -116,11 +119,19 @@ INSTALLED_APPS = [
     'rewards',
     #  Library apps
     'rest_framework',
-    'rest_framework.authtoken', # token authentication
     "drf_yasg",
+    # Project-level management commands (core/management)
+    'core',
 ]
 
 MIDDLEWARE = [
+    # Per-request timing (outermost so it measures the whole stack)
+    'core.middleware.PerformanceMiddleware',
+    # N+1 detection, only active with DEBUG=True
+    'core.middleware.DuplicateQueryMiddleware',
+    # gzip/brotli for API JSON (after the instrumentation, so it's timed)
+    'core.middleware.CompressionMiddleware',
+
     'corsheaders.middleware.CorsMiddleware', # Cors step 2
     'django.middleware.security.SecurityMiddleware',
     # WhiteNoise middleware for serving static files
@@ -130,9 +141,6 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
 
-    # Store old session key before login
-    'core.middleware.StoreOldSessionMiddleware',
-
     'django.middleware.csrf.CsrfViewMiddleware',
     
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -291,9 +299,20 @@ REST_FRAMEWORK = {
     # Custom Exception Handler
     'EXCEPTION_HANDLER': 'core.exceptions.custom_exception_handler',
 
+    # orjson when installed, same output as DRF's JSON renderer/parser
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
      # Authentication with Token
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     
     # Permissions - All APIs require authentication by default
@@ -332,3 +351,118 @@ SWAGGER_SETTINGS = {
 }
 
 
+# Performance instrumentation (core.middleware.PerformanceMiddleware)
+PERF_INSTRUMENTATION_ENABLED = os.getenv('PERF_INSTRUMENTATION_ENABLED', 'True') == 'True'
+PERF_SERVER_TIMING = os.getenv('PERF_SERVER_TIMING', str(DEBUG)) == 'True'  # exposes timings to clients: opt-in
+PERF_SLOW_REQUEST_MS = int(os.getenv('PERF_SLOW_REQUEST_MS', '500'))   # slower requests are logged at INFO, others at DEBUG
+PERF_SAMPLE_SIZE = int(os.getenv('PERF_SAMPLE_SIZE', '1000'))     # latencies kept per URL name
+PERF_SUMMARY_EVERY = int(os.getenv('PERF_SUMMARY_EVERY', '1000')) # requests between summary logs
+
+# Prometheus metrics (/metrics). METRICS_DIR is shared by all gunicorn workers
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'ecoshop-metrics'))
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', '10'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # scrapers send "Authorization: Bearer <token>"; unset: DEBUG only
+
+# Query budgets (core.query_budget): raise when a view exceeds its declared budget
+QUERY_BUDGET_ENFORCE = os.getenv('QUERY_BUDGET_ENFORCE', str(DEBUG)) == 'True'
+QUERY_DUPLICATE_THRESHOLD = int(os.getenv('QUERY_DUPLICATE_THRESHOLD', '3'))
+
+# API tokens (accounts.AuthToken): lifetime and how often last_used_at is written
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', str(14 * 24 * 3600)))
+AUTH_TOKEN_TOUCH_INTERVAL = int(os.getenv('AUTH_TOKEN_TOUCH_INTERVAL', '300'))
+
+# Application cache (core.cache): per-process LRU in front of CACHES['default'].
+# Set CACHE_URL=redis://... to share it through Redis instead of the file cache
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ecoshop-cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', '300'))
+CACHE_LOCAL_TTL = int(os.getenv('CACHE_LOCAL_TTL', '5'))          # max staleness across workers
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '1024'))
+CACHE_STALE_GRACE = int(os.getenv('CACHE_STALE_GRACE', '60'))     # serve stale while one caller refreshes
+CACHE_LOCK_TIMEOUT = int(os.getenv('CACHE_LOCK_TIMEOUT', '10'))
+CACHE_LOCK_WAIT = float(os.getenv('CACHE_LOCK_WAIT', '2'))
+
+# Catalog snapshot (products.snapshot): mmapped by every worker, so the
+# directory must be shared by them (same host). Built by run_worker
+# (rebuild_catalog_snapshot task), never by a request
+PRODUCT_SNAPSHOT_ENABLED = os.getenv('PRODUCT_SNAPSHOT_ENABLED', 'True') == 'True'
+PRODUCT_SNAPSHOT_DIR = os.getenv('PRODUCT_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'ecoshop-snapshots'))
+PRODUCT_SNAPSHOT_MAX_AGE = int(os.getenv('PRODUCT_SNAPSHOT_MAX_AGE', '60'))   # then queue a rebuild (stock changes)
+PRODUCT_SNAPSHOT_BUILD_TIMEOUT = int(os.getenv('PRODUCT_SNAPSHOT_BUILD_TIMEOUT', '60'))
+
+# Token auth cache (accounts.authentication). The epoch file must be shared by
+# all workers: revoked key hashes are appended to it, and replacing it (mass
+# revocation) drops every worker's cached tokens
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', '60'))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '10000'))
+AUTH_TOKEN_CACHE_EPOCH_FILE = os.getenv(
+    'AUTH_TOKEN_CACHE_EPOCH_FILE', os.path.join(tempfile.gettempdir(), 'ecoshop-auth-epoch')
+)
+
+# Conditional GETs (core.conditional): how long browsers/CDNs may reuse an
+# anonymous catalog response before revalidating it (ETag -> 304)
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', '60'))
+
+# OpenAPI schema written at build time (core.schema / generate_openapi_schema)
+API_SCHEMA_FILE = os.getenv('API_SCHEMA_FILE', os.path.join(BASE_DIR, 'openapi', 'schema.json'))
+
+# Guest carts (cart.session_cart): 'db' keeps them as Cart rows per session;
+# 'session' keeps the lines in the session and writes rows only at login
+# merge/checkout. With SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+# browsing guests (and bots) cause no database writes at all
+CART_GUEST_BACKEND = os.getenv('CART_GUEST_BACKEND', 'db')
+CART_GUEST_MAX_AGE_DAYS = int(os.getenv('CART_GUEST_MAX_AGE_DAYS', '30'))  # purge_stale_carts
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+
+# Idempotency-Key results of checkout / payment creation (core.idempotency)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 3600)))
+
+# Background tasks (core.tasks / run_worker). TASKS_EAGER runs them in-process
+# after the commit instead of queueing them (development without a worker)
+TASKS_EAGER = os.getenv('TASKS_EAGER', 'False') == 'True'
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '3'))
+TASK_RETRY_BACKOFF = int(os.getenv('TASK_RETRY_BACKOFF', '10'))          # seconds, doubled per attempt
+TASK_RETRY_BACKOFF_MAX = int(os.getenv('TASK_RETRY_BACKOFF_MAX', '3600'))
+TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', '300'))         # then a dead worker's task is rerun
+
+# API response compression (core.middleware.CompressionMiddleware)
+API_COMPRESSION_ENABLED = os.getenv('API_COMPRESSION_ENABLED', 'True') == 'True'
+API_COMPRESSION_MIN_SIZE = int(os.getenv('API_COMPRESSION_MIN_SIZE', '1024'))    # bytes; smaller isn't worth it
+API_COMPRESSION_BROTLI_QUALITY = int(os.getenv('API_COMPRESSION_BROTLI_QUALITY', '4'))
+API_COMPRESSION_GZIP_LEVEL = int(os.getenv('API_COMPRESSION_GZIP_LEVEL', '6'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.perf': {
+            'handlers': ['console'],
+            # Slow test requests (snapshot builds, first queries) aren't worth a line each
+            'level': os.getenv('PERF_LOG_LEVEL', 'WARNING' if TESTING else 'INFO'),
+            'propagate': False,
+        },
+        'core.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
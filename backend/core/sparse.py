@@ -0,0 +1,148 @@
+"""
+Sparse fieldsets for read endpoints: ?fields=a,b and/or ?omit=c
+
+SparseFieldsMixin drops the fields a client didn't ask for from a serializer
+before anything is rendered, and sparse_only() turns the remaining fields
+into a .only() column list (dropping select_related/prefetch_related lookups
+nothing renders), so the SQL shrinks with the payload.
+
+Only top-level fields are selectable; unknown names are ignored. Writes
+(non-safe methods) always get the full serializer.
+
+File: sparse.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def sparse_fields(request, names):
+    """
+    The subset of names (in their order) this request wants rendered, or
+    None when it doesn't restrict them
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+
+    params = getattr(request, 'query_params', request.GET)
+    fields = set(_split(params.get(FIELDS_PARAM, '')))
+    omit = set(_split(params.get(OMIT_PARAM, '')))
+    if not fields and not omit:
+        return None
+    return [name for name in names if (not fields or name in fields) and name not in omit]
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin. Pruning happens in __init__ from context['request'], so
+    it applies to top-level serializers (and the child of many=True), not to
+    nested ones declared on a parent.
+
+    sparse_sources: {field name: [model lookups]} for fields sparse_only()
+    can't derive from `source` (SerializerMethodFields, reverse relations).
+    """
+    sparse_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = sparse_fields(self.context.get('request'), list(self.fields))
+        if keep is not None:
+            for name in set(self.fields) - set(keep):
+                self.fields.pop(name)
+
+
+@lru_cache(maxsize=None)
+def field_lookups(serializer_class):
+    """
+    {field name: tuple of model lookups it reads, or None if unknown}.
+    A lookup with '__' goes through a relation.
+    """
+    model = serializer_class.Meta.model
+    lookups = {}
+    for name, field in serializer_class().fields.items():
+        if name in serializer_class.sparse_sources:
+            lookups[name] = tuple(serializer_class.sparse_sources[name])
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            lookups[name] = None
+            continue
+
+        parts = field.source.split('.')
+        try:
+            model_field = model._meta.get_field(parts[0])
+        except FieldDoesNotExist:
+            lookups[name] = None  # property: columns unknown
+            continue
+        if not model_field.concrete:
+            # Reverse relation (prefetched): needs no column of this model
+            lookups[name] = (parts[0],) if len(parts) == 1 else None
+        elif len(parts) == 1:
+            lookups[name] = (parts[0],)
+        else:
+            lookups[name] = (parts[0], '__'.join(parts))
+    return lookups
+
+
+def _flatten_select_related(related, prefix=''):
+    for name, nested in related.items():
+        path = f'{prefix}{name}'
+        yield path
+        yield from _flatten_select_related(nested, f'{path}__')
+
+
+def sparse_only(queryset, serializer_class, request, required=()):
+    """
+    Restrict queryset to the columns (and joins/prefetches) behind the fields
+    this request renders, plus `required` (columns the view itself reads,
+    e.g. 'user' for an ownership check). Unchanged when nothing is pruned or
+    when a kept field can't be mapped to columns.
+    """
+    lookups = field_lookups(serializer_class)
+    keep = sparse_fields(request, list(lookups))
+    if keep is None or any(lookups[name] is None for name in keep):
+        return queryset
+
+    model = queryset.model
+    columns = {model._meta.pk.name, *required}
+    roots = set()
+    for name in keep:
+        for lookup in lookups[name]:
+            root = lookup.split('__')[0]
+            roots.add(root)
+            if model._meta.get_field(root).concrete:
+                columns.add(lookup)
+            else:
+                # Reverse relation: the related columns load through its select_related
+                if '__' in lookup:
+                    columns.add(lookup)
+
+    # Joins and prefetches whose relation isn't rendered any more
+    related = queryset.query.select_related
+    if isinstance(related, dict):
+        paths = [path for path in _flatten_select_related(related) if path.split('__')[0] in roots]
+        queryset = queryset.select_related(None)
+        if paths:
+            queryset = queryset.select_related(*paths)
+
+    prefetches = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0] in roots
+    ]
+    queryset = queryset.prefetch_related(None)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+
+    return queryset.only(*columns)
@@ -0,0 +1,193 @@
+"""
+Background tasks on a database table, without a broker
+
+@background registers a function that can also be queued:
+
+    @background(max_attempts=5)
+    def delete_image_file(model_label, name): ...
+
+    delete_image_file.delay('products.Product', 'products/abc.jpg')
+
+delay() inserts a Task row in the caller's transaction, so the task only
+becomes visible to workers once the request commits (and never when it
+rolls back). Arguments must be JSON-serializable: pass ids, not instances.
+A unique task is only queued when the same call isn't waiting already, so
+a task that works through whatever is pending runs once for many events.
+
+`python manage.py run_worker` claims due tasks, runs each one in a
+transaction together with the deletion of its row, and requeues failures
+with exponential backoff (TASK_RETRY_BACKOFF, doubled per attempt, up to
+TASK_RETRY_BACKOFF_MAX) until max_attempts. Claiming uses SELECT ... FOR
+UPDATE SKIP LOCKED where the database has it (Postgres); on SQLite, whose
+writes are serialized anyway, a conditional UPDATE claims one row at a
+time. A claimed task carries a lease (TASK_LEASE_SECONDS): if its worker
+dies, another one takes it over once the lease has expired.
+
+With TASKS_EAGER the function runs in-process right after the commit
+instead (development without a worker).
+
+File: tasks.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class UnknownTask(LookupError):
+    """No function is registered under the task's name"""
+
+
+class LeaseLost(Exception):
+    """The task's lease expired while it ran and another worker took it over"""
+
+
+def background(func=None, *, name=None, max_attempts=None, unique=False):
+    """Register func as a task; adds func.delay(*args, **kwargs) and func.enqueue(...)"""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        _registry[task_name] = func
+
+        def enqueue_task(args=(), kwargs=None, run_at=None):
+            return enqueue(task_name, args, kwargs, run_at=run_at, max_attempts=max_attempts, unique=unique)
+
+        func.task_name = task_name
+        func.enqueue = enqueue_task
+        func.delay = lambda *args, **kwargs: enqueue_task(args, kwargs)
+        return func
+
+    return decorator(func) if func is not None else decorator
+
+
+def get_task(name):
+    """The function registered under name, importing its module if needed"""
+    if name not in _registry:
+        try:
+            import_module(name.rpartition('.')[0])
+        except ImportError:
+            pass
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownTask(f'Unknown task {name}')
+
+
+def enqueue(name, args=(), kwargs=None, run_at=None, max_attempts=None, unique=False):
+    """
+    Queue a call to a registered task; returns the Task, or None when it
+    runs eagerly or (unique) the same call is already queued
+    """
+    func = get_task(name)
+    args, kwargs = list(args), kwargs or {}
+    if settings.TASKS_EAGER:
+        transaction.on_commit(lambda: func(*args, **kwargs), robust=True)
+        return None
+    if unique and Task.objects.filter(name=name, status=Task.STATUS_QUEUED, args=args, kwargs=kwargs).exists():
+        return None
+    return Task.objects.create(
+        name=name, args=args, kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+
+
+def worker_id():
+    """host:pid:thread, stored in locked_by"""
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'[:100]
+
+
+def retry_delay(attempts):
+    """Seconds before the next try after `attempts` failed ones"""
+    return min(settings.TASK_RETRY_BACKOFF * 2 ** (attempts - 1), settings.TASK_RETRY_BACKOFF_MAX)
+
+
+##### Worker side #####
+
+def claim_tasks(worker, limit=1):
+    """Up to limit due tasks, marked as running under worker's lease"""
+    now = timezone.now()
+    due = Q(status=Task.STATUS_QUEUED, run_at__lte=now) | Q(status=Task.STATUS_RUNNING, locked_until__lt=now)
+    claim = {
+        'status': Task.STATUS_RUNNING,
+        'locked_by': worker,
+        'locked_until': now + timedelta(seconds=settings.TASK_LEASE_SECONDS),
+        'attempts': F('attempts') + 1,
+    }
+    candidates = Task.objects.filter(due).order_by('run_at', 'pk')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Task.objects.filter(pk__in=ids).update(**claim)
+    else:
+        # No row locks: each UPDATE only succeeds if the row is still due,
+        # i.e. no other worker claimed it since it was read
+        ids = [
+            pk for pk in candidates.values_list('pk', flat=True)[:limit]
+            if Task.objects.filter(due, pk=pk).update(**claim)
+        ]
+    return list(Task.objects.filter(pk__in=ids, locked_by=worker).order_by('run_at', 'pk'))
+
+
+def run_task(task, worker):
+    """
+    Run one claimed task; returns 'done', 'retry', 'failed' or 'lost'. The call and
+    the deletion of its row commit together, and only while the lease is
+    still this worker's.
+    """
+    owned = Task.objects.filter(pk=task.pk, locked_by=worker)
+    try:
+        func = get_task(task.name)
+        with transaction.atomic():
+            func(*task.args, **task.kwargs)
+            if not owned.delete()[0]:
+                raise LeaseLost(f'Task {task.pk} was taken over by another worker')
+        result = 'done'
+    except LeaseLost as e:
+        logger.warning(str(e))
+        result = 'lost'
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        if isinstance(e, UnknownTask) or task.attempts >= task.max_attempts:
+            owned.update(status=Task.STATUS_FAILED, locked_by='', locked_until=None, last_error=error)
+            logger.error(f'Task {task.name} #{task.pk} failed: {error}')
+            result = 'failed'
+        else:
+            run_at = timezone.now() + timedelta(seconds=retry_delay(task.attempts))
+            owned.update(status=Task.STATUS_QUEUED, run_at=run_at, locked_by='', locked_until=None, last_error=error)
+            logger.warning(f'Task {task.name} #{task.pk} attempt {task.attempts} failed, retrying: {error}')
+            result = 'retry'
+
+    metrics.inc('tasks_total', task=task.name, result=result)
+    return result
+
+
+def run_pending(worker=None, stop=None):
+    """Claim and run due tasks one at a time until there are none (or stop is set); returns {result: count}"""
+    worker = worker or worker_id()
+    results = {}
+    while stop is None or not stop.is_set():
+        tasks = claim_tasks(worker)
+        if not tasks:
+            break
+        for task in tasks:
+            result = run_task(task, worker)
+            results[result] = results.get(result, 0) + 1
+    return results
@@ -0,0 +1,198 @@
+"""
+Shared test fixtures and query-budget assertions for the app test suites
+
+File: testing.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import get_resolver, reverse
+from rest_framework.test import APITestCase
+
+from accounts.models import AuthToken, BrandProfile, UserProfile
+from cart.models import Cart, CartItem
+from orders.models import Order, OrderItem, Payment
+from products.models import Category, Product
+from products.snapshot import catalog_snapshots
+from rewards.models import EcoReward, EcoTransaction
+
+from .cache import clear_all
+from .query_budget import query_budget
+
+PASSWORD = 'Eco-Shop-2025!'
+SHIPPING_ADDRESS = {
+    'street': 'Calle Mayor 1', 'city': 'Madrid', 'state': 'Madrid',
+    'postal_code': '28013', 'country': 'ES',
+}
+
+# Enough rows that an N+1 blows any budget
+PRODUCTS_PER_CATEGORY = 6
+ITEMS_PER_ORDER = 3
+
+
+class EcoShopFixtures:
+    """
+    Realistic data set: customer, brand manager and admin, two categories of
+    products, a filled cart, paid/pending orders, rewards and transactions.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # The DB is rolled back between tests, cached listings are not
+        clear_all()
+        catalog_snapshots.reset()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.customer = cls.create_user('customer', eco_points=2000)
+        cls.brand_manager = cls.create_user('brand_manager', is_brand_manager=True)
+        cls.admin = cls.create_user('admin', is_staff=True, is_superuser=True)
+        cls.brand = BrandProfile.objects.create(
+            user_profile=cls.brand_manager.userprofile,
+            brand_name='Green Brand',
+            sustainability_story='Plastic free since 2020',
+        )
+
+        cls.categories = [
+            Category.objects.create(name='Shampoo', slug='shampoo'),
+            Category.objects.create(name='Soap', slug='soap'),
+        ]
+        cls.products = []
+        for category in cls.categories:
+            for index in range(PRODUCTS_PER_CATEGORY):
+                cls.products.append(Product.objects.create(
+                    name=f'{category.name} {index}',
+                    slug=f'{category.slug}-{index}',
+                    description='Natural ingredients',
+                    brand=cls.brand,
+                    category=category,
+                    price=Decimal('9.90') + index,
+                    stock=100,
+                    ingredient_main='aloe',
+                    base_type='plant_based' if index % 2 else 'water_based',
+                    packaging_material='glass_container',
+                    origin_country='ESP',
+                    weight=250,
+                    transportation_type='land',
+                    carbon_footprint=1.5 + index,
+                    eco_badge='🌱 low Impact',
+                ))
+        cls.product = cls.products[0]
+
+        cls.cart = Cart.objects.create(user=cls.customer)
+        cls.cart_items = [
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=2)
+            for product in cls.products[:4]
+        ]
+
+        cls.orders = [cls.create_order(cls.customer, number) for number in range(3)]
+        cls.pending_order = cls.orders[0]
+        cls.payment = Payment.objects.create(
+            order=cls.orders[1], payment_method='stripe', amount=cls.orders[1].total_amount, status='paid'
+        )
+        Payment.objects.create(
+            order=cls.orders[2], payment_method='stripe', amount=cls.orders[2].total_amount
+        )
+
+        cls.rewards = [
+            EcoReward.objects.create(
+                name=f'Reward {points}', description='Discount', points_required=points, reward_type='discount'
+            )
+            for points in (100, 500, 1000, 5000)
+        ]
+        for points in (10, 20, 30, 40, 50):
+            EcoTransaction.objects.create(
+                user=cls.customer, order=cls.orders[1], points_earned=points,
+                action_type='review', carbon_saved=points * 0.01,
+            )
+
+    @staticmethod
+    def create_user(username, eco_points=0, is_brand_manager=False, **extra):
+        user = User.objects.create_user(
+            username=username, email=f'{username}@example.com', password=PASSWORD,
+            first_name=username.title(), **extra
+        )
+        UserProfile.objects.create(user=user, eco_points=eco_points, is_brand_manager=is_brand_manager)
+        return user
+
+    @classmethod
+    def create_order(cls, user, number):
+        order = Order.objects.create(
+            user=user, order_number=f'ORD-TEST{number}', status='pending',
+            total_amount=Decimal('0.00'), shipping_address=SHIPPING_ADDRESS,
+        )
+        total = Decimal('0.00')
+        for product in cls.products[:ITEMS_PER_ORDER]:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=1,
+                price=product.price, carbon_footprint=product.carbon_footprint,
+            )
+            total += product.price
+        order.total_amount = total
+        order.save()
+        return order
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class QueryBudgetTestCase(EcoShopFixtures, APITestCase):
+    """
+    Base class for the per-app route budget suites.
+
+    `route_budgets` maps URL name -> HTTP method -> max number of queries a
+    request may run (authentication, session and savepoints included).
+    `assertRoutesHaveBudgets` checks that every route served by the app's
+    views has an entry, so new endpoints cannot skip the budget.
+    """
+
+    app_label = None
+    route_budgets = {}
+
+    def login(self, user):
+        """Authenticate the client with a real token (as the frontend does)"""
+        self.client.credentials()
+        if user is not None:
+            token = AuthToken.issue(user)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def call_route(self, method, url_name, kwargs=None, data=None, query=None, user=None, status_code=None):
+        """Request a route and fail if it exceeds its budget"""
+        self.login(user)
+        url = reverse(url_name, kwargs=kwargs)
+        if query:
+            url = f'{url}?{urlencode(query)}'
+
+        max_queries = self.route_budgets[url_name][method]
+        with query_budget(max_queries, label=f'{method.upper()} {url}', enforce=True):
+            response = getattr(self.client, method)(url, data, format='json')
+
+        if status_code is not None:
+            self.assertEqual(response.status_code, status_code, getattr(response, 'data', response.content))
+        return response
+
+    def assertRoutesHaveBudgets(self):
+        missing = sorted(app_route_names(self.app_label) - set(self.route_budgets))
+        self.assertFalse(missing, f'Routes without a query budget: {missing}')
+
+
+def app_route_names(app_label):
+    """URL names of every route whose view is defined in `app_label`"""
+    names = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if hasattr(pattern, 'url_patterns'):
+                walk(pattern.url_patterns)
+                continue
+            view = getattr(pattern.callback, 'cls', pattern.callback)
+            if pattern.name and view.__module__.split('.')[0] == app_label:
+                names.add(pattern.name)
+
+    walk(get_resolver().url_patterns)
+    return names
@@ -0,0 +1,195 @@
+"""
+Description: Tests for the cross-app infrastructure (metrics, performance instrumentation, API schema)
+
+File: tests.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+from .metrics import MetricsRegistry, metrics_view, render
+from .middleware import PerformanceMiddleware
+from .perf import LatencyRegistry
+from .schema import generate_schema, schema_document, schema_info, write_schema_file
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_prometheus_text_format(self):
+        counters = {
+            ('checkout_total', (('result', 'ok'),)): 3,
+            ('cache_requests_total', (('cache', 'products'), ('result', 'hit'))): 3,
+            ('cache_requests_total', (('cache', 'products'), ('result', 'miss'))): 1,
+            ('http_requests_total', (('view', 'Say "hi"\\n'),)): 1,
+        }
+        # Buckets 0, 1, 2, 5, ... 100, +Inf, then the sum
+        histograms = {('http_request_db_queries', (('view', 'V.list'),)): [1, 0, 2, 0, 0, 0, 0, 0, 0, 7]}
+        lines = render(counters, histograms).splitlines()
+
+        for line in (
+            '# HELP checkout_total Checkouts per result',
+            '# TYPE checkout_total counter',
+            'checkout_total{result="ok"} 3',
+            'http_requests_total{view="Say \\"hi\\"\\\\n"} 1',
+            '# TYPE cache_hit_ratio gauge',
+            'cache_hit_ratio{cache="products"} 0.75',
+            '# TYPE http_request_db_queries histogram',
+            'http_request_db_queries_bucket{view="V.list",le="0"} 1',
+            'http_request_db_queries_bucket{view="V.list",le="1"} 1',
+            'http_request_db_queries_bucket{view="V.list",le="2"} 3',
+            'http_request_db_queries_bucket{view="V.list",le="+Inf"} 3',
+            'http_request_db_queries_sum{view="V.list"} 7',
+            'http_request_db_queries_count{view="V.list"} 3',
+        ):
+            self.assertIn(line, lines)
+
+    def test_collect_merges_every_worker(self):
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir):
+            registry = MetricsRegistry()
+            registry.inc('checkout_total', result='ok')
+            registry.observe('http_request_db_queries', 2, view='V.list')
+
+            # Another worker's flush, and one of a worker gone long ago
+            other = {
+                'counters': [['checkout_total', [['result', 'ok']], 2], ['checkout_total', [['result', 'error']], 1]],
+                'histograms': [['http_request_db_queries', [['view', 'V.list']], [0, 0, 1, 0, 0, 0, 0, 0, 0, 2]]],
+            }
+            with open(os.path.join(metrics_dir, 'metrics-1-1.json'), 'w') as fh:
+                json.dump(other, fh)
+            stale = os.path.join(metrics_dir, 'metrics-2-1.json')
+            with open(stale, 'w') as fh:
+                json.dump(other, fh)
+            os.utime(stale, (time.time() - 2 * 86400,) * 2)
+
+            counters, histograms = registry.collect()
+
+        self.assertEqual(counters[('checkout_total', (('result', 'ok'),))], 3)
+        self.assertEqual(counters[('checkout_total', (('result', 'error'),))], 1)
+        self.assertEqual(histograms[('http_request_db_queries', (('view', 'V.list'),))], [0, 0, 2, 0, 0, 0, 0, 0, 0, 4])
+        self.assertFalse(os.path.exists(stale))
+
+    def scrape(self, **headers):
+        return metrics_view(RequestFactory().get('/metrics', **headers))
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_metrics_need_a_token_in_production(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.scrape().status_code, 200)
+
+    @override_settings(METRICS_TOKEN='s3cret', METRICS_DIR='')
+    def test_metrics_token(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+@override_settings(METRICS_ENABLED=False)
+class PerformanceMiddlewareTests(TestCase):
+
+    def run_view(self, queries=0):
+        def view(request):
+            for _ in range(queries):
+                User.objects.exists()
+            return HttpResponse('ok')
+        return PerformanceMiddleware(view)(RequestFactory().get('/api/products/'))
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_server_timing_counts_queries(self):
+        timing = self.run_view(queries=3)['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="3 queries", serialize;dur=[\d.]+$')
+
+    @override_settings(PERF_SERVER_TIMING=False)
+    def test_server_timing_is_opt_in(self):
+        self.assertFalse(self.run_view().has_header('Server-Timing'))
+
+    @override_settings(PERF_SLOW_REQUEST_MS=500)
+    def test_only_slow_requests_log_at_info(self):
+        with self.assertLogs('core.perf', 'DEBUG') as logs:
+            self.run_view(queries=1)
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+        self.assertEqual(logs.records[0].perf['db_queries'], 1)
+
+        with self.settings(PERF_SLOW_REQUEST_MS=0), self.assertLogs('core.perf', 'INFO') as logs:
+            self.run_view(queries=1)
+        self.assertEqual([record.levelname for record in logs.records], ['INFO'])
+
+
+class LatencyRegistryTests(SimpleTestCase):
+
+    def test_summary_sorted_by_p95(self):
+        registry = LatencyRegistry(sample_size=100)
+        for ms in range(1, 101):
+            registry.record('products-list', ms / 1000)
+        registry.record('orders-list', 0.5)
+
+        summary = registry.summary()
+        self.assertEqual(list(summary), ['orders-list', 'products-list'])
+        self.assertEqual(summary['products-list'], {'count': 100, 'p50_ms': 51.0, 'p95_ms': 95.0, 'p99_ms': 99.0})
+
+        registry.reset()
+        self.assertEqual(registry.summary(), {})
+
+    def test_samples_are_bounded(self):
+        registry = LatencyRegistry(sample_size=10)
+        for ms in range(1, 101):
+            registry.record('products-list', ms / 1000)
+
+        # Counts every request, percentiles over the latest 10
+        self.assertEqual(registry.summary()['products-list']['count'], 100)
+        self.assertEqual(registry.summary()['products-list']['p50_ms'], 95.0)
+
+
+class SchemaTests(SimpleTestCase):
+
+    def setUp(self):
+        schema_document.reset()
+        self.addCleanup(schema_document.reset)
+
+    def test_served_schema_is_drf_yasg_schema(self):
+        served = json.loads(self.client.get(reverse('schema-json')).content)
+
+        view = get_schema_view(schema_info(), public=True, permission_classes=[permissions.AllowAny])
+        response = view.without_ui(cache_timeout=0)(RequestFactory().get('/swagger.json'), format='.json')
+        response.render()
+        expected = json.loads(response.content)
+        # drf_yasg's view adds the requesting host; the served document has none on purpose
+        del expected['host'], expected['schemes']
+        self.assertEqual(served, expected)
+
+    def test_schema_is_built_once_per_process(self):
+        with mock.patch('core.schema.generate_schema', wraps=generate_schema) as generate:
+            first = self.client.get(reverse('schema-json'))
+            for name in ('schema-json', 'schema-swagger-ui', 'schema-redoc'):
+                self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+        self.assertEqual(generate.call_count, 1)
+
+        version = first['ETag'].strip('"')
+        self.assertIn(f'swagger.json?v={version}', self.client.get(reverse('schema-swagger-ui')).content.decode())
+        self.assertEqual(self.client.get(reverse('schema-json'), HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertIn('immutable', self.client.get(reverse('schema-json'), {'v': version})['Cache-Control'])
+
+    @override_settings(DEBUG=False)
+    def test_schema_file_is_served_without_generating(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'openapi.json')
+            version = write_schema_file(path)
+            with override_settings(API_SCHEMA_FILE=path), mock.patch('core.schema.generate_schema') as generate:
+                response = self.client.get(reverse('schema-json'))
+        generate.assert_not_called()
+        self.assertEqual(response['ETag'], f'"{version}"')
+        self.assertEqual(response.content, generate_schema())
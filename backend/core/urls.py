@@ -16,23 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import HttpResponse
-
-# Swagger schema view
-schema_view = get_schema_view(
-    openapi.Info(
-        title="EcoShop API",
-        default_version='v1',
-        description="API for EcoShop project",
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from core.metrics import metrics_view
+from core.schema import redoc_view, schema_json_view, swagger_ui_view
 
 
 def home(request):
@@ -41,6 +29,7 @@ def home(request):
 urlpatterns = [
     path('', home),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('accounts.urls')),
     path('api/', include('products.urls')), 
     path('api/', include('cart.urls')),  
@@ -48,9 +37,10 @@ urlpatterns = [
     path('api/rewards/', include('rewards.urls')),  
 
     
-    # API Documentation
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    # API Documentation (schema generated once, see core/schema.py)
+    path('swagger.json', schema_json_view, name='schema-json'),
+    path('swagger/', swagger_ui_view, name='schema-swagger-ui'),
+    path('redoc/', redoc_view, name='schema-redoc'),
 ]
 # Serve media files during development
 if settings.DEBUG:
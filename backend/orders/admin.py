@@ -8,7 +8,7 @@ Created: 2025-12-01
 """
 
 from django.contrib import admin
-from .models import Order, OrderItem, Payment
+from .models import Order, OrderItem, Payment, PaymentEvent
 from django.utils.html import format_html
 from django.urls import reverse
 
@@ -197,3 +197,16 @@ class PaymentAdmin(admin.ModelAdmin):
         return format_html('<a href="{}">{}</a>', url, obj.order.order_number)
     order_link.short_description = "Order"
     order_link.allow_tags = True
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    """Read-only view of the payment webhook inbox"""
+    
+    list_display = ['id', 'payment_id', 'event_id', 'received_at', 'processed_at', 'attempts', 'error']
+    list_filter = ['processed_at']
+    search_fields = ['=payment_id', 'event_id']
+    readonly_fields = [field.name for field in PaymentEvent._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
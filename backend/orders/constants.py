@@ -44,6 +44,12 @@ PAYMENT_STATUS_CHOICES = [
     (PAYMENT_STATUS_CANCELLED, 'Cancelled'),
 ]
 
+# Payment webhooks (PaymentEvent inbox)
+WEBHOOK_EVENT_ID_HEADER = 'X-Event-Id'  # provider's event id, used to drop redeliveries
+PAYMENT_EVENT_MAX_ATTEMPTS = 5          # then the event is set aside with its error
+PAYMENT_EVENT_RETRY_BACKOFF = 30        # seconds before the first retry, doubled per attempt
+PAYMENT_EVENT_RETRY_BACKOFF_MAX = 3600
+
 # Limits
 MAX_TRANSACTION_ID_LENGTH = 100
 MAX_ORDER_NUMBER_LENGTH = 20
@@ -63,4 +69,5 @@ SUCCESS_ORDER_CREATED = "Order created successfully"
 SUCCESS_ORDER_CANCELLED = "Order cancelled successfully"
 SUCCESS_PAYMENT_CREATED = "Payment created successfully"
 SUCCESS_PAYMENT_UPDATED = "Payment updated successfully"
+SUCCESS_PAYMENT_EVENT_RECEIVED = "Payment event received"
 SUCCESS_ORDER_STATUS_UPDATED = "Order status updated successfully"
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Worker for the payment webhook inbox (PaymentEvent): applies pending events
+in batches, in arrival order per payment, each in its own transaction, then
+sleeps while nothing is due
+
+    python manage.py process_payment_events            # run forever
+    python manage.py process_payment_events --once     # drain and exit (cron)
+
+Several workers can run side by side (rows are claimed with SKIP LOCKED).
+
+File: process_payment_events.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import metrics
+from orders.services import PaymentEventService
+
+
+class Command(BaseCommand):
+    help = 'Apply pending payment webhook events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the inbox is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the inbox is empty')
+
+    def handle(self, *args, **options):
+        service = PaymentEventService()
+        totals = {}
+
+        try:
+            while True:
+                results = service.process_batch(options['batch_size'])
+                for result, count in results.items():
+                    totals[result] = totals.get(result, 0) + count
+                metrics.registry.maybe_flush()
+
+                # Only events left for a retry: don't spin on them
+                if not results or set(results) == {'retry'}:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            metrics.registry.flush()
+
+        summary = ', '.join(f'{count} {result}' for result, count in sorted(totals.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Payment events: {summary}'))
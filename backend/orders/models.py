@@ -17,9 +17,17 @@ class Order(models.Model):
     # Dirección de envío
     shipping_address = models.JSONField()  # Almacena dirección como JSON
     
+    # Paid, purchase points not awarded yet (rewards.tasks.award_purchase_points)
+    points_pending = models.BooleanField(default=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(points_pending=True), name='order_points_pending'),
+        ]
+    
     def __str__(self):
         return f"Order {self.order_number} - {self.user.username}"
 
@@ -54,3 +62,34 @@ class Payment(models.Model):
     
     def __str__(self):
         return f"Payment for Order {self.order.order_number}"
+
+
+class PaymentEvent(models.Model):
+    """
+    Inbox of payment webhooks: each event is stored as received (one insert,
+    duplicates dropped by the unique constraint) and applied later, in
+    order per payment, by `python manage.py process_payment_events`
+    """
+    # Plain id, not a FK: ingestion must not read or lock the payment row
+    payment_id = models.PositiveIntegerField()
+    event_id = models.CharField(max_length=255)   # provider event id, or transaction_id:status:<body hash>
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)  # retries back off
+    error = models.TextField(blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['payment_id', 'event_id'], name='unique_payment_event'),
+        ]
+        indexes = [
+            # The worker's queue: only unprocessed events, oldest per payment first
+            models.Index(
+                fields=['payment_id', 'id'], condition=models.Q(processed_at__isnull=True), name='payment_event_pending',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Payment {self.payment_id} event {self.event_id}"
@@ -12,6 +12,7 @@ from django.contrib.auth.models import User
 from .models import Order, OrderItem, Payment
 from products.models import Product
 from .constants import *
+from core.sparse import SparseFieldsMixin
 import json
 
 
@@ -45,7 +46,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 ##### Order Serializers #####
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Formatting ONLY for order output"""
     items = OrderItemSerializer(many=True, read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
@@ -62,19 +63,19 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = fields
     
+    sparse_sources = {
+        'payment_status': ['payment__status'],
+        'payment_method': ['payment__payment_method'],
+    }
+    
     def get_payment_status(self, obj):
-        try:
-            payment = Payment.objects.get(order=obj)
-            return payment.status
-        except Payment.DoesNotExist:
-            return 'unpaid'
+        # Reverse one-to-one: cached by select_related('payment') in the services
+        payment = getattr(obj, 'payment', None)
+        return payment.status if payment else 'unpaid'
     
     def get_payment_method(self, obj):
-        try:
-            payment = Payment.objects.get(order=obj)
-            return payment.payment_method
-        except Payment.DoesNotExist:
-            return None
+        payment = getattr(obj, 'payment', None)
+        return payment.payment_method if payment else None
 
 
 class OrderCreateSerializer(serializers.Serializer):
@@ -8,12 +8,16 @@ Last Updated: 2025-12-05
 """
 
 from django.db import transaction
+from django.db.models import Min, Q, Subquery
 from django.contrib.auth.models import User
 from django.utils import timezone
-from .models import Order, OrderItem, Payment
+from .models import Order, OrderItem, Payment, PaymentEvent
 from products.models import Product
 from .constants import *
 import uuid
+from datetime import timedelta
+from core import metrics
+from rewards.tasks import queue_purchase_points
 
 
 class BusinessException(Exception):
@@ -21,6 +25,11 @@ class BusinessException(Exception):
     pass
 
 
+def orders_for_serializer(queryset):
+    """Everything OrderSerializer reads, fetched in a constant number of queries"""
+    return queryset.select_related('user', 'payment').prefetch_related('items__product__brand')
+
+
 class OrderService:
     """
     Service ONLY for complex order operations
@@ -70,16 +79,19 @@ class OrderService:
         """
         Get all orders for a user
         """
-        return Order.objects.filter(user=user).order_by('-created_at')
+        return orders_for_serializer(Order.objects.filter(user=user).order_by('-created_at'))
     
-    def get_order_by_id(self, user, order_id):
+    def get_order_by_id(self, user, order_id, queryset=None):
         """
         Get specific order with permission check
+        queryset narrows the default orders_for_serializer() one (must load user)
         """
+        if queryset is None:
+            queryset = orders_for_serializer(Order.objects.all())
         try:
-            order = Order.objects.get(id=order_id)
+            order = queryset.get(id=order_id)
             # Check permission
-            if order.user != user and not user.is_staff:
+            if order.user_id != user.id and not user.is_staff:
                 raise BusinessException(ERROR_INSUFFICIENT_PERMISSION)
             return order
         except Order.DoesNotExist:
@@ -168,9 +180,11 @@ class PaymentService:
         if status == PAYMENT_STATUS_PAID:
             payment.paid_at = timezone.now()
             
-            # Update order status
+            # Update order status; purchase points are awarded in the background
             order.status = ORDER_STATUS_PAID
+            order.points_pending = True
             order.save()
+            queue_purchase_points()
         
         elif status == PAYMENT_STATUS_CANCELLED:
             # Optionally update order status if payment cancelled
@@ -179,6 +193,7 @@ class PaymentService:
                 order.save()
         
         payment.save()
+        transaction.on_commit(lambda: metrics.inc('payments_total', status=status))
         
         return payment, order
     
@@ -192,6 +207,109 @@ class PaymentService:
             return None
 
 
+class PaymentEventService:
+    """
+    Payment webhook inbox: record() is all the webhook request does;
+    process_batch() (process_payment_events worker) applies the events
+    """
+    
+    def record(self, payment_id, event_id, payload):
+        """
+        Store a webhook event: one INSERT, redeliveries are dropped silently.
+        Unknown payments are refused up front (one primary key lookup) so
+        they never reach the inbox
+        """
+        if not Payment.objects.filter(pk=payment_id).exists():
+            raise BusinessException(ERROR_PAYMENT_NOT_FOUND)
+        PaymentEvent.objects.bulk_create(
+            [PaymentEvent(payment_id=payment_id, event_id=event_id, payload=payload)],
+            ignore_conflicts=True,
+        )
+    
+    def process_batch(self, batch_size=100):
+        """
+        Apply up to batch_size due events, each in its own short transaction
+        so payment/order locks are held for one event only. Events of one
+        payment are applied in arrival order: only the oldest pending event
+        of each payment is taken, so a later status waits while an earlier
+        one is backing off. Concurrent workers skip each other's rows.
+        Returns {result: count}.
+        """
+        now = timezone.now()
+        heads = (
+            PaymentEvent.objects.filter(processed_at=None)
+            .values('payment_id').annotate(head=Min('pk')).values('head')
+        )
+        event_ids = list(
+            PaymentEvent.objects.filter(pk__in=Subquery(heads))
+            .filter(Q(next_attempt_at=None) | Q(next_attempt_at__lte=now))
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        
+        results = {}
+        for event_id in event_ids:
+            result = self._process_event(event_id)
+            if result is not None:
+                results[result] = results.get(result, 0) + 1
+        
+        for result, count in results.items():
+            metrics.inc('payment_events_total', count, result=result)
+        return results
+    
+    @transaction.atomic
+    def _process_event(self, event_id):
+        """One event and its bookkeeping, committed together; None if another worker has it"""
+        event = (
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(pk=event_id, processed_at=None).first()
+        )
+        if event is None:
+            return None
+        
+        try:
+            with transaction.atomic():
+                result = self.apply(event)
+            event.error = ''
+        except BusinessException as e:
+            # Permanent (unknown payment...): set aside with the reason
+            result, event.error = 'rejected', str(e)
+        except Exception as e:
+            event.attempts += 1
+            event.error = f"{type(e).__name__}: {e}"
+            if event.attempts < PAYMENT_EVENT_MAX_ATTEMPTS:
+                delay = min(PAYMENT_EVENT_RETRY_BACKOFF * 2 ** (event.attempts - 1), PAYMENT_EVENT_RETRY_BACKOFF_MAX)
+                event.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+                event.save(update_fields=['attempts', 'next_attempt_at', 'error'])
+                return 'retry'
+            result = 'failed'
+        
+        event.processed_at = timezone.now()
+        event.save(update_fields=['processed_at', 'attempts', 'error'])
+        return result
+    
+    def apply(self, event):
+        """
+        One event's status transition and its effects, idempotently: a
+        redelivered or late event (e.g. 'pending' after 'paid') changes nothing.
+        A cancellation is still applied after 'paid' (refund/chargeback): the
+        payment becomes cancelled while the paid order is left to the admin
+        """
+        status = event.payload['status']
+        transaction_id = event.payload.get('transaction_id', '')
+        try:
+            payment = Payment.objects.select_for_update().select_related('order').get(pk=event.payment_id)
+        except Payment.DoesNotExist:
+            raise BusinessException(ERROR_PAYMENT_NOT_FOUND)
+        
+        if (payment.status == PAYMENT_STATUS_PAID and status != PAYMENT_STATUS_CANCELLED) or (
+            payment.status == status and payment.transaction_id == transaction_id
+        ):
+            return 'ignored'
+        
+        PaymentService().update_payment_status(payment.order, transaction_id, status)
+        return 'applied'
+
+
 class AdminOrderService:
     """
     Service ONLY for admin order operations
@@ -203,7 +321,7 @@ class AdminOrderService:
         Complex operation: Admin updates order status
         """
         try:
-            order = Order.objects.get(id=order_id)
+            order = orders_for_serializer(Order.objects.all()).get(id=order_id)
         except Order.DoesNotExist:
             raise BusinessException(ERROR_ORDER_NOT_FOUND)
         
@@ -230,7 +348,7 @@ class AdminOrderService:
         """
         Get all orders with optional filters
         """
-        queryset = Order.objects.all().order_by('-created_at')
+        queryset = orders_for_serializer(Order.objects.all()).order_by('-created_at')
         
         if filters:
             status = filters.get('status')
@@ -1,3 +1,190 @@
-from django.test import TestCase
+"""
+Description: Query budget tests for order and payment routes
 
-# Create your tests here.
+File: tests.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from core.models import Task
+from core.tasks import run_pending
+from core.testing import QueryBudgetTestCase
+from orders.models import Payment, PaymentEvent
+from orders.services import PaymentEventService, PaymentService
+from rewards.models import EcoTransaction
+
+
+class OrderRouteBudgetTests(QueryBudgetTestCase):
+    app_label = 'orders'
+    route_budgets = {
+        'user-order-list': {'get': 5},
+        'user-order-detail': {'get': 5},
+        'user-order-cancel': {'post': 13},
+        'user-order-status-history': {'get': 5},
+        'user-order-payment-info': {'get': 7},
+        'create-payment': {'post': 11},
+        'payment-webhook': {'post': 2},
+        'admin-order-list': {'get': 5},
+        'admin-order-update-status': {'put': 10},
+        'admin-order-statistics': {'get': 7},
+    }
+
+    def test_routes_have_budgets(self):
+        self.assertRoutesHaveBudgets()
+
+    def test_order_list(self):
+        response = self.call_route('get', 'user-order-list', user=self.customer, status_code=200)
+        self.assertEqual(len(response.data), len(self.orders))
+        self.assertEqual({order['payment_status'] for order in response.data}, {'unpaid', 'paid', 'pending'})
+
+    def test_order_retrieve(self):
+        self.call_route('get', 'user-order-detail', kwargs={'pk': self.orders[1].pk}, user=self.customer, status_code=200)
+
+    def test_order_sparse_fields(self):
+        response = self.call_route(
+            'get', 'user-order-list', query={'fields': 'order_number,payment_status'}, user=self.customer, status_code=200,
+        )
+        self.assertEqual([list(order) for order in response.data], [['order_number', 'payment_status']] * len(self.orders))
+        self.assertEqual({order['payment_status'] for order in response.data}, {'unpaid', 'paid', 'pending'})
+
+        response = self.call_route(
+            'get', 'user-order-detail', kwargs={'pk': self.orders[1].pk}, query={'omit': 'items,email'},
+            user=self.customer, status_code=200,
+        )
+        self.assertNotIn('items', response.data)
+        self.assertEqual(response.data['username'], self.customer.username)
+
+    def test_order_cancel(self):
+        self.call_route(
+            'post', 'user-order-cancel', kwargs={'pk': self.pending_order.pk},
+            data={'reason': 'Changed my mind'}, user=self.customer, status_code=200,
+        )
+
+    def test_status_history(self):
+        self.call_route(
+            'get', 'user-order-status-history', kwargs={'pk': self.pending_order.pk}, user=self.customer, status_code=200
+        )
+
+    def test_payment_info(self):
+        self.call_route(
+            'get', 'user-order-payment-info', kwargs={'pk': self.orders[1].pk}, user=self.customer, status_code=200
+        )
+
+    def test_create_payment(self):
+        self.call_route(
+            'post', 'create-payment', kwargs={'order_id': self.pending_order.pk},
+            data={'payment_method': 'stripe'}, user=self.customer, status_code=200,
+        )
+
+    def test_create_payment_idempotency_key(self):
+        self.login(self.customer)
+        url = reverse('create-payment', kwargs={'order_id': self.pending_order.pk})
+        first = self.client.post(url, {'payment_method': 'stripe'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        retry = self.client.post(url, {'payment_method': 'stripe'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        self.assertEqual((first.status_code, retry.status_code), (200, 200))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Payment.objects.filter(order=self.pending_order).count(), 1)
+
+        # Same key, another order: a different request
+        other = reverse('create-payment', kwargs={'order_id': self.orders[2].pk})
+        self.assertEqual(self.client.post(other, {'payment_method': 'stripe'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1').status_code, 422)
+
+    def test_payment_webhook(self):
+        self.call_route(
+            'post', 'payment-webhook', kwargs={'payment_id': self.payment.pk},
+            data={'transaction_id': 'txn_1', 'status': 'paid'}, status_code=200,
+        )
+
+    def webhook(self, payment_id, status, transaction_id='txn_2', **headers):
+        return self.client.post(
+            reverse('payment-webhook', kwargs={'payment_id': payment_id}),
+            {'transaction_id': transaction_id, 'status': status}, format='json', **headers,
+        )
+
+    def test_payment_events_are_applied_once(self):
+        order = self.orders[2]
+        payment = order.payment
+        points = UserProfile.objects.get(user=self.customer).eco_points
+
+        # Redelivery (same event) is dropped at ingestion; a late 'pending' is ignored when applied
+        for _ in range(2):
+            self.assertEqual(self.webhook(payment.pk, 'paid').status_code, 200)
+        self.webhook(payment.pk, 'pending', HTTP_X_EVENT_ID='evt_late')
+        self.assertEqual(self.webhook(999999, 'paid').status_code, 404)
+        self.assertEqual(PaymentEvent.objects.count(), 2)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+        out = StringIO()
+        call_command('process_payment_events', '--once', stdout=out)
+        self.assertIn('1 applied, 1 ignored', out.getvalue())
+
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual((payment.status, payment.transaction_id, order.status), ('paid', 'txn_2', 'paid'))
+        # Purchase points come from the (delayed) background task
+        self.assertFalse(EcoTransaction.objects.filter(order=order, action_type='purchase').exists())
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), {'done': 1})
+        self.assertEqual(EcoTransaction.objects.filter(order=order, action_type='purchase').count(), 1)
+        self.assertGreater(UserProfile.objects.get(user=self.customer).eco_points, points)
+        self.assertFalse(PaymentEvent.objects.filter(processed_at=None).exists())
+
+    def test_payment_event_errors_are_retried(self):
+        self.webhook(self.orders[2].payment.pk, 'paid')
+        with mock.patch.object(PaymentService, 'update_payment_status', side_effect=RuntimeError('db down')):
+            self.assertEqual(PaymentEventService().process_batch(), {'retry': 1})
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.processed_at, event.attempts, event.error), (None, 1, 'RuntimeError: db down'))
+        self.assertGreater(event.next_attempt_at, timezone.now())
+
+        # Backing off, then due again
+        self.assertEqual(PaymentEventService().process_batch(), {})
+        PaymentEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(PaymentEventService().process_batch(), {'applied': 1})
+
+    def test_payment_events_wait_for_earlier_ones(self):
+        payment = self.orders[2].payment
+        self.webhook(payment.pk, 'paid', HTTP_X_EVENT_ID='evt_1')
+        self.webhook(payment.pk, 'cancelled', HTTP_X_EVENT_ID='evt_2')
+        with mock.patch.object(PaymentService, 'update_payment_status', side_effect=RuntimeError('db down')):
+            self.assertEqual(PaymentEventService().process_batch(), {'retry': 1})
+        # evt_2 isn't applied ahead of evt_1
+        self.assertEqual(PaymentEventService().process_batch(), {})
+        self.assertEqual(PaymentEvent.objects.filter(processed_at=None).count(), 2)
+
+        PaymentEvent.objects.update(next_attempt_at=None)
+        self.assertEqual(PaymentEventService().process_batch(), {'applied': 1})
+        # A cancellation after payment (refund) still applies; the paid order is kept
+        self.assertEqual(PaymentEventService().process_batch(), {'applied': 1})
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.order.status), ('cancelled', 'paid'))
+
+    def test_repeated_status_without_event_id_is_kept(self):
+        payment = self.orders[2].payment
+        url = reverse('payment-webhook', kwargs={'payment_id': payment.pk})
+        for status, sent_at in (('pending', 1), ('cancelled', 2), ('pending', 3), ('pending', 3)):
+            self.client.post(url, {'transaction_id': 'txn_9', 'status': status, 'sent_at': sent_at}, format='json')
+        # Only the identical redelivery is dropped
+        self.assertEqual(PaymentEvent.objects.filter(payment_id=payment.pk).count(), 3)
+
+    def test_admin_order_list(self):
+        response = self.call_route('get', 'admin-order-list', user=self.admin, status_code=200)
+        self.assertEqual(len(response.data), len(self.orders))
+
+    def test_admin_update_status(self):
+        self.call_route(
+            'put', 'admin-order-update-status', kwargs={'pk': self.orders[1].pk},
+            data={'status': 'paid'}, user=self.admin, status_code=200,
+        )
+
+    def test_admin_statistics(self):
+        self.call_route('get', 'admin-order-statistics', user=self.admin, status_code=200)
@@ -7,6 +7,9 @@ Created: 2025-12-05
 Last Updated: 2025-12-05
 """
 
+import hashlib
+import json
+
 from rest_framework import generics, viewsets, status, mixins
 from rest_framework.views import APIView
 from rest_framework.decorators import action, permission_classes
@@ -18,8 +21,13 @@ from django.shortcuts import get_object_or_404
 
 from .models import Order, OrderItem, Payment
 from .serializers import *
-from .services import OrderService, PaymentService, AdminOrderService, BusinessException
+from .services import (
+    OrderService, PaymentService, PaymentEventService, AdminOrderService, BusinessException, orders_for_serializer,
+)
 from .constants import *
+from core.idempotency import idempotency_key_parameter, idempotent
+from core.query_budget import query_budget
+from core.sparse import sparse_only
 
 
 ##### User Order Views (ViewSet for comprehensive order operations) #####
@@ -40,20 +48,23 @@ class OrderViewSet(viewsets.ViewSet):
             return Order.objects.none()
         return Order.objects.all()
     
+    @query_budget(4)
     def list(self, request):
         """✅ Get all orders for current user"""
         order_service = self._get_order_service()
-        orders = order_service.get_user_orders(request.user)
-        serializer = OrderSerializer(orders, many=True)
+        orders = sparse_only(order_service.get_user_orders(request.user), OrderSerializer, request)
+        serializer = OrderSerializer(orders, many=True, context={'request': request})
         return Response(serializer.data)
     
     def retrieve(self, request, pk=None):
         """✅ Get specific order details"""
         order_service = self._get_order_service()
+        # ?fields= / ?omit=: the ownership check still needs user
+        orders = sparse_only(orders_for_serializer(Order.objects.all()), OrderSerializer, request, required=['user'])
         
         try:
-            order = order_service.get_order_by_id(request.user, pk)
-            serializer = OrderSerializer(order)
+            order = order_service.get_order_by_id(request.user, pk, orders)
+            serializer = OrderSerializer(order, context={'request': request})
             return Response(serializer.data)
         except BusinessException as e:
             return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
@@ -123,7 +134,8 @@ class CreatePaymentView(APIView):
     """✅ APIView for creating payment for an order"""
     permission_classes = [IsAuthenticated]
     
-    @swagger_auto_schema(request_body=PaymentCreateSerializer)
+    @swagger_auto_schema(request_body=PaymentCreateSerializer, manual_parameters=[idempotency_key_parameter()])
+    @idempotent('payment')
     @transaction.atomic
     def post(self, request, order_id):
         serializer = PaymentCreateSerializer(data=request.data)
@@ -172,40 +184,48 @@ class CreatePaymentView(APIView):
         return f"/api/payments/{payment.id}/process/"
 
 
+def _body_hash(data):
+    """Short hash of the whole webhook body, fields this API doesn't read included"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
 class PaymentWebhookView(APIView):
     """✅ APIView for payment webhooks/callbacks (external services)"""
     permission_classes = [AllowAny]  # Webhooks don't require authentication
     
     @swagger_auto_schema(request_body=PaymentUpdateSerializer)
-    @transaction.atomic
     def post(self, request, payment_id):
+        """
+        Only records the event (one lookup and one INSERT, no lock on the order
+        or payment) and answers right away; process_payment_events applies it.
+        Unknown payments get a 404
+        """
         serializer = PaymentUpdateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        payment_service = PaymentService()
-        
+        payload = {
+            'transaction_id': serializer.validated_data.get('transaction_id', ''),
+            'status': serializer.validated_data['status'],
+        }
+        # Without the provider's id, a redelivery is the same body; a status
+        # that legitimately repeats (pending, failed, pending) comes with a
+        # different body (its timestamp, ...) and isn't dropped
+        event_id = request.headers.get(WEBHOOK_EVENT_ID_HEADER) or (
+            f"{payload['transaction_id']}:{payload['status']}:{_body_hash(request.data)}"
+        )
         try:
-            payment = Payment.objects.get(id=payment_id)
-            order = payment.order
-            
-            payment, order = payment_service.update_payment_status(
-                order,
-                serializer.validated_data.get('transaction_id', ''),
-                serializer.validated_data['status']
-            )
-            
-            return Response({
-                'message': SUCCESS_PAYMENT_UPDATED,
-                'data': {
-                    'payment_id': payment.id,
-                    'order_id': order.id,
-                    'order_status': order.status,
-                    'payment_status': payment.status
-                }
-            })
-            
-        except (Payment.DoesNotExist, BusinessException) as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            PaymentEventService().record(payment_id, event_id[:255], payload)
+        except BusinessException as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'message': SUCCESS_PAYMENT_EVENT_RECEIVED,
+            'data': {
+                'payment_id': payment_id,
+                'event_id': event_id[:255],
+                'payment_status': payload['status'],
+            }
+        })
 
 
 ##### Admin Order Views (for staff users) #####
@@ -217,6 +237,7 @@ class AdminOrderViewSet(viewsets.ViewSet):
     def _get_admin_service(self):
         return AdminOrderService()
     
+    @query_budget(4)
     def list(self, request):
         """✅ Get all orders with filters"""
         admin_service = self._get_admin_service()
@@ -9,9 +9,28 @@ Created: 2025-12-06
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import Category, Product
+from .services import invalidate_catalog
 
 
-class CategoryAdmin(admin.ModelAdmin):
+class CatalogInvalidationMixin:
+    """Admin edits bypass the services: drop cached listings/ETags here too"""
+    invalidate_categories = False
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_catalog(categories=self.invalidate_categories)
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_catalog(categories=self.invalidate_categories)
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_catalog(categories=self.invalidate_categories)
+
+
+class CategoryAdmin(CatalogInvalidationMixin, admin.ModelAdmin):
+    invalidate_categories = True
     list_display = ['name', 'slug', 'image_preview', 'product_count']
     list_filter = ['name']
     search_fields = ['name', 'description']
@@ -32,7 +51,7 @@ class CategoryAdmin(admin.ModelAdmin):
     product_count.short_description = 'Products'
 
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CatalogInvalidationMixin, admin.ModelAdmin):
     list_display = [
         'name', 
         'brand', 
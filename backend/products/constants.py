@@ -169,6 +169,10 @@ STATUS_SUCCESS = "success"
 STATUS_ERROR = "error"
 STATUS_VALIDATION_ERROR = "validation_error"
 
+# Cache Constants (core.cache namespaces for public listings)
+CATEGORY_LIST_CACHE_TTL = 300   # seconds; invalidated on every category write
+PRODUCT_LIST_CACHE_TTL = 60     # seconds; also bounds how stale 'stock' can be
+
 # Pagination Constants
 DEFAULT_PAGE_SIZE = 20
 MAX_PAGE_SIZE = 100
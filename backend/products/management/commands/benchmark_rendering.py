@@ -0,0 +1,73 @@
+"""
+CPU per response of FastJSONRenderer against DRF's JSONRenderer, and the
+bytes saved by gzip/brotli, for a product list and an order list payload
+
+    python manage.py benchmark_rendering --rows 100 --repeat 200
+
+Uses the products and orders already in the database.
+
+File: benchmark_rendering.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from core.middleware import compress
+from core.renderers import FastJSONRenderer, orjson
+from orders.models import Order
+from orders.serializers import OrderSerializer
+from orders.services import orders_for_serializer
+from products.models import Product
+from products.serializers import product_detail_lean
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON rendering and response compression'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed: FastJSONRenderer falls back to the stdlib')
+
+        rows = options['rows']
+        request = APIRequestFactory().get('/api/products/')
+        payloads = {
+            'products': product_detail_lean.to_representation(
+                product_detail_lean.values(Product.objects.order_by('id')[:rows]), request
+            ),
+            'orders': OrderSerializer(orders_for_serializer(Order.objects.order_by('id'))[:rows], many=True).data,
+        }
+
+        for label, data in payloads.items():
+            if not data:
+                self.stderr.write(f'No {label} in the database')
+                continue
+
+            drf = self.per_call(lambda: JSONRenderer().render(data), options['repeat'])
+            fast = self.per_call(lambda: FastJSONRenderer().render(data), options['repeat'])
+            body = FastJSONRenderer().render(data)
+            sizes = '  '.join(
+                f'{encoding}={len(compress(body, encoding, settings.API_COMPRESSION_BROTLI_QUALITY, settings.API_COMPRESSION_GZIP_LEVEL))}'
+                for encoding in ('gzip', 'br')
+            )
+            self.stdout.write(
+                f'{label:<9} rows={len(data):<4} drf={drf:8.1f} µs  fast={fast:8.1f} µs  '
+                f'speedup={drf / fast:4.1f}x  bytes={len(body)}  {sizes}'
+            )
+
+    @staticmethod
+    def per_call(func, repeat):
+        func()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat * 1_000_000
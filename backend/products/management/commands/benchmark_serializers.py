@@ -0,0 +1,63 @@
+"""
+Per-row cost of the lean values() serializers against the DRF serializers
+
+    python manage.py benchmark_serializers --rows 100 --repeat 50
+
+Rows are loaded once (instances with select_related, and values() dicts), so
+only serialization is timed. Uses the products already in the database.
+
+File: benchmark_serializers.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from products.models import Product
+from products.serializers import ProductListSerializer, ProductSerializer, product_detail_lean, product_list_lean
+
+
+class Command(BaseCommand):
+    help = 'Benchmark lean values() serializers against ProductListSerializer / ProductSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='Products per page (20-100 in the API)')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.select_related('category', 'brand').order_by('id')[:options['rows']]
+        instances = list(queryset)
+        if not instances:
+            self.stderr.write('No products in the database')
+            return
+
+        request = APIRequestFactory().get('/api/products/')
+        repeat = options['repeat']
+
+        for label, serializer_class, lean in (
+            ('list', ProductListSerializer, product_list_lean),
+            ('detail', ProductSerializer, product_detail_lean),
+        ):
+            rows = list(lean.values(queryset))
+
+            drf = self.per_row(
+                lambda: serializer_class(instances, many=True, context={'request': request}).data,
+                repeat, len(instances),
+            )
+            fast = self.per_row(lambda: lean.to_representation(rows, request), repeat, len(rows))
+
+            self.stdout.write(
+                f'{label:<7} rows={len(rows):<4} drf={drf:8.1f} µs/row  lean={fast:8.1f} µs/row  '
+                f'speedup={drf / fast:4.1f}x'
+            )
+
+    @staticmethod
+    def per_row(func, repeat, rows):
+        func()  # warm up (field binding, URL caches)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / (repeat * rows) * 1_000_000
@@ -15,7 +15,9 @@ import logging
 from .models import Category, Category, Product
 from accounts.models import BrandProfile, UserProfile
 from .services import CategoryService, BusinessException, ProductService
+from .tasks import discard_image
 from .constants import *
+from core.sparse import SparseFieldsMixin, sparse_fields
 
 logger = logging.getLogger(__name__)
 
@@ -198,10 +200,12 @@ class ProductImageFieldSerializer(serializers.ModelSerializer):
         return value
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Simplified serializer for product listing
     """
+    sparse_sources = {'image_url': ['image']}
+    
     category_name = serializers.CharField(source='category.name', read_only=True)
     brand_name = serializers.CharField(source='brand.brand_name', read_only=True)
     image_url = serializers.SerializerMethodField()
@@ -225,10 +229,12 @@ class ProductListSerializer(serializers.ModelSerializer):
         return None
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Detailed serializer for Product model with single image
     """
+    sparse_sources = {'image_url': ['image']}
+    
     image_url = serializers.SerializerMethodField()
     category_name = serializers.CharField(source='category.name', read_only=True)
     brand_name = serializers.CharField(source='brand.brand_name', read_only=True)
@@ -481,11 +487,103 @@ class ProductImageFieldSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         """Update only the product image"""
         if 'image' in validated_data:
-            # Delete old image if exists
-            if instance.image:
-                instance.image.delete(save=False)
+            # Delete old image (in the background) if exists
+            discard_image(instance.image)
             
             instance.image = validated_data['image']
             instance.save()
         
-        return instance
\ No newline at end of file
+        return instance
+
+##### Lean Read-Only Serializers (values() fast path) #####
+
+class LeanSerializer:
+    """
+    Produces exactly what serializer_class(..., many=True).data would, from
+    .values() rows. Field lookups and converters are resolved once from the
+    ModelSerializer's own fields, so a row costs one dict build instead of
+    DRF's per-field get_attribute/to_representation machinery.
+    
+    method_fields maps SerializerMethodField image URLs to their file field.
+    Passing the request applies its ?fields= / ?omit= to both the values()
+    columns and the output.
+    """
+    # Fields whose to_representation is the identity on values() output
+    PASSTHROUGH_FIELDS = (
+        serializers.CharField, serializers.IntegerField, serializers.FloatField,
+        serializers.BooleanField, serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+    )
+    
+    def __init__(self, serializer_class, method_fields=None):
+        self.serializer_class = serializer_class
+        self.method_fields = method_fields or {}
+        self._plan = None
+    
+    @property
+    def plan(self):
+        """[(output name, values() lookup, converter or None, is_file_url)]; built on first use"""
+        if self._plan is None:
+            model = self.serializer_class.Meta.model
+            plan = []
+            for name, field in self.serializer_class().fields.items():
+                if name in self.method_fields:
+                    plan.append((name, self.method_fields[name], None, True))
+                elif isinstance(field, serializers.FileField):
+                    plan.append((name, field.source, None, True))
+                elif isinstance(field, self.PASSTHROUGH_FIELDS):
+                    plan.append((name, field.source.replace('.', '__'), None, False))
+                elif isinstance(field, (serializers.DecimalField, serializers.DateTimeField)):
+                    plan.append((name, field.source.replace('.', '__'), field.to_representation, False))
+                else:
+                    raise TypeError(f"{self.serializer_class.__name__}.{name}: {type(field).__name__} not supported")
+            self._storages = {
+                lookup: model._meta.get_field(lookup).storage for _, lookup, _, is_url in plan if is_url
+            }
+            self._plan = plan
+        return self._plan
+    
+    def plan_for(self, request=None):
+        """The plan restricted to the fields this request renders"""
+        plan = self.plan
+        keep = sparse_fields(request, [name for name, _, _, _ in plan])
+        if keep is None:
+            return plan
+        keep = set(keep)
+        return [step for step in plan if step[0] in keep]
+    
+    def values(self, queryset, request=None):
+        """The queryset as the dict rows this serializer expects"""
+        plan = self.plan_for(request)
+        # values() only joins the relations these lookups go through
+        lookups = dict.fromkeys(lookup for _, lookup, _, _ in plan)
+        return queryset.values(*lookups or ['pk'])
+    
+    def file_url(self, lookup, name, request):
+        # Storage URLs depend only on the file name: computed once per row
+        url = self._storages[lookup].url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    
+    def to_representation(self, rows, request=None):
+        plan = self.plan_for(request)
+        data = []
+        for row in rows:
+            urls = {}
+            item = {}
+            for name, lookup, convert, is_url in plan:
+                value = row[lookup]
+                if is_url:
+                    if not value:
+                        value = None
+                    else:
+                        if lookup not in urls:
+                            urls[lookup] = self.file_url(lookup, value, request)
+                        value = urls[lookup]
+                elif convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+
+product_list_lean = LeanSerializer(ProductListSerializer, method_fields={'image_url': 'image'})
+product_detail_lean = LeanSerializer(ProductSerializer, method_fields={'image_url': 'image'})
@@ -10,17 +10,39 @@ Changes: Switching to a single image for product
 
 import logging
 from typing import Dict, Any
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.utils.text import slugify
 from cloudinary.exceptions import Error as CloudinaryError
 from .models import Category, Product
 from accounts.models import BrandProfile
+from core.cache import Namespace
+from .tasks import discard_image, queue_snapshot_rebuild
 from .constants import *
 
 
 logger = logging.getLogger(__name__)
 
+# Cached public listings (see CategoryViewSet.list / ProductViewSet.list)
+category_cache = Namespace('categories', ttl=CATEGORY_LIST_CACHE_TTL)
+product_cache = Namespace('products', ttl=PRODUCT_LIST_CACHE_TTL)
+
+
+def invalidate_catalog(categories=False):
+    """
+    Drop cached product listings (and category listings) once the current
+    transaction commits, and queue the catalog snapshot rebuild. Product
+    listings embed category names, so category writes invalidate both.
+    """
+    def invalidate():
+        product_cache.invalidate()
+        if categories:
+            category_cache.invalidate()
+    transaction.on_commit(invalidate)
+    if settings.PRODUCT_SNAPSHOT_ENABLED:
+        transaction.on_commit(queue_snapshot_rebuild)
+
 
 class BusinessException(Exception):
     """Custom exception for business logic errors"""
@@ -62,6 +84,7 @@ class CategoryService:
                 
                 category = Category.objects.create(**data)
                 logger.info(f"Category created successfully: {category.name} (ID: {category.id})")
+                invalidate_catalog(categories=True)
                 return category
                 
         except ValidationError as ve:
@@ -110,6 +133,7 @@ class CategoryService:
                 category.save()
                 
                 logger.info(f"Category updated successfully: {category.name} (ID: {category.id})")
+                invalidate_catalog(categories=True)
                 return category
                 
         except ValidationError as ve:
@@ -136,12 +160,8 @@ class CategoryService:
         """
         try:
             with transaction.atomic():
-                # Delete old image if exists
-                if category.image:
-                    try:
-                        category.image.delete(save=False)
-                    except Exception as e:
-                        logger.warning(f"Could not delete old image: {str(e)}")
+                # Delete old image (in the background) if exists
+                discard_image(category.image)
                 
                 # Save new image
                 category.image = image_file
@@ -149,6 +169,7 @@ class CategoryService:
                 category.save(update_fields=['image'])
                 
                 logger.info(f"Image updated for category: {category.name} (ID: {category.id})")
+                invalidate_catalog(categories=True)
                 return category
                 
         except ValidationError as ve:
@@ -184,11 +205,12 @@ class CategoryService:
             return
         
         try:
-            # Delete the image file
-            category.image.delete(save=False)
+            # Delete the image file (in the background)
+            discard_image(category.image)
             # Clear the field
             category.image = None
             category.save(update_fields=['image'])
+            invalidate_catalog(categories=True)
             
             logger.info(f"Image removed from category: {category.name}")
             
@@ -223,11 +245,11 @@ class CategoryService:
             )
         
         try:
-            # Delete associated image if exists
-            if category.image:
-                category.image.delete(save=False)
+            # Delete associated image (in the background) if exists
+            discard_image(category.image)
             
             category.delete()
+            invalidate_catalog(categories=True)
             logger.info(f"Category deleted: {category.name} (ID: {category.id})")
             
         except Exception as e:
@@ -369,6 +391,7 @@ class ProductService:
                     product.save()
                 
                 logger.info(f"Product created successfully: {product.name} (ID: {product.id})")
+                invalidate_catalog()
                 return product
                 
         except ValidationError as ve:
@@ -445,12 +468,8 @@ class ProductService:
                 
                 # Handle image update
                 if image is not None:
-                    # Delete old image file if exists
-                    if product.image:
-                        try:
-                            product.image.delete(save=False)
-                        except Exception as e:
-                            logger.warning(f"Could not delete old image: {str(e)}")
+                    # Delete old image file (in the background) if exists
+                    discard_image(product.image)
                     
                     product.image = image
                 
@@ -458,6 +477,7 @@ class ProductService:
                 product.save()
                 
                 logger.info(f"Product updated successfully: {product.name} (ID: {product.id})")
+                invalidate_catalog()
                 return product
                 
         except ValidationError as ve:
@@ -491,14 +511,11 @@ class ProductService:
                     error_code='PERMISSION_DENIED'
                 )
             
-            # Delete associated image file
-            if product.image:
-                try:
-                    product.image.delete(save=False)
-                except Exception as e:
-                    logger.warning(f"Could not delete product image: {str(e)}")
+            # Delete associated image file (in the background)
+            discard_image(product.image)
             
             product.delete()
+            invalidate_catalog()
             logger.info(f"Product deleted: {product.name} (ID: {product.id})")
             
         except BusinessException:
@@ -0,0 +1,528 @@
+"""
+Description: Shared-memory catalog snapshot
+
+Active products are written once into a struct-of-arrays file: fixed-width
+numeric columns (array typecodes), UTF-8 string columns (offsets + blob) and
+precomputed sort permutations. Every gunicorn worker mmaps the same file
+read-only, so the rows live once in the OS page cache instead of once per
+worker, and product list / similar requests run no queries. Filters are
+numpy operations over the mapped columns, and records are only built for
+the rows of the requested page.
+
+A snapshot belongs to a version of the 'products' cache namespace (bumped by
+invalidate_catalog()). It is never built by a request: invalidate_catalog()
+queues the rebuild_catalog_snapshot task, and a request that finds the
+snapshot older than PRODUCT_SNAPSHOT_MAX_AGE (stock moves without
+invalidating) or missing queues one too. Until the new file is swapped in
+through the 'current' pointer file, requests keep serving the previous one
+of the same version, or use the database when the version has changed.
+
+File: snapshot.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+import calendar
+import glob
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from array import array
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+
+from .filters import ProductFilter
+from .models import Product
+from .serializers import ProductListSerializer
+from .services import product_cache
+from .tasks import queue_snapshot_rebuild
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ECOSNAP1'
+ALIGN = 8
+
+# Fixed-width columns: name -> array typecode
+NUMERIC_COLUMNS = {
+    'id': 'q',
+    'category_id': 'q',
+    'brand_id': 'q',
+    'price_cents': 'q',
+    'stock': 'q',
+    'weight': 'q',
+    'carbon_footprint': 'd',
+    'created_us': 'q',
+    'recyclable': 'b',
+    # Codes into header['tables'][column]
+    'base_type': 'H',
+    'packaging_material': 'H',
+    'transportation_type': 'H',
+    'eco_badge': 'H',
+}
+CODED_COLUMNS = ('base_type', 'packaging_material', 'transportation_type', 'eco_badge')
+
+# Stored exactly as ProductListSerializer renders them (image without host)
+STRING_COLUMNS = ('name', 'slug', 'category_name', 'brand_name', 'price', 'image', 'created_at')
+
+# OrderingFilter field -> column with precomputed permutations (both directions)
+ORDERINGS = {
+    'price': 'price_cents',
+    'created_at': 'created_us',
+    'carbon_footprint': 'carbon_footprint',
+}
+DEFAULT_ORDERING = '-created_at'
+# ProductViewSet.ordering_fields (OrderingFilter ignores anything else)
+ORDERING_FIELDS = ('name', 'price', 'created_at', 'carbon_footprint')
+
+# Filters that need DB text matching (collation, accents): served by the DB
+TEXT_FILTERS = ('name', 'ingredient', 'brand', 'q', 'search')
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _to_cents(price):
+    return int((price * 100).to_integral_value())
+
+
+def _to_micros(value):
+    return calendar.timegm(value.utctimetuple()) * 1_000_000 + value.microsecond
+
+
+def _permutation(keys):
+    """Stable argsort of keys as an array('q'): ties keep id order (rows are sorted by id)"""
+    order = array('q')
+    order.frombytes(np.argsort(keys, kind='stable').astype(np.int64).tobytes())
+    return order
+
+
+##### Builder #####
+
+def build_snapshot(path, version):
+    """Serialize active products into a snapshot file at path"""
+    products = list(
+        Product.objects.filter(is_active=True).select_related('category', 'brand').order_by('id')
+    )
+    rows = ProductListSerializer(products, many=True).data
+
+    tables = {
+        column: sorted({getattr(product, column) for product in products})
+        for column in CODED_COLUMNS
+    }
+    codes = {column: {value: code for code, value in enumerate(values)} for column, values in tables.items()}
+
+    columns = {name: array(typecode) for name, typecode in NUMERIC_COLUMNS.items()}
+    strings = {name: [] for name in STRING_COLUMNS}
+    for product, row in zip(products, rows):
+        columns['id'].append(product.id)
+        columns['category_id'].append(product.category_id)
+        columns['brand_id'].append(product.brand_id)
+        columns['price_cents'].append(_to_cents(product.price))
+        columns['stock'].append(product.stock)
+        columns['weight'].append(product.weight)
+        columns['carbon_footprint'].append(product.carbon_footprint)
+        columns['created_us'].append(_to_micros(product.created_at))
+        columns['recyclable'].append(1 if product.recyclable_packaging else 0)
+        for column in CODED_COLUMNS:
+            columns[column].append(codes[column][getattr(product, column)])
+        for column in STRING_COLUMNS:
+            strings[column].append((row[column] or '').encode())
+
+    for column, values in strings.items():
+        offsets = array('q', [0])
+        for value in values:
+            offsets.append(offsets[-1] + len(value))
+        columns[f'{column}.offsets'] = offsets
+        columns[f'{column}.data'] = array('B', b''.join(values))
+
+    # Sort permutations for ordering (ties by id, both directions) and slug lookup
+    count = len(products)
+    for column in ORDERINGS.values():
+        values = np.frombuffer(columns[column], dtype=columns[column].typecode)
+        columns[f'order.{column}'] = _permutation(values)
+        columns[f'order.-{column}'] = _permutation(-values)
+    # UTF-8 byte order is code point order, the order find() compares slugs in
+    columns['order.slug'] = _permutation(np.array(strings['slug'], dtype=bytes))
+
+    layout, offset = {}, 0
+    for name, values in columns.items():
+        nbytes = len(values) * values.itemsize
+        layout[name] = [values.typecode, offset, nbytes]
+        offset = _align(offset + nbytes)
+
+    header = json.dumps({
+        'version': version,
+        'built_at': time.time(),
+        'count': count,
+        'tables': tables,
+        'categories': {product.category.slug: product.category_id for product in products},
+        'columns': layout,
+    }).encode()
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(len(header).to_bytes(4, 'little'))
+        handle.write(header)
+        base = _align(len(MAGIC) + 4 + len(header))
+        for name, values in columns.items():
+            handle.seek(base + layout[name][1])
+            values.tofile(handle)
+        # Make sure the file covers the last column's padding
+        handle.truncate(base + offset)
+    os.replace(tmp_path, path)
+    return count
+
+
+##### Reader #####
+
+class ProductRecord:
+    """Lazy view of one snapshot row (no per-row dict or model instance)"""
+    __slots__ = ('_snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self._snapshot = snapshot
+        self.index = index
+
+    def _value(self, column):
+        return self._snapshot.columns[column][self.index]
+
+    def _string(self, column):
+        return self._snapshot.string(column, self.index)
+
+    @property
+    def id(self):
+        return self._value('id')
+
+    @property
+    def slug(self):
+        return self._string('slug')
+
+    def to_representation(self, request=None, fields=None):
+        """
+        Same output as ProductListSerializer(product, context={'request': request});
+        fields (from core.sparse.sparse_fields) restricts the keys
+        """
+        image = self._string('image') or None
+        if image and request is not None:
+            image = request.build_absolute_uri(image)
+        data = {
+            'id': self._value('id'),
+            'name': self._string('name'),
+            'slug': self._string('slug'),
+            'category': self._value('category_id'),
+            'category_name': self._string('category_name'),
+            'brand': self._value('brand_id'),
+            'brand_name': self._string('brand_name'),
+            'price': self._string('price'),
+            'stock': self._value('stock'),
+            'is_active': True,
+            'carbon_footprint': self._value('carbon_footprint'),
+            'eco_badge': self._snapshot.decode('eco_badge', self.index),
+            'image': image,
+            'image_url': image,
+            'created_at': self._string('created_at'),
+        }
+        if fields is not None:
+            return {name: data[name] for name in fields}
+        return data
+
+
+class CatalogSnapshot:
+    """Read-only columns over a mapped snapshot file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot')
+
+        header_start = len(MAGIC) + 4
+        header_length = int.from_bytes(buffer[len(MAGIC):header_start], 'little')
+        header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+        base = _align(header_start + header_length)
+
+        self.version = header['version']
+        self.built_at = header['built_at']
+        self.count = header['count']
+        self.tables = header['tables']
+        self.categories = header['categories']
+        self.category_ids = set(self.categories.values())
+        self.columns = {
+            name: buffer[base + offset:base + offset + nbytes].cast(typecode)
+            for name, (typecode, offset, nbytes) in header['columns'].items()
+        }
+        # numpy views of the same mapped bytes (no copy) for the vectorized queries
+        self.arrays = {
+            name: np.frombuffer(view, dtype=view.format)
+            for name, view in self.columns.items() if not name.endswith(('.offsets', '.data'))
+        }
+
+    def string(self, column, index):
+        offsets = self.columns[f'{column}.offsets']
+        return bytes(self.columns[f'{column}.data'][offsets[index]:offsets[index + 1]]).decode()
+
+    def decode(self, column, index):
+        return self.tables[column][self.columns[column][index]]
+
+    def record(self, index):
+        return ProductRecord(self, index)
+
+    ##### Queries #####
+
+    def find(self, slug):
+        """Binary search on the slug permutation"""
+        order = self.columns['order.slug']
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.string('slug', order[middle]) < slug:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.string('slug', order[low]) == slug:
+            return self.record(order[low])
+        return None
+
+    def similar(self, slug, limit=8):
+        """Same rule as ProductViewSet.similar_products; None if slug isn't in the snapshot"""
+        product = self.find(slug)
+        if product is None:
+            return None
+
+        arrays = self.arrays
+        index = product.index
+        matches = (arrays['category_id'] == arrays['category_id'][index]) & (
+            (arrays['base_type'] == arrays['base_type'][index])
+            | (arrays['packaging_material'] == arrays['packaging_material'][index])
+        )
+        matches[index] = False
+        return [self.record(int(i)) for i in np.flatnonzero(matches)[:limit]]
+
+    def select(self, filters, ordering):
+        """Positions matching cleaned ProductFilter values, in the requested order (numpy array)"""
+        arrays = self.arrays
+        mask = np.ones(self.count, dtype=bool)
+
+        def code_of(column, value):
+            table = self.tables[column]
+            return table.index(value) if value in table else -1
+
+        if filters.get('category') is not None:
+            mask &= arrays['category_id'] == filters['category']
+        if filters.get('category_slug'):
+            mask &= arrays['category_id'] == self.categories.get(filters['category_slug'], -1)
+        if filters.get('min_price') is not None:
+            mask &= arrays['price_cents'] >= int((filters['min_price'] * 100).to_integral_value(ROUND_CEILING))
+        if filters.get('max_price') is not None:
+            mask &= arrays['price_cents'] <= int((filters['max_price'] * 100).to_integral_value(ROUND_FLOOR))
+        if filters.get('in_stock') is True:
+            mask &= arrays['stock'] > 0
+        elif filters.get('in_stock') is False:
+            mask &= arrays['stock'] == 0
+        if filters.get('recyclable') is not None:
+            mask &= arrays['recyclable'] == (1 if filters['recyclable'] else 0)
+        for column in CODED_COLUMNS:
+            if filters.get(column):
+                mask &= arrays[column] == code_of(column, filters[column])
+        if filters.get('max_carbon') is not None:
+            mask &= arrays['carbon_footprint'] <= float(filters['max_carbon'])
+        if filters.get('min_weight') is not None:
+            mask &= arrays['weight'] >= int(Decimal(filters['min_weight']).to_integral_value(ROUND_CEILING))
+        if filters.get('max_weight') is not None:
+            mask &= arrays['weight'] <= int(Decimal(filters['max_weight']).to_integral_value(ROUND_FLOOR))
+
+        direction = '-' if ordering.startswith('-') else ''
+        order = arrays[f'order.{direction}{ORDERINGS[ordering.lstrip("-")]}']
+        return order[mask[order]]
+
+    def query(self, request):
+        """
+        Records for a product list request, or None when the request needs
+        something only the database does (text search, name ordering, ...)
+        """
+        params = request.query_params
+        if any(params.get(name) for name in TEXT_FILTERS):
+            return None
+
+        # Same rules as OrderingFilter: unknown fields are ignored
+        terms = [term.strip() for term in params.get('ordering', '').split(',') if term.strip()]
+        terms = [term for term in terms if term.lstrip('-') in ORDERING_FIELDS]
+        if len(terms) > 1 or (terms and terms[0].lstrip('-') not in ORDERINGS):
+            return None
+        ordering = terms[0] if terms else DEFAULT_ORDERING
+
+        # Validate/convert with the real FilterSet form; 'category' is a
+        # ModelChoiceFilter (a query), so check it against the snapshot instead
+        data = params.copy()
+        category = data.pop('category', [''])[-1]
+        form = ProductFilter(data, queryset=Product.objects.none(), request=request).form
+        if not form.is_valid():
+            return None
+        filters = dict(form.cleaned_data)
+        if category:
+            try:
+                filters['category'] = int(category)
+            except ValueError:
+                return None
+            if filters['category'] not in self.category_ids:
+                return None
+
+        return RecordList(self, self.select(filters, ordering))
+
+
+class RecordList:
+    """
+    The matched rows as a sequence for the paginator: len() is free and
+    records are only built for the slice that is read (the page)
+    """
+    __slots__ = ('_snapshot', '_rows')
+
+    def __init__(self, snapshot, rows):
+        self._snapshot = snapshot
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._snapshot.record(int(i)) for i in self._rows[key]]
+        return self._snapshot.record(int(self._rows[key]))
+
+
+##### Per-process store #####
+
+class SnapshotStore:
+    """Keeps this worker's mapping of the current snapshot up to date"""
+
+    # Seconds between two looks at the pointer file while the mapping is behind
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self):
+        self._snapshot = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return settings.PRODUCT_SNAPSHOT_DIR
+
+    @property
+    def pointer_path(self):
+        return os.path.join(self.directory, 'current.json')
+
+    def _is_fresh(self, snapshot, version):
+        return (
+            snapshot is not None
+            and snapshot.version == version
+            and time.time() - snapshot.built_at < settings.PRODUCT_SNAPSHOT_MAX_AGE
+        )
+
+    def current(self):
+        """
+        The snapshot for the current catalog version, or None (use the
+        database). Never builds one: a missing or aged snapshot is queued
+        for the worker and the mapped one is served meanwhile.
+        """
+        if not settings.PRODUCT_SNAPSHOT_ENABLED:
+            return None
+
+        version = product_cache.version()
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot, version) or time.monotonic() < self._next_check:
+            return snapshot if snapshot is not None and snapshot.version == version else None
+
+        with self._lock:
+            if time.monotonic() >= self._next_check:
+                self._next_check = time.monotonic() + self.CHECK_INTERVAL
+                # The worker may have swapped a new file in already
+                loaded = self._load_current()
+                if loaded is not None and loaded.version == version:
+                    self._snapshot = loaded
+                if not self._is_fresh(self._snapshot, version):
+                    transaction.on_commit(queue_snapshot_rebuild)
+
+            # An aged snapshot of the same version is still correct apart
+            # from stock; a different version is not
+            snapshot = self._snapshot
+            return snapshot if snapshot is not None and snapshot.version == version else None
+
+    def _load_current(self):
+        try:
+            with open(self.pointer_path) as handle:
+                path = os.path.join(self.directory, json.load(handle)['file'])
+        except (OSError, ValueError, KeyError):
+            return None
+        if self._snapshot is not None and self._snapshot.path == path:
+            return self._snapshot
+        try:
+            return CatalogSnapshot(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not map catalog snapshot {path}: {e}")
+            return None
+
+    def rebuild(self):
+        """
+        Build a snapshot of the current catalog version and point the
+        'current' file at it (rebuild_catalog_snapshot task). Returns False
+        when another build holds the lock.
+        """
+        lock_key = 'products:snapshot:lock'
+        if not shared_cache.add(lock_key, 1, timeout=settings.PRODUCT_SNAPSHOT_BUILD_TIMEOUT):
+            return False
+        try:
+            # The shared version, not this process' locally cached copy of it
+            version = shared_cache.get(product_cache.version_key) or product_cache.version()
+            os.makedirs(self.directory, exist_ok=True)
+            filename = f'catalog-{version}-{time.time_ns()}.snap'
+            count = build_snapshot(os.path.join(self.directory, filename), version)
+
+            tmp_pointer = f'{self.pointer_path}.{os.getpid()}.tmp'
+            with open(tmp_pointer, 'w') as handle:
+                json.dump({'file': filename, 'version': version}, handle)
+            os.replace(tmp_pointer, self.pointer_path)
+            logger.info(f"Catalog snapshot {filename} built ({count} products)")
+            # This process can map it right away
+            self._next_check = 0.0
+
+            self._remove_old_files(filename)
+            return True
+        finally:
+            shared_cache.delete(lock_key)
+
+    def _remove_old_files(self, keep):
+        # Workers still mapping an old file keep it alive until they remap
+        cutoff = time.time() - 2 * settings.PRODUCT_SNAPSHOT_MAX_AGE
+        for path in glob.glob(os.path.join(self.directory, 'catalog-*.snap')):
+            if os.path.basename(path) == keep:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def reset(self):
+        """Forget the current snapshot (tests)"""
+        with self._lock:
+            self._snapshot = None
+            self._next_check = 0.0
+            try:
+                os.remove(self.pointer_path)
+            except OSError:
+                pass
+
+
+catalog_snapshots = SnapshotStore()
@@ -0,0 +1,50 @@
+"""
+Description: Product background tasks (see core.tasks)
+
+Removing a replaced or deleted image from storage is a Cloudinary API call:
+it's queued with the request's transaction instead of made inside it.
+Rebuilding the catalog snapshot reads and serializes every active product:
+it's queued by catalog writes and aged snapshots, never run by a request.
+
+File: tasks.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+
+from core.tasks import background
+
+# Set while a rebuild_catalog_snapshot is waiting for a worker
+SNAPSHOT_QUEUED_KEY = 'products:snapshot:queued'
+
+
+@background(max_attempts=5)
+def delete_image_file(model_label, field_name, name):
+    """Delete a stored file of model_label.field_name (Category/Product image)"""
+    storage = apps.get_model(model_label)._meta.get_field(field_name).storage
+    storage.delete(name)
+
+
+@background(unique=True)
+def rebuild_catalog_snapshot():
+    """Build the snapshot of the current catalog version (see products.snapshot)"""
+    from .snapshot import catalog_snapshots
+
+    # Changes from now on need another build
+    shared_cache.delete(SNAPSHOT_QUEUED_KEY)
+    catalog_snapshots.rebuild()
+
+
+def queue_snapshot_rebuild():
+    """Queue rebuild_catalog_snapshot unless one is waiting already (checked in the shared cache)"""
+    if shared_cache.add(SNAPSHOT_QUEUED_KEY, 1, timeout=settings.PRODUCT_SNAPSHOT_BUILD_TIMEOUT):
+        rebuild_catalog_snapshot.delay()
+
+
+def discard_image(image):
+    """Queue the deletion of an ImageField's current file, if any"""
+    if image:
+        delete_image_file.delay(image.instance._meta.label, image.field.name, image.name)
@@ -1,3 +1,481 @@
-from django.test import TestCase
+"""
+Description: Query budget tests for category and product routes
 
-# Create your tests here.
+File: tests.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+import gzip
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import brotli
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from core.cache import clear_all
+from core.models import Task
+from core.tasks import background, claim_tasks, run_pending, run_task
+from core.query_budget import query_budget
+from core.testing import EcoShopFixtures, QueryBudgetTestCase
+
+from .models import Category, Product
+from .serializers import ProductListSerializer, ProductSerializer, product_detail_lean, product_list_lean
+from .snapshot import CatalogSnapshot, catalog_snapshots
+
+
+class ProductRouteBudgetTests(QueryBudgetTestCase):
+    app_label = 'products'
+    route_budgets = {
+        'category-list': {'get': 2, 'post': 6},
+        'category-detail': {'get': 1, 'patch': 11, 'delete': 5},
+        'category-remove-image': {'delete': 2},
+        'category-upload-image': {'put': 2},
+        'product-list': {'get': 2, 'post': 9},
+        'product-my-products': {'get': 5},
+        'product-detail': {'get': 2, 'patch': 13, 'delete': 10},
+        'product-similar-products': {'get': 1},
+        'product-remove-image': {'delete': 5},
+        'product-upload-image': {'put': 5},
+        'category-products': {'get': 1},
+    }
+
+    def setUp(self):
+        super().setUp()
+        # Reads are budgeted against the snapshot the worker keeps current
+        catalog_snapshots.rebuild()
+
+    def test_routes_have_budgets(self):
+        self.assertRoutesHaveBudgets()
+
+    ##### Categories #####
+
+    def test_category_list(self):
+        response = self.call_route('get', 'category-list', status_code=200)
+        self.assertEqual(response.data['count'], len(self.categories))
+
+    def test_category_create(self):
+        self.call_route('post', 'category-list', data={'name': 'Deodorant'}, user=self.admin, status_code=201)
+
+    def test_category_retrieve(self):
+        self.call_route('get', 'category-detail', kwargs={'slug': 'soap'}, status_code=200)
+
+    def test_category_update(self):
+        self.call_route(
+            'patch', 'category-detail', kwargs={'slug': 'soap'},
+            data={'slug': 'soap', 'description': 'Solid soaps'}, user=self.admin, status_code=200,
+        )
+
+    def test_category_destroy(self):
+        Category.objects.create(name='Empty', slug='empty')
+        self.call_route('delete', 'category-detail', kwargs={'slug': 'empty'}, user=self.admin, status_code=200)
+
+    def test_category_remove_image(self):
+        self.call_route('delete', 'category-remove-image', kwargs={'slug': 'soap'}, user=self.admin)
+
+    def test_category_upload_image(self):
+        self.call_route('put', 'category-upload-image', kwargs={'slug': 'soap'}, user=self.admin, status_code=400)
+
+    ##### Products #####
+
+    def test_product_list(self):
+        response = self.call_route('get', 'product-list', status_code=200)
+        self.assertEqual(response.data['count'], len(self.products))
+
+    def test_product_list_authenticated_with_filters(self):
+        self.call_route(
+            'get', 'product-list', user=self.customer,
+            query={'category_slug': 'soap', 'max_price': 20, 'ordering': 'price'}, status_code=200,
+        )
+
+    def test_product_create(self):
+        data = {
+            'name': 'Bamboo Toothbrush', 'description': 'Compostable handle',
+            'category': self.categories[0].id, 'price': '4.50', 'stock': 10,
+            'ingredient_main': 'bamboo', 'base_type': 'plant_based',
+            'packaging_material': 'paper_wrap', 'origin_country': 'ESP', 'weight': 20,
+            'transportation_type': 'sea',
+        }
+        self.call_route('post', 'product-list', data=data, user=self.brand_manager, status_code=201)
+
+    def test_my_products(self):
+        response = self.call_route('get', 'product-my-products', user=self.brand_manager, status_code=200)
+        self.assertEqual(response.data['count'], len(self.products))
+
+    def test_product_retrieve(self):
+        self.call_route('get', 'product-detail', kwargs={'slug': self.product.slug}, status_code=200)
+
+    def test_product_update(self):
+        self.call_route(
+            'patch', 'product-detail', kwargs={'slug': self.product.slug},
+            data={'stock': 50, 'category': self.product.category_id}, user=self.brand_manager, status_code=200,
+        )
+
+    def test_product_destroy(self):
+        self.call_route(
+            'delete', 'product-detail', kwargs={'slug': self.products[-1].slug},
+            user=self.brand_manager, status_code=200,
+        )
+
+    def test_similar_products(self):
+        response = self.call_route(
+            'get', 'product-similar-products', kwargs={'slug': self.product.slug}, status_code=200
+        )
+        self.assertTrue(response.data)
+
+    def test_product_remove_image(self):
+        self.call_route(
+            'delete', 'product-remove-image', kwargs={'slug': self.product.slug},
+            user=self.brand_manager, status_code=400,
+        )
+
+    def test_product_upload_image(self):
+        self.call_route(
+            'put', 'product-upload-image', kwargs={'slug': self.product.slug},
+            user=self.brand_manager, status_code=200,
+        )
+
+    def test_category_products(self):
+        self.call_route('get', 'category-products', kwargs={'slug': 'soap'}, status_code=200)
+
+    ##### Cached listings #####
+
+    def test_category_list_is_cached_until_a_category_changes(self):
+        url = reverse('category-list')
+        self.client.get(url)
+        with query_budget(0, enforce=True):
+            self.assertEqual(self.client.get(url).data['count'], len(self.categories))
+
+        self.login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'name': 'Deodorant'}, format='json')
+        self.assertEqual(self.client.get(url).data['count'], len(self.categories) + 1)
+
+    def test_product_list_cache_key_includes_query(self):
+        url = reverse('product-list')
+        self.assertEqual(self.client.get(url).data['count'], len(self.products))
+        self.assertEqual(self.client.get(url, {'category_slug': 'soap'}).data['count'], 6)
+        with query_budget(0, enforce=True):
+            self.client.get(url)
+
+    ##### Conditional GETs #####
+    
+    def test_category_list_not_modified_until_a_category_changes(self):
+        url = reverse('category-list')
+        response = self.client.get(url)
+        self.assertIn('public', response['Cache-Control'])
+        with query_budget(0, enforce=True):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('category-detail', kwargs={'slug': 'soap'}), {'slug': 'soap', 'description': 'Bars'}, format='json'
+            )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+    
+    def test_product_retrieve_validators_follow_updated_at(self):
+        url = reverse('product-detail', kwargs={'slug': self.product.slug})
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        with query_budget(1, enforce=True):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        
+        self.product.stock -= 1
+        self.product.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        # Compressed bodies carry the weak form, which still validates
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f"W/{changed['ETag']}").status_code, 304)
+    
+    def test_missing_product_has_no_validators(self):
+        response = self.client.get(reverse('product-detail', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+    
+    ##### Sparse fieldsets #####
+    
+    def test_product_retrieve_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.call_route(
+                'get', 'product-detail', kwargs={'slug': self.product.slug},
+                query={'fields': 'id,name,category_name,bogus'}, status_code=200,
+            )
+        self.assertEqual(list(response.data), ['id', 'name', 'category_name'])
+        self.assertEqual(response.data['category_name'], self.product.category.name)
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('products_brand', sql)
+    
+    def test_product_list_omit(self):
+        response = self.call_route('get', 'product-list', query={'omit': 'image,image_url,created_at'}, status_code=200)
+        self.assertNotIn('image_url', response.data['results'][0])
+        self.assertIn('carbon_footprint', response.data['results'][0])
+    
+    def test_sparse_fields_ignored_on_writes(self):
+        response = self.call_route(
+            'patch', 'product-detail', kwargs={'slug': self.product.slug}, query={'fields': 'id'},
+            data={'stock': 50, 'category': self.product.category_id}, user=self.brand_manager, status_code=200,
+        )
+        self.assertIn('stock', response.data['product'])
+    
+    ##### Catalog snapshot #####
+
+    def get_with_and_without_snapshot(self, url, query=None):
+        responses = []
+        for enabled in (True, False):
+            clear_all()
+            catalog_snapshots.reset()
+            with override_settings(PRODUCT_SNAPSHOT_ENABLED=enabled):
+                if enabled:
+                    catalog_snapshots.rebuild()
+                responses.append(self.client.get(url, query or {}))
+        return responses
+
+    def test_snapshot_matches_database(self):
+        self.products[2].is_active = False
+        self.products[2].save()
+        url = reverse('product-list')
+        for query in (
+            {}, {'ordering': 'price'}, {'ordering': '-carbon_footprint'}, {'ordering': 'bogus'},
+            {'category_slug': 'soap', 'max_price': '20'}, {'category': self.categories[0].pk},
+            {'min_price': '10.5', 'in_stock': 'true'}, {'base_type': 'plant_based'}, {'page': 1},
+            {'fields': 'id,name,price'}, {'omit': 'image,image_url', 'ordering': 'price'},
+            {'category': self.categories[0].pk, 'category_slug': 'soap'},
+            {'category': self.categories[1].pk, 'category_slug': 'soap'},
+        ):
+            snapshot, database = self.get_with_and_without_snapshot(url, query)
+            self.assertEqual(snapshot.status_code, database.status_code, query)
+            self.assertEqual(snapshot.json(), database.json(), query)
+
+    def test_snapshot_similar_matches_database(self):
+        url = reverse('product-similar-products', kwargs={'slug': self.product.slug})
+        snapshot, database = self.get_with_and_without_snapshot(url)
+        self.assertEqual(
+            sorted(snapshot.json(), key=lambda row: row['id']), sorted(database.json(), key=lambda row: row['id'])
+        )
+
+    def test_snapshot_list_runs_no_queries_once_built(self):
+        url = reverse('product-list')
+        self.client.get(url)
+        clear_all()  # drop the cached response, keep the mapped snapshot
+        with query_budget(0, enforce=True):
+            self.assertEqual(self.client.get(url, {'ordering': 'price'}).data['count'], len(self.products))
+
+    def test_requests_queue_the_snapshot_build(self):
+        catalog_snapshots.reset()
+        url = reverse('product-list')
+        with mock.patch('products.snapshot.build_snapshot') as build, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.get(url).data['count'], len(self.products))  # from the database
+            self.client.get(url, {'ordering': 'price'})
+        build.assert_not_called()
+        self.assertEqual(list(Task.objects.values_list('name', flat=True)), ['products.tasks.rebuild_catalog_snapshot'])
+
+        self.assertEqual(run_pending(), {'done': 1})
+        with query_budget(0, enforce=True):
+            self.assertEqual(self.client.get(url, {'ordering': '-price'}).data['count'], len(self.products))
+
+    def test_aged_snapshot_is_served_while_rebuilt(self):
+        with self.settings(PRODUCT_SNAPSHOT_MAX_AGE=0), self.captureOnCommitCallbacks(execute=True):
+            with query_budget(0, enforce=True):
+                self.assertEqual(self.client.get(reverse('product-list')).data['count'], len(self.products))
+        self.assertTrue(Task.objects.filter(name='products.tasks.rebuild_catalog_snapshot').exists())
+
+    def test_catalog_writes_queue_a_snapshot_build(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.call_route(
+                'patch', 'product-detail', kwargs={'slug': self.product.slug},
+                data={'stock': 50, 'category': self.product.category_id}, user=self.brand_manager, status_code=200,
+            )
+        self.assertTrue(Task.objects.filter(name='products.tasks.rebuild_catalog_snapshot').exists())
+
+        # The previous version's snapshot is not served: the database answers until the build
+        rows = self.client.get(reverse('product-list'), {'ordering': 'price'}).data['results']
+        self.assertEqual(next(row['stock'] for row in rows if row['id'] == self.product.pk), 50)
+        run_pending()
+        self.assertEqual(catalog_snapshots.current().find(self.product.slug)._value('stock'), 50)
+
+    def test_snapshot_builds_records_for_the_page_only(self):
+        snapshot = catalog_snapshots.current()
+        request = Request(APIRequestFactory().get('/api/products/', {'ordering': 'price'}))
+        with mock.patch.object(CatalogSnapshot, 'record', autospec=True, side_effect=CatalogSnapshot.record) as record:
+            records = snapshot.query(request)
+            self.assertEqual((len(records), record.call_count), (len(self.products), 0))
+            page = records[2:5]
+        self.assertEqual(record.call_count, 3)
+        prices = [row.price for row in Product.objects.order_by('price', 'id')]
+        self.assertEqual([snapshot.string('price', row.index) for row in page], [str(price) for price in prices[2:5]])
+
+
+class LeanSerializerContractTests(EcoShopFixtures, APITestCase):
+    """The values() fast path must render exactly what the DRF serializers render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Product.objects.filter(pk=cls.product.pk).update(image='products/bottle.jpg')
+
+    def assertSameOutput(self, lean, serializer_class, request):
+        queryset = Product.objects.order_by('id')
+        expected = serializer_class(queryset, many=True, context={'request': request}).data
+        actual = lean.to_representation(lean.values(queryset, request), request)
+        # Same values and same key order
+        self.assertEqual([list(row.items()) for row in actual], [list(row.items()) for row in expected])
+
+    def test_list_serializer_contract(self):
+        request = APIRequestFactory().get('/api/products/')
+        self.assertSameOutput(product_list_lean, ProductListSerializer, request)
+        self.assertSameOutput(product_list_lean, ProductListSerializer, None)
+
+    def test_detail_serializer_contract(self):
+        request = APIRequestFactory().get('/api/products/my-products/')
+        self.assertSameOutput(product_detail_lean, ProductSerializer, request)
+    
+    def test_sparse_fields_contract(self):
+        request = APIRequestFactory().get('/api/products/', {'fields': 'image_url,name,brand_name', 'omit': 'name'})
+        self.assertSameOutput(product_list_lean, ProductListSerializer, request)
+        self.assertSameOutput(product_detail_lean, ProductSerializer, request)
+        rows = product_list_lean.values(Product.objects.all(), request)
+        self.assertEqual(set(rows[0]), {'image', 'brand__brand_name'})
+
+    @override_settings(PRODUCT_SNAPSHOT_ENABLED=False)
+    def test_endpoints_use_serializer_output(self):
+        similar = self.client.get(reverse('product-similar-products', kwargs={'slug': self.products[1].slug}))
+        self.assertTrue(similar.data)
+        self.assertIn('image_url', similar.data[0])
+
+        self.client.force_authenticate(self.brand_manager)
+        mine = self.client.get(reverse('product-my-products'), {'ordering': 'price'})
+        expected = ProductSerializer(
+            Product.objects.filter(brand=self.brand).order_by('price')[:20], many=True,
+            context={'request': mine.wsgi_request},
+        ).data
+        self.assertEqual(mine.data['results'], expected)
+
+
+class ResponseEncodingTests(EcoShopFixtures, APITestCase):
+    """orjson rendering and gzip/brotli compression must not change what clients decode"""
+
+    def test_renderer_matches_drf_json(self):
+        response = self.client.get(reverse('product-list'), {'ordering': 'price'})
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_large_json_is_compressed_by_preference(self):
+        url = reverse('product-list')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(compressed.content), plain.content)
+        self.assertLess(int(compressed['Content-Length']), len(plain.content))
+
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+    def test_small_json_is_not_compressed(self):
+        response = self.client.get(reverse('product-list'), {'fields': 'id', 'page_size': 1, 'category_slug': 'none'},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_json_body_is_parsed(self):
+        self.client.force_authenticate(self.brand_manager)
+        response = self.client.patch(
+            reverse('product-detail', kwargs={'slug': self.product.slug}),
+            '{"stock": 7, "category": %d}' % self.product.category_id, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['product']['stock'], 7)
+        invalid = self.client.patch(
+            reverse('product-detail', kwargs={'slug': self.product.slug}), '{bad', content_type='application/json',
+        )
+        self.assertEqual(invalid.status_code, 400)
+
+
+calls = []
+
+
+@background(max_attempts=2)
+def record_call(fail=False):
+    calls.append(fail)
+    if fail:
+        raise RuntimeError('boom')
+
+
+class BackgroundTaskTests(EcoShopFixtures, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def test_image_deletion_runs_in_the_worker(self):
+        Product.objects.filter(pk=self.product.pk).update(image='products/old.jpg')
+        self.client.force_authenticate(self.brand_manager)
+        response = self.client.delete(reverse('product-remove-image', kwargs={'slug': self.product.slug}))
+        self.assertEqual(response.status_code, 200)
+
+        task = Task.objects.get()
+        self.assertEqual((task.name, task.args), ('products.tasks.delete_image_file', ['products.Product', 'image', 'products/old.jpg']))
+
+        out = StringIO()
+        with mock.patch.object(Product._meta.get_field('image').storage, 'delete') as delete:
+            call_command('run_worker', '--once', stdout=out)
+        delete.assert_called_once_with('products/old.jpg')
+        self.assertIn('Tasks: 1 done', out.getvalue())
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_are_retried_with_backoff(self):
+        record_call.delay(fail=True)
+        self.assertEqual(run_pending(), {'retry': 1})
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts, task.last_error), ('queued', 1, 'RuntimeError: boom'))
+        self.assertGreater(task.run_at, timezone.now() + timedelta(seconds=5))
+
+        # Not due yet; then the last attempt fails for good
+        self.assertEqual(run_pending(), {})
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), {'failed': 1})
+        self.assertEqual(Task.objects.get().status, 'failed')
+        self.assertEqual(calls, [True, True])
+
+    def test_expired_lease_is_taken_over(self):
+        record_call.delay()
+        [task] = claim_tasks('dead-worker')
+        self.assertEqual(claim_tasks('other-worker'), [])
+
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        [taken] = claim_tasks('other-worker')
+        self.assertEqual(taken.attempts, 2)
+        # The first worker's late result is rolled back
+        self.assertEqual(run_task(task, 'dead-worker'), 'lost')
+        self.assertEqual(run_task(taken, 'other-worker'), 'done')
+        self.assertEqual(calls, [False, False])
+        self.assertFalse(Task.objects.exists())
+
+    def test_unknown_task_fails_without_retry(self):
+        Task.objects.create(name='products.tasks.missing')
+        self.assertEqual(run_pending(), {'failed': 1})
+        self.assertEqual(Task.objects.get().last_error, 'UnknownTask: Unknown task products.tasks.missing')
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_tasks_run_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(record_call.delay())
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [False])
+        self.assertFalse(Task.objects.exists())
@@ -22,16 +22,23 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 
 from .models import Category, Product
-from .serializers import CategorySerializer, CategoryListSerializer, CategoryImageSerializer, ProductSerializer, ProductListSerializer, ProductCreateSerializer, ProductImageFieldSerializer
-from .services import CategoryService, ProductService, BusinessException
+from .serializers import CategorySerializer, CategoryListSerializer, CategoryImageSerializer, ProductSerializer, ProductListSerializer, ProductCreateSerializer, ProductImageFieldSerializer, product_list_lean, product_detail_lean
+from .services import CategoryService, ProductService, BusinessException, category_cache, product_cache, invalidate_catalog
 from .constants import *
 from .filters import ProductFilter
+from .snapshot import catalog_snapshots
+from .tasks import discard_image
 from rest_framework.exceptions import ValidationError
+from core.cache import request_key
+from core.conditional import conditional
+from core.renderers import FastJSONParser
+from core.sparse import sparse_fields, sparse_only
+from core.query_budget import query_budget
 
 
 import logging
@@ -47,7 +54,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    parser_classes = [MultiPartParser, FormParser, FastJSONParser]
     
     # Configure filtering and searching
     filterset_fields = ['slug']
@@ -68,6 +75,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def _catalog_validators(self, request, *args, **kwargs):
+        """Every category write bumps the category cache version"""
+        return f'categories:{category_cache.version()}', None
+    
+    @conditional(_catalog_validators)
+    def list(self, request, *args, **kwargs):
+        """Public and identical for every user: served from the category cache"""
+        data = category_cache.get_or_set(
+            request_key(request), lambda: super(CategoryViewSet, self).list(request, *args, **kwargs).data
+        )
+        return Response(data)
+    
     def get_serializer_class(self):
         """Use different serializer for list action"""
         if self.action == 'upload_image':
@@ -97,6 +116,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
         self.check_object_permissions(self.request, obj)
         return obj
     
+    @conditional(_catalog_validators)
+    def retrieve(self, request, *args, **kwargs):
+        """Category detail; 304 while no category has changed"""
+        return super().retrieve(request, *args, **kwargs)
+    
     def destroy(self, request, *args, **kwargs):
         """Delete a category"""
         category = self.get_object()
@@ -186,7 +210,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    parser_classes = [MultiPartParser, FormParser, FastJSONParser]
     
     # Configure filtering and searching
     filterset_class = ProductFilter
@@ -217,11 +241,42 @@ class ProductViewSet(viewsets.ModelViewSet):
                     queryset = queryset.filter(brand=self.request.user.userprofile.brandprofile)
         
         # Optimize queries - remove prefetch_related('images') as we now have single image
-        if self.action == 'list':
+        if self.action in ['list', 'my_products', 'retrieve']:
             queryset = queryset.select_related('category', 'brand')
         
+        # ?fields= / ?omit=: load only the columns the detail renders
+        if self.action == 'retrieve':
+            queryset = sparse_only(queryset, ProductSerializer, self.request)
+        
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Cached unless it's a brand owner's own listing (?my_products=true)"""
+        if request.user.is_authenticated and request.query_params.get('my_products') == 'true':
+            return self._lean_response(self.filter_queryset(self.get_queryset()), product_list_lean)
+        
+        data = product_cache.get_or_set(request_key(request), lambda: self._list_data(request, *args, **kwargs))
+        return Response(data)
+    
+    def _list_data(self, request, *args, **kwargs):
+        """Serve from the shared catalog snapshot when it can answer the query"""
+        snapshot = catalog_snapshots.current()
+        records = snapshot.query(request) if snapshot is not None else None
+        if records is None:
+            return self._lean_response(self.filter_queryset(self.get_queryset()), product_list_lean).data
+        
+        page = self.paginate_queryset(records)
+        fields = sparse_fields(request, ProductListSerializer.Meta.fields)
+        return self.get_paginated_response([record.to_representation(request, fields) for record in page]).data
+    
+    def _lean_response(self, queryset, lean):
+        """Paginated read-only output from .values() rows (same data as lean.serializer_class)"""
+        rows = lean.values(queryset, self.request)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(lean.to_representation(page, self.request))
+        return Response(lean.to_representation(rows, self.request))
+    
     def get_serializer_class(self):
         """Use different serializer based on action"""
         if self.action == 'create':
@@ -253,6 +308,18 @@ class ProductViewSet(viewsets.ModelViewSet):
         self.check_object_permissions(self.request, obj)
         return obj
     
+    def _detail_validators(self, request, slug=None):
+        """updated_at of the row retrieve would return (one indexed lookup), plus category names"""
+        row = self.filter_queryset(self.get_queryset()).filter(slug=slug).values_list('id', 'updated_at').first()
+        if row is None:
+            return None
+        return f'product:{row[0]}:{row[1].timestamp()}:{category_cache.version()}', row[1]
+    
+    @conditional(_detail_validators)
+    def retrieve(self, request, *args, **kwargs):
+        """Product detail; 304 while the product (and category names) are unchanged"""
+        return super().retrieve(request, *args, **kwargs)
+    
     def create(self, request, *args, **kwargs):
         """Create a new product"""
         serializer = self.get_serializer(data=request.data)
@@ -360,6 +427,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
     
     @action(detail=False, methods=['get'], url_path='my-products')
+    @query_budget(6)
     def my_products(self, request):
         """
         Get products belonging to the authenticated user's brand
@@ -376,20 +444,22 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Apply filtering
         products = self.filter_queryset(products)
         
-        page = self.paginate_queryset(products)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        # Same output as ProductSerializer (this action's serializer)
+        return self._lean_response(products, product_detail_lean)
     
     @action(detail=True, methods=['get'], url_path='similar')
+    @query_budget(5)
     def similar_products(self, request, slug=None):
         """
         Get similar products based on category and characteristics
         GET /api/products/{slug}/similar/
         """
+        snapshot = catalog_snapshots.current()
+        similar = snapshot.similar(slug) if snapshot is not None else None
+        if similar is not None:
+            fields = sparse_fields(request, ProductListSerializer.Meta.fields)
+            return Response([record.to_representation(request, fields) for record in similar])
+        
         product = self.get_object()
         
         # Find similar products (same category, similar characteristics)
@@ -401,15 +471,10 @@ class ProductViewSet(viewsets.ModelViewSet):
         ).filter(
             Q(base_type=product.base_type) |
             Q(packaging_material=product.packaging_material)
-        ).select_related('category', 'brand')[:8]  # Removed prefetch_related('images')
-        
-        serializer = ProductListSerializer(
-            similar_products, 
-            many=True,
-            context={'request': request}
-        )
+        )[:8]
         
-        return Response(serializer.data)
+        rows = product_list_lean.values(similar_products, request)
+        return Response(product_list_lean.to_representation(rows, request))
     
     @action(detail=True, methods=['delete'], url_path='remove-image')
     def remove_image(self, request, slug=None):
@@ -434,10 +499,11 @@ class ProductViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Eliminar la imagen
-            product.image.delete(save=False)
+            # Eliminar la imagen (in the background)
+            discard_image(product.image)
             product.image = None
             product.save()
+            invalidate_catalog()
             
             return Response(
                 {'detail': SUCCESS_PRODUCT_IMAGE_REMOVED},
@@ -479,12 +545,12 @@ class ProductViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             # Actualizar solo la imagen
             if 'image' in serializer.validated_data:
-                # Borrar imagen anterior si existe
-                if product.image:
-                    product.image.delete(save=False)
+                # Borrar imagen anterior si existe (in the background)
+                discard_image(product.image)
                 
                 product.image = serializer.validated_data['image']
                 product.save()
+                invalidate_catalog()
             
             return Response(
                 {
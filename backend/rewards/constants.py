@@ -42,6 +42,10 @@ POINTS_FOR_LOGIN_STREAK = 100
 MAX_POINTS_PER_TRANSACTION = 10000
 MAX_CARBON_SAVED_PER_TRANSACTION = 100.0
 
+# Purchase points of paid orders, awarded in batches (rewards.tasks)
+PURCHASE_POINTS_BATCH_SIZE = 500
+PURCHASE_POINTS_BATCH_DELAY = 5  # seconds: payments made meanwhile join the same run
+
 # Error messages
 ERROR_INSUFFICIENT_POINTS = "Insufficient eco points for this reward"
 ERROR_REWARD_NOT_ACTIVE = "This reward is no longer available"
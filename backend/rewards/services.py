@@ -7,13 +7,23 @@ Created: 2025-12-01
 """
 
 from django.db import transaction, models
+from django.db.models import Case, F, Value, When
 from accounts.models import UserProfile
 from django.utils import timezone
 from .models import EcoTransaction, EcoReward
 from orders.models import Order
 from .constants import *
 from datetime import timedelta
+from core import metrics
+from core.cache import Namespace
 
+# Version of the public reward catalog (ETag of PublicRewardsView)
+reward_cache = Namespace('rewards')
+
+
+def invalidate_rewards():
+    """Bump the reward catalog version once the current transaction commits"""
+    transaction.on_commit(reward_cache.invalidate)
 
 
 class BusinessException(Exception):
@@ -62,7 +72,8 @@ class PointsService:
                 raise BusinessException("Order ID required for purchase action")
             
             try:
-                order = Order.objects.get(id=order_id, user=user)
+                # Locked: serializes with award_purchase_points_batch
+                order = Order.objects.select_for_update().get(id=order_id, user=user)
                 
                 # Check if points already awarded for this order
                 if EcoTransaction.objects.filter(user=user, order=order, action_type=ACTION_PURCHASE).exists():
@@ -108,13 +119,91 @@ class PointsService:
         user_profile.total_carbon_saved += carbon_saved
         user_profile.save()
         
+        # Count only once the transaction is committed
+        def record_metrics():
+            metrics.inc('points_awarded_total', points, action_type=action_type)
+            metrics.inc('eco_transactions_total', action_type=action_type)
+        transaction.on_commit(record_metrics)
+        
         return eco_transaction
     
+    @transaction.atomic
+    def award_purchase_points_batch(self, batch_size=PURCHASE_POINTS_BATCH_SIZE):
+        """
+        Purchase points for up to batch_size paid orders waiting for them
+        (Order.points_pending, set by PaymentService.update_payment_status):
+        one bulk_create of EcoTransaction rows and one UPDATE of every
+        affected profile. Orders already awarded through earn_points, or over
+        the per-transaction limits, are only unflagged. Concurrent runs skip
+        each other's orders. Returns the number of orders handled.
+        """
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(points_pending=True)
+            .only('id', 'user_id', 'total_amount', 'total_carbon_footprint')
+            .order_by('pk')[:batch_size]
+        )
+        if not orders:
+            return 0
+        
+        awarded = set(
+            EcoTransaction.objects.filter(order__in=orders, action_type=ACTION_PURCHASE)
+            .order_by().values_list('order_id', flat=True)
+        )
+        transactions = []
+        for order in orders:
+            if order.pk in awarded:
+                continue
+            points, carbon_saved = self._calculate_purchase_points(order)
+            if points > MAX_POINTS_PER_TRANSACTION or carbon_saved > MAX_CARBON_SAVED_PER_TRANSACTION:
+                continue
+            transactions.append(EcoTransaction(
+                user_id=order.user_id,
+                order_id=order.pk,
+                points_earned=points,
+                action_type=ACTION_PURCHASE,
+                carbon_saved=carbon_saved,
+            ))
+        
+        EcoTransaction.objects.bulk_create(transactions)
+        self._add_to_profiles(transactions)
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(points_pending=False)
+        
+        points = sum(eco_transaction.points_earned for eco_transaction in transactions)
+        def record_metrics():
+            metrics.inc('points_awarded_total', points, action_type=ACTION_PURCHASE)
+            metrics.inc('eco_transactions_total', len(transactions), action_type=ACTION_PURCHASE)
+        transaction.on_commit(record_metrics)
+        
+        return len(orders)
+    
+    def _add_to_profiles(self, transactions):
+        """Add the transactions' points and carbon to their users' profiles, in one UPDATE"""
+        totals = {}
+        for eco_transaction in transactions:
+            points, carbon_saved = totals.get(eco_transaction.user_id, (0, 0.0))
+            totals[eco_transaction.user_id] = (points + eco_transaction.points_earned, carbon_saved + eco_transaction.carbon_saved)
+        if not totals:
+            return
+        
+        # Users without a profile get one (like earn_points' get_or_create)
+        UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in totals], ignore_conflicts=True)
+        UserProfile.objects.filter(user_id__in=totals).update(
+            eco_points=F('eco_points') + Case(
+                *[When(user_id=user_id, then=Value(points)) for user_id, (points, _) in totals.items()],
+                output_field=models.IntegerField(),
+            ),
+            total_carbon_saved=F('total_carbon_saved') + Case(
+                *[When(user_id=user_id, then=Value(carbon_saved)) for user_id, (_, carbon_saved) in totals.items()],
+                output_field=models.FloatField(),
+            ),
+        )
+    
     def get_user_transactions(self, user, limit=50):
         """
         Get user's eco transactions
         """
-        return EcoTransaction.objects.filter(user=user).order_by('-created_at')[:limit]
+        return EcoTransaction.objects.filter(user=user).select_related('user', 'order').order_by('-created_at')[:limit]
     
     def get_user_points_summary(self, user):
         """
@@ -220,6 +309,7 @@ class RewardsService:
         ASSUMES data already validated by serializer
         """
         reward = EcoReward.objects.create(**reward_data)
+        invalidate_rewards()
         return reward
     
     @transaction.atomic
@@ -236,6 +326,7 @@ class RewardsService:
             setattr(reward, field, value)
         
         reward.save()
+        invalidate_rewards()
         return reward
     
     @transaction.atomic
@@ -250,6 +341,7 @@ class RewardsService:
         
         reward.is_active = False
         reward.save()
+        invalidate_rewards()
         
         return True
     
@@ -280,7 +372,7 @@ class AdminRewardsService:
         """
         Get points leaderboard
         """       
-        queryset = UserProfile.objects.all()
+        queryset = UserProfile.objects.select_related('user')
         
         if timeframe_days:
             date_from = timezone.now() - timedelta(days=timeframe_days)
@@ -0,0 +1,39 @@
+"""
+Description: Rewards background tasks (see core.tasks)
+
+Purchase points aren't written by the payment that earns them:
+PaymentService.update_payment_status flags the order and queues one
+award_purchase_points run (unless one is already waiting), a few seconds
+later. Each run awards one batch in its own short transaction (the task's)
+and queues the next run while flagged orders remain.
+
+File: tasks.py
+Author: Anthony Bañon
+Created: 2025-12-13
+"""
+
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core.tasks import background
+
+from orders.models import Order
+
+from .constants import PURCHASE_POINTS_BATCH_DELAY, PURCHASE_POINTS_BATCH_SIZE
+from .services import PointsService
+
+
+@background(unique=True)
+def award_purchase_points():
+    """One batch of the orders paid since the last run; the next batch is another run"""
+    if PointsService().award_purchase_points_batch(PURCHASE_POINTS_BATCH_SIZE) >= PURCHASE_POINTS_BATCH_SIZE:
+        award_purchase_points.delay()
+    elif Order.objects.filter(points_pending=True).exists():
+        # Orders locked by another run or an earn_points call: look again later
+        queue_purchase_points()
+
+
+def queue_purchase_points():
+    """Called in the transaction that marks an order paid (and flags it)"""
+    award_purchase_points.enqueue(run_at=timezone.now() + timedelta(seconds=PURCHASE_POINTS_BATCH_DELAY))
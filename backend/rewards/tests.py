@@ -1,3 +1,171 @@
-from django.test import TestCase
+"""
+Description: Query budget tests for points and rewards routes
 
-# Create your tests here.
+File: tests.py
+Author: Anthony Bañon
+Created: 2025-12-12
+"""
+
+from unittest import mock
+
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from core.models import Task
+from core.tasks import run_pending
+from core.testing import QueryBudgetTestCase
+from orders.models import Order, Payment
+from orders.services import PaymentService
+
+from .models import EcoTransaction
+from .services import PointsService
+
+
+class RewardsRouteBudgetTests(QueryBudgetTestCase):
+    app_label = 'rewards'
+    route_budgets = {
+        'points-list': {'get': 2},
+        'points-earn': {'post': 12},
+        'points-summary': {'get': 4},
+        'user-rewards-list': {'get': 3},
+        'user-rewards-claim': {'post': 10},
+        'public-rewards': {'get': 2},
+        'admin-rewards-list': {'get': 2},
+        'admin-rewards-create-reward': {'post': 6},
+        'admin-rewards-update-reward': {'put': 7},
+        'admin-rewards-delete-reward': {'delete': 7},
+        'admin-rewards-leaderboard': {'get': 2},
+        'admin-rewards-statistics': {'get': 4},
+    }
+
+    def test_routes_have_budgets(self):
+        self.assertRoutesHaveBudgets()
+
+    def test_points_list(self):
+        response = self.call_route('get', 'points-list', user=self.customer, status_code=200)
+        self.assertEqual(len(response.data), 5)
+
+    def test_points_earn(self):
+        self.call_route('post', 'points-earn', data={'action_type': 'review'}, user=self.customer, status_code=200)
+
+    def test_points_earn_purchase(self):
+        self.call_route(
+            'post', 'points-earn', data={'action_type': 'purchase', 'order_id': self.orders[2].pk},
+            user=self.customer, status_code=200,
+        )
+
+    def test_points_summary(self):
+        self.call_route('get', 'points-summary', user=self.customer, status_code=200)
+
+    def test_rewards_list(self):
+        self.call_route('get', 'user-rewards-list', user=self.customer, status_code=200)
+
+    def test_rewards_claim(self):
+        self.call_route(
+            'post', 'user-rewards-claim', data={'reward_id': self.rewards[0].pk}, user=self.customer, status_code=200
+        )
+
+    def test_public_rewards(self):
+        self.call_route('get', 'public-rewards', status_code=200)
+
+    def test_public_rewards_not_modified_until_a_reward_changes(self):
+        response = self.call_route('get', 'public-rewards', status_code=200)
+        cached = self.client.get(reverse('public-rewards'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.call_route(
+                'put', 'admin-rewards-update-reward', query={'reward_id': self.rewards[0].pk},
+                data={'points_required': 150}, user=self.admin, status_code=200,
+            )
+        self.client.credentials()
+        changed = self.client.get(reverse('public-rewards'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['results'][0]['points_required'], 150)
+
+    def test_admin_rewards_list(self):
+        self.call_route('get', 'admin-rewards-list', user=self.admin, status_code=200)
+
+    def test_admin_create_reward(self):
+        data = {'name': 'Tree', 'description': 'Plant a tree', 'points_required': 300, 'reward_type': 'donation'}
+        self.call_route('post', 'admin-rewards-create-reward', data=data, user=self.admin, status_code=201)
+
+    def test_admin_update_reward(self):
+        self.call_route(
+            'put', 'admin-rewards-update-reward', query={'reward_id': self.rewards[0].pk},
+            data={'points_required': 150}, user=self.admin, status_code=200,
+        )
+
+    def test_admin_delete_reward(self):
+        self.call_route(
+            'delete', 'admin-rewards-delete-reward', query={'reward_id': self.rewards[0].pk},
+            user=self.admin, status_code=200,
+        )
+
+    def test_admin_leaderboard(self):
+        response = self.call_route('get', 'admin-rewards-leaderboard', user=self.admin, status_code=200)
+        self.assertEqual(response.data['data']['total_users'], 3)
+
+    def test_admin_statistics(self):
+        self.call_route('get', 'admin-rewards-statistics', user=self.admin, status_code=200)
+
+
+class PurchasePointsTests(QueryBudgetTestCase):
+
+    def pay(self, order):
+        Payment.objects.get_or_create(order=order, defaults={'payment_method': 'stripe', 'amount': order.total_amount})
+        PaymentService().update_payment_status(order, f'txn_{order.pk}', 'paid')
+
+    def test_paid_orders_are_awarded_in_one_task(self):
+        orders = [self.orders[2], self.create_order(self.admin, 10), self.create_order(self.admin, 11)]
+        points_before = dict(UserProfile.objects.values_list('user_id', 'eco_points'))
+        for order in orders:
+            self.pay(order)
+        self.assertEqual(Task.objects.filter(name='rewards.tasks.award_purchase_points').count(), 1)
+        self.assertEqual(Order.objects.filter(points_pending=True).count(), 3)
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), {'done': 1})
+
+        earned = {}
+        for transaction in EcoTransaction.objects.filter(action_type='purchase'):
+            earned[transaction.user_id] = earned.get(transaction.user_id, 0) + transaction.points_earned
+        self.assertEqual(EcoTransaction.objects.filter(action_type='purchase', order__in=orders).count(), 3)
+        for user in (self.customer, self.admin):
+            self.assertEqual(UserProfile.objects.get(user=user).eco_points, points_before[user.pk] + earned[user.pk])
+        self.assertFalse(Order.objects.filter(points_pending=True).exists())
+
+        # Already awarded: the explicit claim is refused
+        self.login(self.customer)
+        response = self.client.post(reverse('points-earn'), {'action_type': 'purchase', 'order_id': orders[0].pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_queries_do_not_grow_with_orders(self):
+        def award(count):
+            orders = [self.create_order(self.admin, 100 * count + number) for number in range(count)]
+            Order.objects.filter(pk__in=[order.pk for order in orders]).update(points_pending=True)
+            # orders, already awarded, insert, profiles (create missing, update), unflag + savepoint/release
+            with self.assertNumQueries(8):
+                self.assertEqual(PointsService().award_purchase_points_batch(), count)
+
+        award(2)
+        award(10)
+
+    def test_claimed_orders_are_only_unflagged(self):
+        order = self.orders[2]
+        self.pay(order)
+        PointsService().earn_points(self.customer, 'purchase', order_id=order.pk)
+        self.assertEqual(PointsService().award_purchase_points_batch(), 1)
+        self.assertEqual(EcoTransaction.objects.filter(order=order, action_type='purchase').count(), 1)
+
+    def test_each_batch_is_its_own_task(self):
+        orders = [self.orders[2], self.create_order(self.admin, 10), self.create_order(self.admin, 11)]
+        for order in orders:
+            self.pay(order)
+        Task.objects.update(run_at=timezone.now())
+
+        with mock.patch('rewards.tasks.PURCHASE_POINTS_BATCH_SIZE', 2):
+            self.assertEqual(run_pending(), {'done': 2})
+        self.assertEqual(EcoTransaction.objects.filter(action_type='purchase', order__in=orders).count(), 3)
+        self.assertFalse(Task.objects.exists())
@@ -16,8 +16,10 @@ from django.db import transaction
 
 from .models import EcoTransaction, EcoReward
 from .serializers import *
-from .services import PointsService, RewardsService, AdminRewardsService, BusinessException
+from .services import PointsService, RewardsService, AdminRewardsService, BusinessException, reward_cache
 from .constants import *
+from core.conditional import conditional
+from core.query_budget import query_budget
 
 
 ##### User Points Views (ViewSet for user points operations) #####
@@ -35,6 +37,7 @@ class PointsViewSet(viewsets.ViewSet):
             return EcoTransaction.objects.none()
         return EcoTransaction.objects.all()
     
+    @query_budget(1)
     def list(self, request):
         """✅ Get user's eco transactions"""
         points_service = self._get_points_service()
@@ -83,7 +86,7 @@ class PointsViewSet(viewsets.ViewSet):
             
             return Response({
                 'message': 'Points summary retrieved successfully',
-                'data': summary
+                'data': UserPointsSummarySerializer(summary).data
             })
             
         except BusinessException as e:
@@ -269,4 +272,13 @@ class PublicRewardsView(generics.ListAPIView):
     serializer_class = EcoRewardSerializer
     
     def get_queryset(self):
-        return EcoReward.objects.filter(is_active=True).order_by('points_required')
\ No newline at end of file
+        return EcoReward.objects.filter(is_active=True).order_by('points_required')
+    
+    def _rewards_validators(self, request, *args, **kwargs):
+        """Every reward write bumps the reward catalog version"""
+        return f'rewards:{reward_cache.version()}', None
+    
+    @conditional(_rewards_validators)
+    def list(self, request, *args, **kwargs):
+        """✅ Active rewards; 304 while no reward has changed"""
+        return super().list(request, *args, **kwargs)
\ No newline at end of file
@@ -15,6 +15,8 @@ ecoshop_path = Path(__file__).parent.parent / "backend" / "ecoshop-data"
 sys.path.append(str(ecoshop_path))
 
 from data_module.impact_calculator import ImpactCalculator
+from data_source import get_source
+from explorer_index import ExplorerIndex, ORDENES
 
 # Paleta de colores EcoShop
 ECOSHOP_COLORS = {
@@ -84,10 +86,28 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
-@st.cache_data
-def load_data():
-    csv_path = Path(__file__).parent.parent / "backend" / "ecoshop-data" / "data" / "products_with_impact.csv"
-    return pd.read_csv(csv_path)
+# Componentes de huella: solo existen en el CSV calculado, no en la base de datos
+HUELLA_COMPONENTES = ['huella_materiales', 'huella_transporte', 'huella_manufactura']
+
+
+@st.cache_resource
+def load_source():
+    """Una sola fuente por proceso: guarda el DataFrame y el estado del refresco"""
+    return get_source()
+
+
+def load_data(force=False):
+    return load_source().refresh(force=force)
+
+
+# Opciones de filas por página en el explorador
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+@st.cache_resource(max_entries=2)
+def get_explorer_index(_df, version):
+    """Índices del explorador, reconstruidos solo cuando cambia la versión de los datos"""
+    return ExplorerIndex(_df)
 
 
 def create_gauge(value, title):
@@ -128,7 +148,7 @@ def style_plotly_chart(fig):
 
 # Cargar datos
 try:
-    df = load_data()
+    df = load_data(force=st.session_state.pop("force_refresh", False))
 except Exception as e:
     st.error(f" Error: {e}")
     st.info(" Ejecutar: `python backend/ecoshop-data/data_module/impact_calculator.py`")
@@ -150,6 +170,14 @@ st.sidebar.metric("Total Productos", len(df))
 st.sidebar.metric("Huella Promedio", f"{df['huella_total'].mean():.3f} kg CO2e")
 if 'recyclable_packaging' in df.columns:
     st.sidebar.metric("% Reciclable", f"{df['recyclable_packaging'].sum()/len(df)*100:.1f}%")
+if 'huella_pedidos' in df.columns:
+    st.sidebar.metric("Huella en Pedidos", f"{df['huella_pedidos'].sum():.1f} kg CO2e")
+
+if load_source().name == "django":
+    st.sidebar.markdown("---")
+    if st.sidebar.button("🔄 Actualizar datos"):
+        st.session_state["force_refresh"] = True
+        st.rerun()
 
 
 # PÁGINA: INICIO
@@ -209,13 +237,16 @@ elif page == "📊 Análisis":
         col1, col2 = st.columns(2)
         
         with col1:
-            componentes = df[['huella_materiales', 'huella_transporte', 'huella_manufactura']].mean()
-            fig = px.pie(values=componentes.values,
-                        names=['Materiales', 'Transporte', 'Manufactura'],
-                        title="Composición Promedio",
-                        color_discrete_sequence=ECOSHOP_PALETTE)
-            fig = style_plotly_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            if set(HUELLA_COMPONENTES) <= set(df.columns):
+                componentes = df[HUELLA_COMPONENTES].mean()
+                fig = px.pie(values=componentes.values,
+                            names=['Materiales', 'Transporte', 'Manufactura'],
+                            title="Composición Promedio",
+                            color_discrete_sequence=ECOSHOP_PALETTE)
+                fig = style_plotly_chart(fig)
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("El desglose de huella solo está disponible con la fuente CSV.")
         
         with col2:
             st.plotly_chart(create_gauge(df['huella_total'].mean(), "Huella Promedio (kg CO2e)"),
@@ -280,16 +311,18 @@ elif page == "🔍 Explorador de Productos":
     
     st.markdown(f"**Total de productos disponibles: {len(df)}**")
     
+    indice = get_explorer_index(df, load_source().version)
+    
     # Filtros
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        categorias = ['Todas'] + sorted(df['category'].unique().tolist())
+        categorias = ['Todas'] + indice.categories
         categoria_sel = st.selectbox("Categoría", categorias, key="cat_filter")
     
     with col2:
-        precio_min = float(df['money'].min())
-        precio_max = float(df['money'].max())
+        precio_min = indice.min_price
+        precio_max = indice.max_price
         precio_sel = st.slider("Precio máximo (USD)", 
                               precio_min, 
                               precio_max, 
@@ -297,52 +330,53 @@ elif page == "🔍 Explorador de Productos":
                               key="price_filter")
     
     with col3:
-        if 'recyclable_packaging' in df.columns:
+        if indice.recyclable is not None:
             solo_reciclable = st.checkbox("Solo reciclables", value=False, key="recycle_filter")  # ← Por defecto False
         else:
             solo_reciclable = False
     
-    # Filtrar
-    df_filtered = df.copy()
-    
-    if categoria_sel != 'Todas':
-        df_filtered = df_filtered[df_filtered['category'] == categoria_sel]
-    
-    df_filtered = df_filtered[df_filtered['money'] <= precio_max]
-    
-    if solo_reciclable and 'recyclable_packaging' in df.columns:
-        df_filtered = df_filtered[df_filtered['recyclable_packaging'] == True]
+    # Filtrar (máscara vectorizada sobre los índices precalculados)
+    mask = indice.filter(
+        category=None if categoria_sel == 'Todas' else categoria_sel,
+        max_price=precio_sel,
+        only_recyclable=solo_reciclable
+    )
     
     # Orden
-    orden = st.radio("Ordenar por:", 
-                    ["Menor huella", "Mayor huella", "Menor precio", "Mayor precio"],
-                    horizontal=True)
-    
-    if orden == "Menor huella":
-        df_filtered = df_filtered.sort_values('huella_total')
-    elif orden == "Mayor huella":
-        df_filtered = df_filtered.sort_values('huella_total', ascending=False)
-    elif orden == "Menor precio":
-        df_filtered = df_filtered.sort_values('money')
-    else:
-        df_filtered = df_filtered.sort_values('money', ascending=False)
+    orden = st.radio("Ordenar por:", ORDENES, horizontal=True)
+    filas = indice.sorted_rows(mask, orden)
     
-    st.markdown(f"**Mostrando: {len(df_filtered)} productos**")
+    st.markdown(f"**Mostrando: {len(filas)} productos**")
     
-    if len(df_filtered) == 0:
+    if len(filas) == 0:
         st.warning("⚠️ No hay productos que cumplan los filtros seleccionados.")
     else:
+        # Paginación: solo se envía la página actual al navegador
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            page_size = st.selectbox("Filas por página", PAGE_SIZES, key="page_size")
+        total_paginas = max(1, -(-len(filas) // page_size))
+        if st.session_state.get("page_number", 1) > total_paginas:
+            st.session_state["page_number"] = total_paginas
+        with col2:
+            pagina = st.number_input("Página", min_value=1, max_value=total_paginas,
+                                     step=1, key="page_number")
+        
+        df_pagina = indice.page(filas, pagina, page_size)
+        inicio = (pagina - 1) * page_size
+        st.caption(f"Filas {inicio + 1}–{inicio + len(df_pagina)} de {len(filas)} · Página {pagina} de {total_paginas}")
+        
         st.dataframe(
-            df_filtered[['product', 'brand', 'category', 'money', 'huella_total', 'eco_badge']],
+            df_pagina[['product', 'brand', 'category', 'money', 'huella_total', 'eco_badge']],
             use_container_width=True
         )
         
         st.markdown("---")
         st.subheader("📋 Detalle de Producto")
         
-        producto_sel = st.selectbox("Seleccionar:", df_filtered['product'].tolist())
+        producto_sel = st.selectbox("Seleccionar:", df_pagina['product'].tolist())
         
-        prod = df_filtered[df_filtered['product'] == producto_sel].iloc[0]
+        prod = df_pagina[df_pagina['product'] == producto_sel].iloc[0]
         
         col1, col2, col3 = st.columns(3)
         
@@ -362,24 +396,26 @@ elif page == "🔍 Explorador de Productos":
             if 'packaging_material' in prod:
                 st.metric("📦 Packaging", prod['packaging_material'].replace('_', ' ').title())
             if 'recyclable_packaging' in prod:
-                st.metric("♻️ Reciclable", "Sí" if prod['recyclable_packaging'] else "No")
+                reciclable = prod['recyclable_packaging']
+                st.metric("♻️ Reciclable", "Desconocido" if pd.isna(reciclable) else "Sí" if reciclable else "No")
             if 'ingredient_main' in prod:
                 st.metric("🧪 Ingrediente", prod['ingredient_main'])
         
-        st.markdown("---")
-        st.subheader("📊 Desglose de Huella")
-        
-        fig = go.Figure(data=[
-            go.Bar(name='Materiales', x=['Materiales'], y=[prod['huella_materiales']], 
-                  marker_color=ECOSHOP_COLORS['green']),
-            go.Bar(name='Transporte', x=['Transporte'], y=[prod['huella_transporte']], 
-                  marker_color=ECOSHOP_COLORS['cream']),
-            go.Bar(name='Manufactura', x=['Manufactura'], y=[prod['huella_manufactura']], 
-                  marker_color=ECOSHOP_COLORS['green_light'])
-        ])
-        fig.update_layout(yaxis_title="kg CO2e", showlegend=True, title="Desglose de Huella de Carbono")
-        fig = style_plotly_chart(fig)
-        st.plotly_chart(fig, use_container_width=True)
+        if set(HUELLA_COMPONENTES) <= set(prod.index):
+            st.markdown("---")
+            st.subheader("📊 Desglose de Huella")
+            
+            fig = go.Figure(data=[
+                go.Bar(name='Materiales', x=['Materiales'], y=[prod['huella_materiales']], 
+                      marker_color=ECOSHOP_COLORS['green']),
+                go.Bar(name='Transporte', x=['Transporte'], y=[prod['huella_transporte']], 
+                      marker_color=ECOSHOP_COLORS['cream']),
+                go.Bar(name='Manufactura', x=['Manufactura'], y=[prod['huella_manufactura']], 
+                      marker_color=ECOSHOP_COLORS['green_light'])
+            ])
+            fig.update_layout(yaxis_title="kg CO2e", showlegend=True, title="Desglose de Huella de Carbono")
+            fig = style_plotly_chart(fig)
+            st.plotly_chart(fig, use_container_width=True)
 
 
 st.markdown("---")
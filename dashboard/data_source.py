@@ -0,0 +1,244 @@
+"""
+Fuentes de datos del Dashboard de EcoShop.
+
+- CSVProductSource: lee el CSV estático generado por ImpactCalculator.
+- DjangoProductSource: lee productos y huella de pedidos directamente de la
+  base de datos de Django, con consultas por bloques y refresco incremental
+  (`updated_at > last_seen`) para no recargar todo el catálogo cada vez.
+"""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+BACKEND_PATH = Path(__file__).parent.parent / "backend"
+CSV_PATH = BACKEND_PATH / "ecoshop-data" / "data" / "products_with_impact.csv"
+
+# Tamaño de bloque para las consultas (keyset pagination por pk)
+CHUNK_SIZE = int(os.getenv("DASHBOARD_CHUNK_SIZE", "5000"))
+
+# Segundos mínimos entre dos refrescos incrementales automáticos
+REFRESH_INTERVAL = int(os.getenv("DASHBOARD_REFRESH_SECONDS", "30"))
+
+# Columnas del modelo Product -> columnas que usa el dashboard (mismo esquema que el CSV)
+PRODUCT_COLUMNS = {
+    'id': 'id',
+    'name': 'product',
+    'category__name': 'category',
+    'brand__brand_name': 'brand',
+    'ingredient_main': 'ingredient_main',
+    'base_type': 'base_type',
+    'climatiq_category': 'category_climatiq',
+    'packaging_material': 'packaging_material',
+    'origin_country': 'origin_country',
+    'price': 'money',
+    'weight': 'weight',
+    'recyclable_packaging': 'recyclable_packaging',
+    'transportation_type': 'transportation_type',
+    'carbon_footprint': 'huella_total',
+    'eco_badge': 'eco_badge',
+}
+
+# Mapeo inverso al de load_results.py (BD -> etiquetas del CSV)
+BADGE_MAP = {
+    '🌱 low Impact': '🌱 Bajo impacto',
+    '🌿 medium Impact': '🌿 Medio impacto',
+    '🌳 high Impact': '🌳 Alto impacto',
+}
+
+
+class CSVProductSource:
+    """Fuente estática: el CSV con el impacto ya calculado"""
+
+    name = "csv"
+
+    def __init__(self, csv_path=CSV_PATH):
+        self.csv_path = csv_path
+        self.df = None
+        self.version = 0
+
+    def refresh(self, force=False):
+        if self.df is None or force:
+            self.df = pd.read_csv(self.csv_path)
+            self.version += 1
+        return self.df
+
+
+class DjangoProductSource:
+    """
+    Fuente en vivo: Product (activos) + totales de huella de OrderItem.
+
+    La primera carga recorre el catálogo en bloques de CHUNK_SIZE filas
+    pidiendo solo las columnas que usa el dashboard. Los refrescos
+    posteriores solo traen productos con updated_at >= last_seen y
+    pedidos con id > último id visto.
+    """
+
+    name = "django"
+
+    def __init__(self, chunk_size=CHUNK_SIZE, refresh_interval=REFRESH_INTERVAL):
+        self.chunk_size = chunk_size
+        self.refresh_interval = refresh_interval
+        self.df = None
+        self.version = 0
+        self.last_seen = None          # max(updated_at) ya cargado
+        self._ids_at_last_seen = set() # ids con updated_at == last_seen (ya cargados)
+        self.last_order_item_id = 0    # max(OrderItem.id) ya agregado
+        self.last_refresh = 0.0
+        self._order_totals = pd.DataFrame(columns=['huella_pedidos', 'unidades_vendidas'])
+        self._lock = threading.Lock()
+        self._setup_django()
+
+    @staticmethod
+    def _setup_django():
+        """Configura Django igual que load_results.py"""
+        if str(BACKEND_PATH) not in sys.path:
+            sys.path.append(str(BACKEND_PATH))
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+        import django
+        from django.apps import apps
+        if not apps.ready:
+            django.setup()
+
+    # ---------- Lectura por bloques ----------
+
+    def _fetch_products(self, **filters):
+        """Trae productos en bloques (pk > último pk) con columnas podadas"""
+        from products.models import Product
+
+        fields = list(PRODUCT_COLUMNS) + ['is_active', 'updated_at']
+        queryset = Product.objects.filter(**filters).order_by('pk').values_list(*fields)
+
+        frames = []
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk)[:self.chunk_size])
+            if not rows:
+                break
+            frames.append(pd.DataFrame.from_records(rows, columns=fields))
+            last_pk = rows[-1][0]
+            if len(rows) < self.chunk_size:
+                break
+
+        if not frames:
+            return pd.DataFrame(columns=fields)
+        return pd.concat(frames, ignore_index=True)
+
+    def _fetch_order_totals(self):
+        """Agrega huella y unidades de los OrderItem nuevos por producto"""
+        from django.db.models import F, FloatField, Max, Sum
+        from orders.models import OrderItem
+
+        queryset = OrderItem.objects.filter(id__gt=self.last_order_item_id)
+        max_id = queryset.aggregate(max_id=Max('id'))['max_id']
+        if max_id is None:
+            return
+
+        rows = (
+            queryset.filter(id__lte=max_id)
+            .values('product_id')
+            .annotate(
+                huella_pedidos=Sum(F('quantity') * F('carbon_footprint'), output_field=FloatField()),
+                unidades_vendidas=Sum('quantity'),
+            )
+        )
+        nuevos = pd.DataFrame.from_records(
+            list(rows), columns=['product_id', 'huella_pedidos', 'unidades_vendidas']
+        ).set_index('product_id')
+
+        self._order_totals = nuevos.add(self._order_totals, fill_value=0)
+        self.last_order_item_id = max_id
+
+    # ---------- Transformación ----------
+
+    @staticmethod
+    def _to_dashboard(raw):
+        """Renombra columnas y normaliza tipos al esquema del CSV"""
+        df = raw.rename(columns=PRODUCT_COLUMNS)
+        df['money'] = df['money'].astype(float)
+        df['huella_total'] = df['huella_total'].astype(float)
+        df['eco_badge'] = df['eco_badge'].map(BADGE_MAP).fillna(df['eco_badge'])
+        return df
+
+    def _attach_order_totals(self, df):
+        totals = self._order_totals.reindex(df['id'])
+        df['huella_pedidos'] = totals['huella_pedidos'].fillna(0.0).to_numpy()
+        df['unidades_vendidas'] = totals['unidades_vendidas'].fillna(0).astype(int).to_numpy()
+        return df
+
+    # ---------- Carga / refresco ----------
+
+    def _mark_seen(self, raw):
+        newest = raw['updated_at'].max()
+        ids = set(raw.loc[raw['updated_at'] == newest, 'id'])
+        if newest == self.last_seen:
+            ids |= self._ids_at_last_seen
+        self.last_seen = newest
+        self._ids_at_last_seen = ids
+
+    def _full_load(self):
+        raw = self._fetch_products(is_active=True)
+        if len(raw):
+            self._mark_seen(raw)
+        self._fetch_order_totals()
+        self.df = self._attach_order_totals(self._to_dashboard(raw))
+
+    def _incremental_load(self):
+        from products.models import Product
+
+        # >= para no perder filas con el mismo timestamp confirmadas más tarde
+        filters = {'updated_at__gte': self.last_seen} if self.last_seen is not None else {}
+        changed = self._fetch_products(**filters)
+        changed = changed[
+            (changed['updated_at'] != self.last_seen) | ~changed['id'].isin(self._ids_at_last_seen)
+        ]
+        previous_order_item_id = self.last_order_item_id
+        self._fetch_order_totals()
+
+        if len(changed):
+            self._mark_seen(changed)
+            changed = self._to_dashboard(changed)
+            # Upsert por id: reemplazar filas modificadas y quitar las desactivadas
+            keep = self.df[~self.df['id'].isin(changed['id'])]
+            added = changed[changed['is_active'].astype(bool)]
+            self.df = pd.concat([keep, added], ignore_index=True)
+
+        # Los borrados físicos no cambian updated_at: si el conteo no cuadra, recarga completa
+        if Product.objects.filter(is_active=True).count() != len(self.df):
+            self._full_load()
+            return True
+
+        if len(changed) or previous_order_item_id != self.last_order_item_id:
+            self.df = self._attach_order_totals(self.df)
+            return True
+        return False
+
+    def refresh(self, force=False):
+        """
+        Devuelve el DataFrame actualizado. Hace refresco incremental como
+        máximo cada `refresh_interval` segundos (o siempre con force=True).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.df is None:
+                self._full_load()
+                self.version += 1
+            elif force or now - self.last_refresh >= self.refresh_interval:
+                if self._incremental_load():
+                    self.version += 1
+            else:
+                return self.df
+            self.last_refresh = now
+            return self.df
+
+
+def get_source(kind=None):
+    """Crea la fuente configurada en DASHBOARD_DATA_SOURCE ('csv' o 'django')"""
+    kind = kind or os.getenv("DASHBOARD_DATA_SOURCE", "csv")
+    if kind == "django":
+        return DjangoProductSource()
+    return CSVProductSource()
@@ -0,0 +1,87 @@
+"""
+Índices precalculados para el Explorador de Productos.
+
+Se construyen una vez por versión de los datos y permiten filtrar y ordenar
+con operaciones vectorizadas de numpy (códigos de categoría, precios
+ordenados + searchsorted, órdenes precalculados) en lugar de máscaras
+encadenadas y sort_values sobre todo el DataFrame en cada interacción.
+"""
+
+import numpy as np
+import pandas as pd
+
+ORDENES = ["Menor huella", "Mayor huella", "Menor precio", "Mayor precio"]
+
+
+class ExplorerIndex:
+    """Índices por columna sobre un DataFrame de productos (solo lectura)"""
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.size = len(self.df)
+
+        # Categoría -> códigos enteros
+        categorias = pd.Categorical(self.df['category'])
+        self.categories = list(categorias.categories)
+        self.category_codes = categorias.codes
+
+        # Precio ordenado para resolver el slider con searchsorted
+        precios = self.df['money'].to_numpy(dtype=float)
+        self.price_order = np.argsort(precios, kind='stable')
+        self.sorted_prices = precios[self.price_order]
+        # argsort deja los NaN al final: solo los primeros son precios conocidos
+        self.known_prices = int(np.count_nonzero(~np.isnan(precios)))
+
+        if 'recyclable_packaging' in self.df.columns:
+            # Valor desconocido (NaN) = no reciclable: bool(NaN) sería True
+            self.recyclable = self.df['recyclable_packaging'].eq(True).to_numpy()
+        else:
+            self.recyclable = None
+
+        # Los órdenes descendentes ordenan por la clave negada: invertir el
+        # ascendente invertiría también los empates y pondría los NaN primero
+        huellas = self.df['huella_total'].to_numpy(dtype=float)
+        self.orders = {
+            "Menor huella": np.argsort(huellas, kind='stable'),
+            "Mayor huella": np.argsort(-huellas, kind='stable'),
+            "Menor precio": self.price_order,
+            "Mayor precio": np.argsort(-precios, kind='stable'),
+        }
+
+    @property
+    def min_price(self):
+        return float(self.sorted_prices[0]) if self.known_prices else 0.0
+
+    @property
+    def max_price(self):
+        return float(self.sorted_prices[self.known_prices - 1]) if self.known_prices else 0.0
+
+    def filter(self, category=None, max_price=None, only_recyclable=False):
+        """Devuelve una máscara booleana con las filas que cumplen los filtros"""
+        if max_price is None:
+            mask = np.ones(self.size, dtype=bool)
+        else:
+            mask = np.zeros(self.size, dtype=bool)
+            hasta = np.searchsorted(self.sorted_prices, max_price, side='right')
+            mask[self.price_order[:hasta]] = True
+
+        if category is not None:
+            if category not in self.categories:
+                return np.zeros(self.size, dtype=bool)
+            mask &= self.category_codes == self.categories.index(category)
+
+        if only_recyclable and self.recyclable is not None:
+            mask &= self.recyclable
+
+        return mask
+
+    def sorted_rows(self, mask, orden):
+        """Posiciones de las filas filtradas, en el orden pedido"""
+        order = self.orders[orden]
+        return order[mask[order]]
+
+    def page(self, rows, page, page_size, columns=None):
+        """Solo la página pedida: es lo único que se envía al navegador"""
+        inicio = (page - 1) * page_size
+        result = self.df.iloc[rows[inicio:inicio + page_size]]
+        return result[columns] if columns else result